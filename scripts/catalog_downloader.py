@@ -8,15 +8,38 @@ e-Stat データカタログダウンローダー
 
 import json
 import os
+import re
 import time
 import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
 from datetime import datetime
-from typing import ClassVar, Dict, List, Optional
+from typing import Any, BinaryIO, ClassVar, Dict, Iterable, Iterator, List, Optional, Tuple, Union
 
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pacsv
 import requests
 from dotenv import load_dotenv
-from pandas_estat import read_statslist, set_appid
+from requests.adapters import HTTPAdapter
+from urllib3.util import make_headers
+from urllib3.util.retry import Retry
+
+try:
+    from pandas_estat import read_statslist, set_appid
+except ImportError:  # pandas-estat未導入の環境ではdownload_stats_list_by_fieldのみ使用不可
+    read_statslist = set_appid = None
+
+try:
+    from lxml import etree as lxml_etree
+except ImportError:  # lxml未導入の環境では標準ライブラリのiterparseを使用
+    lxml_etree = None
+
+try:
+    import orjson
+except ImportError:  # orjson未導入の環境では標準ライブラリのjsonを使用
+    orjson = None
 
 
 class EStatCatalogDownloader:
@@ -42,6 +65,46 @@ class EStatCatalogDownloader:
         "99": "その他",
     }
 
+    # 統計名や機関名から分野を推定するためのキーワード
+    FIELD_KEYWORDS: ClassVar[Dict[str, List[str]]] = {
+        "01": ["人口", "世帯", "国勢調査", "住民基本台帳"],
+        "02": ["災害", "環境", "気象", "地震"],
+        "03": ["労働", "賃金", "雇用", "失業", "就業"],
+        "04": ["農業", "林業", "水産", "漁業", "畜産"],
+        "05": ["鉱業", "工業", "製造業", "生産"],
+        "06": ["商業", "サービス", "小売", "卸売"],
+        "07": ["企業", "家計", "経済", "GDP", "所得", "消費"],
+        "08": ["住宅", "土地", "建設", "不動産"],
+        "09": ["エネルギー", "電力", "ガス", "水道"],
+        "10": ["運輸", "交通", "観光", "旅行"],
+        "11": ["情報", "通信", "科学", "技術", "研究"],
+        "12": ["教育", "文化", "スポーツ", "生活", "学校"],
+        "13": ["行政", "財政", "税収", "予算"],
+        "14": ["司法", "安全", "犯罪", "警察", "消防"],
+    }
+
+    # 分野ごとのキーワード選択パターン(クラス定義時に一度だけ組み立てる)
+    # pyarrow文字列のstr.containsはコンパイル済みパターンを受け付けないpandasがあるため、
+    # 文字列のまま持ち、大文字小文字の区別は照合時にcase=Falseで無効にする
+    FIELD_PATTERNS: ClassVar[Dict[str, str]] = {
+        field_code: "|".join(map(re.escape, keywords))
+        for field_code, keywords in FIELD_KEYWORDS.items()
+    }
+
+    STATS_LIST_URL: ClassVar[str] = "https://api.e-stat.go.jp/rest/3.0/app/getStatsList"
+
+    # getStatsListの1リクエストあたりの最大取得件数(e-Stat APIの上限)
+    STATS_LIST_PAGE_SIZE: ClassVar[int] = 100000
+
+    # レスポンスをXMLパーサへ渡す際のチャンクサイズ(バイト)
+    STREAM_CHUNK_SIZE: ClassVar[int] = 64 * 1024
+
+    # Excelで文字化けしないようCSVの先頭に付与するBOM
+    CSV_BOM: ClassVar[bytes] = b"\xef\xbb\xbf"
+
+    # 分野別CSVを並行して書き出す際の最大スレッド数
+    MAX_WRITE_WORKERS: ClassVar[int] = 8
+
     def __init__(self, appid: Optional[str] = None) -> None:
         """
         初期化
@@ -57,9 +120,25 @@ class EStatCatalogDownloader:
                     "ESTAT_APPIDが設定されていません。.envファイルを確認してください。"
                 )
 
-        set_appid(appid)
+        if set_appid is not None:
+            set_appid(appid)
         self.appid = appid
 
+        # 接続を使い回し、429/5xxは指数バックオフで再試行するセッション
+        self.session = requests.Session()
+        retry = Retry(
+            total=5,
+            backoff_factor=1.0,
+            status_forcelist=(429, 500, 502, 503, 504),
+            respect_retry_after_header=True,
+        )
+        adapter = HTTPAdapter(max_retries=retry)
+        self.session.mount("https://", adapter)
+
+        # 圧縮転送を明示的に要求する(zstd・brotliはデコーダが導入されている場合のみ含まれる)
+        # 受信データはiter_contentで展開されながらXMLパーサへ渡される
+        self.session.headers.update(make_headers(accept_encoding=True))
+
         # 出力ディレクトリの作成
         self.output_dir = "estat_catalog"
         os.makedirs(self.output_dir, exist_ok=True)
@@ -75,6 +154,9 @@ class EStatCatalogDownloader:
         Returns:
             統計表リストのDataFrame
         """
+        if read_statslist is None:
+            raise ImportError("統計分野別の取得にはpandas-estatが必要です")
+
         field_name = self.MAJOR_FIELDS.get(field_code, "不明")
         print(f"統計分野 {field_code} ({field_name}) のデータを取得中...")
 
@@ -113,37 +195,35 @@ class EStatCatalogDownloader:
 
         try:
             # e-Stat APIを直接使用して統計表情報を取得
-            url = "https://api.e-stat.go.jp/rest/3.0/app/getStatsList"
-            params = {"appId": self.appid, "limit": limit}
-
-            response = requests.get(url, params=params)
-            response.raise_for_status()
-
-            # XMLレスポンスを解析
-            root = ET.fromstring(response.text)
-
-            # DATALIST_INF要素を探す
-            datalist_inf = root.find(".//DATALIST_INF")
-            if datalist_inf is None:
-                print("統計データが見つかりませんでした")
-                return pd.DataFrame()
+            # 1回のリクエストで取得できる件数を超える場合はページに分けて取得する
+            pages = [
+                pd.DataFrame(
+                    self._fetch_stats_list_page(
+                        {
+                            "appId": self.appid,
+                            "limit": min(self.STATS_LIST_PAGE_SIZE, limit - start + 1),
+                            "startPosition": start,
+                        }
+                    )
+                )
+                for start in range(1, limit + 1, self.STATS_LIST_PAGE_SIZE)
+            ]
 
-            # TABLE_INF要素からデータを抽出
-            table_infos = datalist_inf.findall("TABLE_INF")
-            if not table_infos:
+            # ページごとのDataFrameを結合
+            stats_list = pages[0] if len(pages) == 1 else pd.concat(pages, ignore_index=True)
+            if stats_list.empty:
                 print("統計表情報が見つかりませんでした")
                 return pd.DataFrame()
 
-            # データをリストに変換
-            stats_data = []
-            for table_inf in table_infos:
-                record = {}
-                for child in table_inf:
-                    record[child.tag] = child.text
-                stats_data.append(record)
+            # 機関名は種類が少ないためカテゴリ型で保持
+            if "GOV_ORG" in stats_list.columns:
+                stats_list["GOV_ORG"] = stats_list["GOV_ORG"].astype("category")
+
+            # 分類時に正規表現で検索するカラムはpyarrow文字列型にしてArrowの検索処理を使う
+            for col in ("STAT_NAME", "MAIN_CATEGORY"):
+                if col in stats_list.columns:
+                    stats_list[col] = stats_list[col].astype("string[pyarrow]")
 
-            # DataFrameに変換
-            stats_list = pd.DataFrame(stats_data)
             print(f"取得件数: {len(stats_list)}")
 
             # データ構造を確認
@@ -162,6 +242,112 @@ class EStatCatalogDownloader:
             print(f"エラー: {e}")
             return pd.DataFrame()
 
+    def _fetch_stats_list_page(self, params: Dict[str, object]) -> Dict[str, List[Optional[str]]]:
+        """
+        getStatsListの1ページ分を取得して統計表情報をカラムごとのリストで返す
+
+        Args:
+            params: リクエストパラメータ(startPosition・limitを含む)
+
+        Returns:
+            子要素のタグ名をキー、各統計表の値のリストを値とする辞書
+        """
+        response = self.session.get(self.STATS_LIST_URL, params=params, stream=True)
+        response.raise_for_status()
+
+        # 受信したチャンクを順次パーサに渡し、ダウンロードとXML解析を並行して進める
+        return self._read_table_info_columns(
+            response.iter_content(chunk_size=self.STREAM_CHUNK_SIZE)
+        )
+
+    @classmethod
+    def _read_table_info_columns(cls, chunks: Iterable[bytes]) -> Dict[str, List[Optional[str]]]:
+        """
+        XMLのチャンク列に含まれるTABLE_INF要素をカラムごとのリストに集約
+
+        行ごとの辞書を作らずに値を直接カラムへ追加する。途中で初めて現れた
+        タグや欠けているタグはNoneで埋め、全カラムの長さを揃える。
+        統計表ID(TABLE_INF要素のid属性)は"TABLE_INF"カラムに入れる。
+
+        Args:
+            chunks: getStatsListのXMLレスポンスを分割したバイト列
+
+        Returns:
+            子要素のタグ名(統計表IDは"TABLE_INF")をキー、各統計表の値のリストを値とする辞書
+        """
+        table_ids: List[Optional[str]] = []
+        columns: Dict[str, List[Optional[str]]] = {"TABLE_INF": table_ids}
+        row_count = 0
+
+        # 全カラムを同じ順序で持つレコードの子要素タグ列と、それに対応するカラムのリスト
+        # (e-Statのレスポンスはほぼ全件が同じ構成なので、一致する場合は位置で追加する)
+        schema_tags: Optional[tuple] = None
+        schema_values: List[List[Optional[str]]] = []
+
+        for elem in cls._iter_table_info_elements(chunks):
+            tags = tuple(child.tag for child in elem)
+            row_count += 1
+            table_ids.append(elem.get("id"))
+
+            if tags == schema_tags:
+                for values, child in zip(schema_values, elem):
+                    values.append(child.text)
+                continue
+
+            for child in elem:
+                values = columns.get(child.tag)
+                if values is None:
+                    values = columns[child.tag] = [None] * (row_count - 1)
+                values.append(child.text)
+
+            for values in columns.values():
+                if len(values) < row_count:
+                    values.append(None)
+
+            # 統計表IDのカラムを除いた全カラムが1回ずつ現れる構成なら、以降は位置で追加する。
+            # それ以外（新しいカラムが増えた場合を含む）は、以前の構成のままだと
+            # 増えたカラムを埋められないため位置での追加をやめる
+            if len(tags) == len(columns) - 1 and len(set(tags)) == len(tags):
+                schema_tags = tags
+                schema_values = [columns[tag] for tag in tags]
+            else:
+                schema_tags = None
+
+        return columns
+
+    @staticmethod
+    def _iter_table_info_elements(chunks: Iterable[bytes]) -> Iterator[Any]:
+        """
+        XMLのチャンク列からTABLE_INF要素を1件ずつ取り出す
+
+        プルパーサにチャンクを投入するたびに完成した要素を返すため、レスポンス
+        全体の受信を待たずに処理を始められる。呼び出し側が要素を読み終えた
+        時点で解放するので、件数が多くてもメモリ使用量は一定に保たれる。
+
+        Args:
+            chunks: getStatsListのXMLレスポンスを分割したバイト列
+
+        Yields:
+            TABLE_INF要素
+        """
+        if lxml_etree is not None:
+            parser = lxml_etree.XMLPullParser(events=("end",), tag="TABLE_INF")
+        else:
+            parser = ET.XMLPullParser(events=("end",))
+
+        for chunk in chunks:
+            parser.feed(chunk)
+            for _, elem in parser.read_events():
+                if elem.tag != "TABLE_INF":
+                    continue
+                yield elem
+                elem.clear()
+                if lxml_etree is not None:
+                    while elem.getprevious() is not None:
+                        del elem.getparent()[0]
+
+        parser.close()
+
     def classify_by_field(self, catalog: pd.DataFrame) -> Dict[str, pd.DataFrame]:
         """
         統計カタログを分野別に分類
@@ -172,110 +358,200 @@ class EStatCatalogDownloader:
         Returns:
             分野コードをキーとする統計表リストの辞書
         """
-        classified_catalogs = {}
-
-        # 統計名や機関名から分野を推定
-        field_keywords = {
-            "01": ["人口", "世帯", "国勢調査", "住民基本台帳"],
-            "02": ["災害", "環境", "気象", "地震"],
-            "03": ["労働", "賃金", "雇用", "失業", "就業"],
-            "04": ["農業", "林業", "水産", "漁業", "畜産"],
-            "05": ["鉱業", "工業", "製造業", "生産"],
-            "06": ["商業", "サービス", "小売", "卸売"],
-            "07": ["企業", "家計", "経済", "GDP", "所得", "消費"],
-            "08": ["住宅", "土地", "建設", "不動産"],
-            "09": ["エネルギー", "電力", "ガス", "水道"],
-            "10": ["運輸", "交通", "観光", "旅行"],
-            "11": ["情報", "通信", "科学", "技術", "研究"],
-            "12": ["教育", "文化", "スポーツ", "生活", "学校"],
-            "13": ["行政", "財政", "税収", "予算"],
-            "14": ["司法", "安全", "犯罪", "警察", "消防"],
-        }
+        return dict(self.iter_classified(catalog))
 
-        for field_code, keywords in field_keywords.items():
-            field_catalog = catalog[
-                catalog["STAT_NAME"].str.contains("|".join(keywords), na=False, case=False)
-                | catalog["GOV_ORG"].str.contains("|".join(keywords), na=False, case=False)
-                | catalog["MAIN_CATEGORY"].str.contains("|".join(keywords), na=False, case=False)
-            ].copy()
+    def iter_classified(self, catalog: pd.DataFrame) -> Iterator[Tuple[str, pd.DataFrame]]:
+        """
+        統計カタログを分野別に分類し、分野ごとに順次返す
+
+        分野別のDataFrameを必要になった時点で1件ずつ作るため、save_catalogsに
+        直接渡せば全分野分を同時にメモリ上へ保持せずに済む。
+
+        Args:
+            catalog: 統計表リストのDataFrame
 
-            if not field_catalog.empty:
-                classified_catalogs[field_code] = field_catalog
+        Yields:
+            分野コードと該当分野の統計表リストの組
+        """
+        # いずれかの分野に分類された行を記録するマスク
+        classified_mask = np.zeros(len(catalog), dtype=bool)
+
+        # 統計名・機関名・主分類を本文中に現れない区切り文字で連結し、分野ごとの検索を1回にする
+        stat_name, gov_org, main_category = (
+            catalog[col].astype("string[pyarrow]").fillna("")
+            for col in ("STAT_NAME", "GOV_ORG", "MAIN_CATEGORY")
+        )
+        haystack = stat_name + "\x1f" + gov_org + "\x1f" + main_category
+
+        # 同じ統計調査の表は3カラムとも同じ値になるため、異なる文字列ごとに一度だけ照合し、
+        # 結果を各行へ展開する
+        codes, unique_texts = pd.factorize(haystack)
+        unique_texts = pd.Series(unique_texts, dtype="string[pyarrow]")
+
+        for field_code, pattern in self.FIELD_PATTERNS.items():
+            field_mask = unique_texts.str.contains(
+                pattern, case=False, regex=True, na=False
+            ).to_numpy()[codes]
+            classified_mask |= field_mask
+
+            if field_mask.any():
+                field_catalog = catalog[field_mask]
                 print(
                     f"分野 {field_code} ({self.MAJOR_FIELDS[field_code]}): {len(field_catalog)}件"
                 )
+                yield field_code, field_catalog
 
         # 分類されなかったものは「その他」に
-        classified_stats = (
-            pd.concat(classified_catalogs.values()) if classified_catalogs else pd.DataFrame()
-        )
-        if len(classified_stats) < len(catalog):
-            unclassified = catalog[~catalog.index.isin(classified_stats.index)].copy()
-            if not unclassified.empty:
-                classified_catalogs["99"] = unclassified
-                print(f"分野 99 (その他): {len(unclassified)}件")
-
-        return classified_catalogs
-
-    def save_catalogs(self, catalogs: Dict[str, pd.DataFrame]) -> None:
+        if not classified_mask.all():
+            unclassified = catalog[~classified_mask]
+            print(f"分野 99 (その他): {len(unclassified)}件")
+            yield "99", unclassified
+
+    def save_catalogs(
+        self,
+        catalogs: Union[Dict[str, pd.DataFrame], Iterable[Tuple[str, pd.DataFrame]]],
+        timestamp: Optional[str] = None,
+    ) -> None:
         """
         カタログデータを複数の形式で保存
 
+        分野ごとのカタログは一度だけ走査し、分野別CSV・統合CSV・サマリーを
+        同時に作成する。iter_classifiedの戻り値を渡した場合は、書き出し済みの
+        分野から順にメモリを解放できる。
+
         Args:
-            catalogs: 分野コードをキーとする統計表リストの辞書
+            catalogs: 分野コードをキーとする統計表リストの辞書、または(分野コード, 統計表リスト)の列
+            timestamp: ファイル名に付与するタイムスタンプ(未指定の場合は現在時刻)
         """
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-
-        # 1. 各分野のCSVファイルとして保存
-        print("\n=== 分野別CSVファイルを作成中 ===")
-        for field_code, catalog in catalogs.items():
-            field_name = self.MAJOR_FIELDS.get(field_code, "unknown")
-            filename = f"{self.output_dir}/{field_code}_{field_name}_{timestamp}.csv"
-            catalog.to_csv(filename, index=False, encoding="utf-8-sig")
-            print(f"保存: {filename} ({len(catalog)}件)")
-
-        # 2. 全データを統合したCSVファイル
-        print("\n=== 統合CSVファイルを作成中 ===")
-        all_data = []
-        for field_code, catalog in catalogs.items():
-            catalog_copy = catalog.copy()
-            catalog_copy["FIELD_CODE"] = field_code
-            catalog_copy["FIELD_NAME"] = self.MAJOR_FIELDS.get(field_code, "unknown")
-            all_data.append(catalog_copy)
-
-        if all_data:
-            combined_catalog = pd.concat(all_data, ignore_index=True)
-            combined_filename = f"{self.output_dir}/estat_catalog_combined_{timestamp}.csv"
-            combined_catalog.to_csv(combined_filename, index=False, encoding="utf-8-sig")
-            print(f"統合ファイル保存: {combined_filename} ({len(combined_catalog)}件)")
+        if timestamp is None:
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+
+        items = catalogs.items() if isinstance(catalogs, dict) else catalogs
+        combined_filename = f"{self.output_dir}/estat_catalog_combined_{timestamp}.csv"
+        combined_count = 0
+        field_jobs = []
+        field_summary = {}
+
+        # 各分野のカタログは同じ元データの部分集合なので、カラムの有無は最初の分野で一度だけ確認する
+        has_gov_org = has_survey_date = None
+
+        # 1. 各分野のCSVファイルと、全データを統合したCSVファイル
+        print("\n=== 分野別・統合CSVファイルを作成中 ===")
+        # 分野別ファイルの書き出しは互いに独立しているためスレッドプールで並行に実行し、
+        # 統合ファイルには分野ごとに追記していく(全分野を結合したDataFrameは作らない)
+        with (
+            ThreadPoolExecutor(max_workers=self.MAX_WRITE_WORKERS) as executor,
+            ExitStack() as stack,
+        ):
+            combined_file = None
+
+            for field_code, catalog in items:
+                field_name = self.MAJOR_FIELDS.get(field_code, "unknown")
+                table = pa.Table.from_pandas(catalog, preserve_index=False)
+                field_jobs.append(
+                    (
+                        executor.submit(self._save_field_csv, field_code, table, timestamp),
+                        len(catalog),
+                    )
+                )
 
-        # 3. サマリー情報をJSONで保存
-        print("\n=== サマリー情報を作成中 ===")
-        summary = {
-            "download_date": datetime.now().isoformat(),
-            "total_records": sum(len(catalog) for catalog in catalogs.values()),
-            "field_summary": {
-                field_code: {
-                    "name": self.MAJOR_FIELDS.get(field_code, "unknown"),
+                combined_table = table.append_column(
+                    "FIELD_CODE", pa.repeat(field_code, table.num_rows)
+                ).append_column("FIELD_NAME", pa.repeat(field_name, table.num_rows))
+                # ヘッダ行はファイルを開いた直後に一度だけ書く(空の分野が先に来ても重複させない)
+                include_header = combined_file is None
+                if include_header:
+                    combined_file = stack.enter_context(open(combined_filename, "wb"))
+                    combined_file.write(self.CSV_BOM)
+                self._write_table_csv(combined_table, combined_file, include_header=include_header)
+                combined_count += len(catalog)
+
+                # サマリー用の集計
+                if has_gov_org is None:
+                    has_gov_org = "GOV_ORG" in catalog.columns
+                    has_survey_date = "SURVEY_DATE" in catalog.columns
+                field_summary[field_code] = {
+                    "name": field_name,
                     "record_count": len(catalog),
-                    "organizations": (
-                        catalog["GOV_ORG"].unique().tolist() if "GOV_ORG" in catalog.columns else []
-                    ),
+                    "organizations": (catalog["GOV_ORG"].unique().tolist() if has_gov_org else []),
                     "survey_years": (
                         sorted(catalog["SURVEY_DATE"].dropna().unique().tolist())
-                        if "SURVEY_DATE" in catalog.columns
+                        if has_survey_date
                         else []
                     ),
                 }
-                for field_code, catalog in catalogs.items()
-            },
+
+            for future, record_count in field_jobs:
+                print(f"保存: {future.result()} ({record_count}件)")
+
+        if combined_file is not None:
+            print(f"統合ファイル保存: {combined_filename} ({combined_count}件)")
+
+        # 3. サマリー情報をJSONで保存
+        print("\n=== サマリー情報を作成中 ===")
+        summary = {
+            "download_date": datetime.now().isoformat(),
+            "total_records": combined_count,
+            "field_summary": field_summary,
         }
 
         summary_filename = f"{self.output_dir}/catalog_summary_{timestamp}.json"
-        with open(summary_filename, "w", encoding="utf-8") as f:
-            json.dump(summary, f, ensure_ascii=False, indent=2)
+        if orjson is not None:
+            with open(summary_filename, "wb") as f:
+                f.write(orjson.dumps(summary, option=orjson.OPT_INDENT_2))
+        else:
+            with open(summary_filename, "w", encoding="utf-8") as f:
+                json.dump(summary, f, ensure_ascii=False, indent=2)
         print(f"サマリー保存: {summary_filename}")
 
+    def _save_field_csv(self, field_code: str, table: pa.Table, timestamp: str) -> str:
+        """
+        1分野分のカタログをCSVファイルとして保存
+
+        Args:
+            field_code: 分野コード
+            table: 該当分野の統計表リスト(Arrowテーブル)
+            timestamp: ファイル名に付与するタイムスタンプ
+
+        Returns:
+            保存したファイルのパス
+        """
+        field_name = self.MAJOR_FIELDS.get(field_code, "unknown")
+        filename = f"{self.output_dir}/{field_code}_{field_name}_{timestamp}.csv"
+        with open(filename, "wb") as f:
+            f.write(self.CSV_BOM)
+            self._write_table_csv(table, f)
+        return filename
+
+    @classmethod
+    def write_csv(cls, df: pd.DataFrame, filename: str) -> None:
+        """
+        DataFrameをBOM付きUTF-8のCSVファイルとして保存
+
+        pyarrowのCSVライタ(C++実装・マルチスレッド)で書き出す。Excelで
+        文字化けしないよう、先頭にBOMを付与する。
+
+        Args:
+            df: 保存するDataFrame
+            filename: 保存先のファイルパス
+        """
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        with open(filename, "wb") as f:
+            f.write(cls.CSV_BOM)
+            cls._write_table_csv(table, f)
+
+    @staticmethod
+    def _write_table_csv(table: pa.Table, f: BinaryIO, include_header: bool = True) -> None:
+        """
+        Arrowテーブルを開いているファイルへCSVとして書き出す
+
+        Args:
+            table: 書き出すArrowテーブル
+            f: バイナリモードで開いたファイル
+            include_header: ヘッダ行を出力するかどうか
+        """
+        pacsv.write_csv(table, f, write_options=pacsv.WriteOptions(include_header=include_header))
+
     def create_catalog_index(self, catalogs: Dict[str, pd.DataFrame]) -> pd.DataFrame:
         """
         カタログのインデックス(目次)を作成
@@ -286,34 +562,31 @@ class EStatCatalogDownloader:
         Returns:
             カタログインデックスのDataFrame
         """
-        index_data = []
+        index_parts = []
+
+        # 集計内容はカラムの有無だけで決まるため、ループの外で一度だけ組み立てる
+        aggregations = {"table_count": ("STAT_NAME", "size")}
+        if all("SURVEY_DATE" in catalog.columns for catalog in catalogs.values()):
+            aggregations["latest_survey"] = ("SURVEY_DATE", "max")
 
         for field_code, catalog in catalogs.items():
-            # 統計調査の種類を集計
-            survey_types = (
-                catalog.groupby(["STAT_NAME", "GOV_ORG"]).size().reset_index(name="table_count")
+            # 統計調査の種類ごとに表数と最新調査年月を一度の集計で求める
+            survey_types = catalog.groupby(
+                ["STAT_NAME", "GOV_ORG"], as_index=False, observed=True
+            ).agg(**aggregations)
+            if "latest_survey" not in survey_types.columns:
+                survey_types["latest_survey"] = None
+
+            survey_types.insert(0, "field_code", field_code)
+            survey_types.insert(1, "field_name", self.MAJOR_FIELDS.get(field_code, "unknown"))
+            index_parts.append(
+                survey_types.rename(columns={"STAT_NAME": "stat_name", "GOV_ORG": "organization"})
             )
 
-            for _, row in survey_types.iterrows():
-                index_data.append(
-                    {
-                        "field_code": field_code,
-                        "field_name": self.MAJOR_FIELDS.get(field_code, "unknown"),
-                        "stat_name": row["STAT_NAME"],
-                        "organization": row["GOV_ORG"],
-                        "table_count": row["table_count"],
-                        "latest_survey": (
-                            catalog[
-                                (catalog["STAT_NAME"] == row["STAT_NAME"])
-                                & (catalog["GOV_ORG"] == row["GOV_ORG"])
-                            ]["SURVEY_DATE"].max()
-                            if "SURVEY_DATE" in catalog.columns
-                            else None
-                        ),
-                    }
-                )
+        if not index_parts:
+            return pd.DataFrame()
 
-        return pd.DataFrame(index_data)
+        return pd.concat(index_parts, ignore_index=True)
 
 
 def main() -> None:
@@ -333,28 +606,38 @@ def main() -> None:
             print("カタログデータを取得できませんでした。")
             return
 
-        # 分野別に分類
-        print("\n統計データを分野別に分類中...")
-        catalogs = downloader.classify_by_field(all_catalog)
+        # 出力ファイル一式で同じタイムスタンプを使用
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+
+        # 分野別に分類しながら保存する。分野ごとのインデックスと件数は保存と同じ走査で
+        # 作っておき、分野別のDataFrameは書き出し後に順次解放する
+        print("\n統計データを分野別に分類・保存中...")
+        field_indexes = []
+        total_records = 0
+
+        def index_fields(
+            classified: Iterable[Tuple[str, pd.DataFrame]],
+        ) -> Iterator[Tuple[str, pd.DataFrame]]:
+            nonlocal total_records
+            for field_code, catalog in classified:
+                field_indexes.append(downloader.create_catalog_index({field_code: catalog}))
+                total_records += len(catalog)
+                yield field_code, catalog
 
-        if not catalogs:
+        downloader.save_catalogs(index_fields(downloader.iter_classified(all_catalog)), timestamp)
+
+        if not field_indexes:
             print("カタログデータを取得できませんでした。")
             return
 
-        # カタログを保存
-        print(f"\n取得完了! {len(catalogs)}分野のデータを保存します...")
-        downloader.save_catalogs(catalogs)
-
-        # インデックスを作成・保存
-        print("\nカタログインデックスを作成中...")
-        index_df = downloader.create_catalog_index(catalogs)
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        # インデックスを保存
+        print("\nカタログインデックスを保存中...")
+        index_df = pd.concat(field_indexes, ignore_index=True)
         index_filename = f"{downloader.output_dir}/catalog_index_{timestamp}.csv"
-        index_df.to_csv(index_filename, index=False, encoding="utf-8-sig")
+        downloader.write_csv(index_df, index_filename)
         print(f"インデックス保存: {index_filename}")
 
         # 完了メッセージ
-        total_records = sum(len(catalog) for catalog in catalogs.values())
         print("\n=== 完了 ===")
         print(f"総取得件数: {total_records}件")
         print(f"出力ディレクトリ: {downloader.output_dir}/")
@@ -8,14 +8,13 @@ MCPを使用して自然言語クエリでデータを取得し、
 
 import os
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
+from typing import ClassVar
 
-import japanize_matplotlib
-import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
-import seaborn as sns
 
 # プロジェクトパスを追加
 sys.path.append(str(Path(__file__).parent / "src"))
@@ -28,6 +27,25 @@ from opendatajounalism.mcp import EstatQueryTranslator
 class PopulationAnalysisReport:
     """日本の人口減少と世帯数変化の分析レポート"""
 
+    # MCPクエリを並行実行する際の最大スレッド数
+    MAX_QUERY_WORKERS = 8
+
+    # 保存する図の解像度とPNGの圧縮レベル
+    FIGURE_DPI = 150
+    PNG_COMPRESS_LEVEL = 1
+
+    # グラフの見た目（seaborn風の背景と白いグリッド）
+    # フォントはjapanize_matplotlibの設定を残すため変更しない
+    MATPLOTLIB_RC: ClassVar[dict] = {
+        "axes.facecolor": "#EAEAF2",
+        "axes.edgecolor": "white",
+        "axes.grid": True,
+        "axes.axisbelow": True,
+        "grid.color": "white",
+        "figure.figsize": (12, 8),
+        "font.size": 10,
+    }
+
     def __init__(self):
         """初期化"""
         load_dotenv()
@@ -39,51 +57,100 @@ class PopulationAnalysisReport:
         self.output_dir = Path("analysis_output")
         self.output_dir.mkdir(exist_ok=True)
 
-        # matplotlib設定
-        plt.style.use("seaborn-v0_8")
-        plt.rcParams["figure.figsize"] = (12, 8)
-        plt.rcParams["font.size"] = 10
+        # HEADLESSが設定されていれば図を表示せず保存のみ行う
+        self.headless = bool(os.environ.get("HEADLESS"))
+
+        # DATA_ONLYが設定されていれば図を描画せず、分析データをParquetで保存する
+        self.data_only = bool(os.environ.get("DATA_ONLY"))
+        self.data_files = []
 
     def execute_mcp_query(self, query_description: str, query: str) -> dict:
         """MCPクエリを実行してデータ取得情報を返す"""
-        print(f"\n📊 {query_description}")
-        print(f"クエリ: 「{query}」")
+        [results] = self._translate_queries([query])
+        lines = []
+        query_info = self._report_mcp_result(query_description, query, results, lines)
+        self._write_lines(lines)
+        return query_info
+
+    def execute_mcp_queries(self, queries: dict) -> dict:
+        """複数のMCPクエリを並行実行し、キーごとのデータ取得情報を返す
+
+        Args:
+            queries: 結果のキーを (クエリの説明, クエリ) に対応付けた辞書
+        """
+        # 表示は結果が揃ってからクエリの順にまとめて一度に書き出す
+        results = self._translate_queries([query for _, query in queries.values()])
+
+        lines = []
+        query_infos = {
+            key: self._report_mcp_result(query_description, query, query_results, lines)
+            for (key, (query_description, query)), query_results in zip(queries.items(), results)
+        }
+        self._write_lines(lines)
+        return query_infos
+
+    def _translate_queries(self, queries: list) -> list:
+        """クエリを変換し、クエリごとの変換結果をリストで返す
+
+        同じクエリの変換結果はトランスレータのキャッシュ（カタログDBの更新で無効になる）に任せ、
+        異なるクエリは互いに独立しているためスレッドで並行に問い合わせる。
+        """
+        unique_queries = list(dict.fromkeys(queries))
+        with ThreadPoolExecutor(max_workers=self.MAX_QUERY_WORKERS) as executor:
+            results = dict(
+                zip(unique_queries, executor.map(self.translator.translate_query, unique_queries))
+            )
+
+        return [results[query] for query in queries]
 
-        results = self.translator.translate_query(query)
+    def _report_mcp_result(
+        self, query_description: str, query: str, results: list, lines: list
+    ) -> dict:
+        """MCPクエリの結果の表示行をlinesに追加し、データ取得情報を返す"""
+        lines.append(f"\n📊 {query_description}")
+        lines.append(f"クエリ: 「{query}」")
 
         if results:
             result = results[0]
-            print(f"✅ 統計表: {result.table_name} (ID: {result.stats_data_id})")
-            print(f"📋 説明: {result.description}")
-            print(f"🔧 APIパラメータ: {result.parameters}")
-            print(f"🎯 信頼度: {result.confidence_score:.2f}")
+            lines.append(f"✅ 統計表: {result.table_name} (ID: {result.stats_data_id})")
+            lines.append(f"📋 説明: {result.description}")
+            lines.append(f"🔧 APIパラメータ: {result.parameters}")
+            lines.append(f"🎯 信頼度: {result.confidence_score:.2f}")
 
             return {"query": query, "result": result, "success": True}
         else:
-            print("❌ 該当するデータが見つかりませんでした")
+            lines.append("❌ 該当するデータが見つかりませんでした")
             return {"query": query, "result": None, "success": False}
 
+    @staticmethod
+    def _write_lines(lines: list):
+        """表示行をまとめて標準出力に書き出す"""
+        if lines:
+            sys.stdout.write("\n".join(lines) + "\n")
+
     def analyze_population_trends(self):
         """人口推移の分析"""
         print("=" * 60)
         print("📈 1. 人口推移の分析")
         print("=" * 60)
 
-        # 基本的な人口推移
-        query_result = self.execute_mcp_query(
-            "全国の人口推移データ取得", "日本の人口推移を時系列で見たい"
-        )
-        self.analysis_results["population_trends"] = query_result
-
-        # 年齢別人口構成
-        query_result = self.execute_mcp_query("年齢別人口構成の取得", "年齢3区分別人口の推移データ")
-        self.analysis_results["age_groups"] = query_result
-
-        # 都道府県別人口変化
-        query_result = self.execute_mcp_query(
-            "都道府県別人口変化", "都道府県別の人口増減率を比較したい"
+        query_results = self.execute_mcp_queries(
+            {
+                # 基本的な人口推移
+                "population_trends": (
+                    "全国の人口推移データ取得",
+                    "日本の人口推移を時系列で見たい",
+                ),
+                # 年齢別人口構成
+                "age_groups": ("年齢別人口構成の取得", "年齢3区分別人口の推移データ"),
+                # 都道府県別人口変化
+                "prefecture_population": (
+                    "都道府県別人口変化",
+                    "都道府県別の人口増減率を比較したい",
+                ),
+            }
         )
-        self.analysis_results["prefecture_population"] = query_result
+        self.analysis_results.update(query_results)
 
         return self._create_mock_population_data()
 
@@ -93,19 +160,20 @@ class PopulationAnalysisReport:
         print("🏠 2. 世帯数変化の分析")
         print("=" * 60)
 
-        # 世帯数の推移
-        query_result = self.execute_mcp_query(
-            "全国の世帯数推移", "日本の世帯数の推移を年次で見たい"
+        query_results = self.execute_mcp_queries(
+            {
+                # 世帯数の推移
+                "household_trends": ("全国の世帯数推移", "日本の世帯数の推移を年次で見たい"),
+                # 世帯人員の変化
+                "household_size": ("平均世帯人員の変化", "平均世帯人員の推移データ"),
+                # 世帯構成の変化
+                "household_composition": (
+                    "世帯構成別データ",
+                    "単独世帯と核家族世帯の割合推移",
+                ),
+            }
         )
-        self.analysis_results["household_trends"] = query_result
-
-        # 世帯人員の変化
-        query_result = self.execute_mcp_query("平均世帯人員の変化", "平均世帯人員の推移データ")
-        self.analysis_results["household_size"] = query_result
-
-        # 世帯構成の変化
-        query_result = self.execute_mcp_query("世帯構成別データ", "単独世帯と核家族世帯の割合推移")
-        self.analysis_results["household_composition"] = query_result
+        self.analysis_results.update(query_results)
 
         return self._create_mock_household_data()
 
@@ -115,126 +183,124 @@ class PopulationAnalysisReport:
         print("👥 3. 人口統計の詳細分析")
         print("=" * 60)
 
-        # 出生・死亡データ
-        query_result = self.execute_mcp_query("出生・死亡データ", "出生数と死亡数の推移データ")
-        self.analysis_results["birth_death"] = query_result
-
-        # 男女別人口
-        query_result = self.execute_mcp_query("男女別人口推移", "男女別人口の推移を時系列で")
-        self.analysis_results["gender_population"] = query_result
-
-        # 地域別分析
+        # 出生・死亡データ、男女別人口、地域別分析をまとめて問い合わせる
         regions = ["東京都", "大阪府", "愛知県", "北海道", "沖縄県"]
-        regional_results = {}
-
+        queries = {
+            "birth_death": ("出生・死亡データ", "出生数と死亡数の推移データ"),
+            "gender_population": ("男女別人口推移", "男女別人口の推移を時系列で"),
+        }
         for region in regions:
-            query_result = self.execute_mcp_query(
-                f"{region}の人口・世帯分析", f"{region}の人口と世帯数の変化傾向"
-            )
-            regional_results[region] = query_result
+            queries[region] = (f"{region}の人口・世帯分析", f"{region}の人口と世帯数の変化傾向")
+
+        query_results = self.execute_mcp_queries(queries)
 
-        self.analysis_results["regional"] = regional_results
+        self.analysis_results["birth_death"] = query_results["birth_death"]
+        self.analysis_results["gender_population"] = query_results["gender_population"]
+        self.analysis_results["regional"] = {region: query_results[region] for region in regions}
 
         return self._create_mock_demographic_data()
 
     def _create_mock_population_data(self):
         """モックの人口データを作成（実際のe-statデータの代替）"""
-        years = list(range(2000, 2025))
+        years = np.arange(2000, 2025, dtype=np.int32)
 
-        # 総人口（減少傾向）
+        # 総人口（2008年までは微増、以降は年0.3%ずつ減少率増加）
         base_population = 126_000_000
-        population_data = []
-        for i, year in enumerate(years):
-            if year <= 2008:
-                pop = base_population + (year - 2000) * 50_000  # 微増
-            else:
-                decline_rate = (year - 2008) * 0.003  # 年0.3%ずつ減少率増加
-                pop = base_population * (1 - decline_rate)
-            population_data.append(pop)
+        population = np.where(
+            years <= 2008,
+            base_population + (years - 2000) * 50_000,
+            base_population * (1 - (years - 2008) * 0.003),
+        )
 
         # 年齢別人口（年少人口減少、高齢人口増加）
-        age_data = []
-        for i, year in enumerate(years):
-            total = population_data[i]
-
-            # 年少人口（0-14歳）: 減少傾向
-            young_ratio = max(0.12, 0.18 - (year - 2000) * 0.0025)
-
-            # 生産年齢人口（15-64歳）: 減少傾向
-            working_ratio = max(0.55, 0.68 - (year - 2000) * 0.005)
-
-            # 高齢人口（65歳以上）: 増加傾向
-            elderly_ratio = 1 - young_ratio - working_ratio
-
-            age_data.append(
-                {
-                    "year": year,
-                    "total": total,
-                    "young": total * young_ratio,
-                    "working": total * working_ratio,
-                    "elderly": total * elderly_ratio,
-                    "young_ratio": young_ratio,
-                    "working_ratio": working_ratio,
-                    "elderly_ratio": elderly_ratio,
-                }
-            )
-
-        return pd.DataFrame({"year": years, "total_population": population_data}), pd.DataFrame(
-            age_data
+        # 割合は単精度で十分なためfloat32で計算する
+        elapsed = (years - 2000).astype(np.float32)
+
+        # 年少人口（0-14歳）: 減少傾向
+        young_ratio = np.maximum(0.12, 0.18 - elapsed * 0.0025)
+
+        # 生産年齢人口（15-64歳）: 減少傾向
+        working_ratio = np.maximum(0.55, 0.68 - elapsed * 0.005)
+
+        # 高齢人口（65歳以上）: 増加傾向
+        elderly_ratio = 1 - young_ratio - working_ratio
+
+        age_df = pd.DataFrame(
+            {
+                "year": years,
+                "total": population,
+                "young": population * young_ratio,
+                "working": population * working_ratio,
+                "elderly": population * elderly_ratio,
+                "young_ratio": young_ratio,
+                "working_ratio": working_ratio,
+                "elderly_ratio": elderly_ratio,
+            }
         )
 
+        return pd.DataFrame({"year": years, "total_population": population}), age_df
+
     def _create_mock_household_data(self):
         """モックの世帯データを作成"""
-        years = list(range(2000, 2025))
-
-        household_data = []
-        for year in years:
-            # 世帯数は人口減少にもかかわらず増加（単独世帯増加）
-            base_households = 45_000_000
-            household_increase = (year - 2000) * 800_000  # 年80万世帯増加
-            total_households = base_households + household_increase
-
-            # 平均世帯人員は減少
-            avg_size = max(2.0, 2.8 - (year - 2000) * 0.03)
-
-            # 単独世帯割合は増加
-            single_ratio = min(0.4, 0.25 + (year - 2000) * 0.006)
-
-            household_data.append(
-                {
-                    "year": year,
-                    "total_households": total_households,
-                    "average_size": avg_size,
-                    "single_household_ratio": single_ratio,
-                }
-            )
+        years = np.arange(2000, 2025, dtype=np.int32)
+
+        # 世帯数は人口減少にもかかわらず増加（単独世帯増加）
+        base_households = 45_000_000
+        total_households = base_households + (years - 2000) * 800_000  # 年80万世帯増加
+
+        # 平均世帯人員・単独世帯割合は単精度で十分なためfloat32で計算する
+        elapsed = (years - 2000).astype(np.float32)
 
-        return pd.DataFrame(household_data)
+        # 平均世帯人員は減少
+        avg_size = np.maximum(2.0, 2.8 - elapsed * 0.03)
+
+        # 単独世帯割合は増加
+        single_ratio = np.minimum(0.4, 0.25 + elapsed * 0.006)
+
+        return pd.DataFrame(
+            {
+                "year": years,
+                "total_households": total_households,
+                "average_size": avg_size,
+                "single_household_ratio": single_ratio,
+            }
+        )
 
     def _create_mock_demographic_data(self):
         """モックの人口動態データを作成"""
-        years = list(range(2000, 2025))
-
-        demographic_data = []
-        for year in years:
-            # 出生数減少、死亡数増加
-            births = max(700_000, 1_200_000 - (year - 2000) * 20_000)
-            deaths = min(1_600_000, 1_000_000 + (year - 2000) * 24_000)
-            natural_change = births - deaths
-
-            demographic_data.append(
-                {
-                    "year": year,
-                    "births": births,
-                    "deaths": deaths,
-                    "natural_change": natural_change,
-                }
-            )
+        years = np.arange(2000, 2025, dtype=np.int32)
+
+        # 出生数減少、死亡数増加
+        births = np.maximum(700_000, 1_200_000 - (years - 2000) * 20_000)
+        deaths = np.minimum(1_600_000, 1_000_000 + (years - 2000) * 24_000)
+
+        return pd.DataFrame(
+            {
+                "year": years,
+                "births": births,
+                "deaths": deaths,
+                "natural_change": births - deaths,
+            }
+        )
 
-        return pd.DataFrame(demographic_data)
+    def _setup_matplotlib(self):
+        """matplotlibを読み込んで設定する（可視化を行うときだけ読み込む）"""
+        import japanize_matplotlib
+        import matplotlib.pyplot as plt
+
+        if self.headless:
+            plt.switch_backend("Agg")
+        plt.rcParams.update(self.MATPLOTLIB_RC)
+        return plt
 
     def create_visualizations(self, pop_df, age_df, household_df, demo_df):
         """データの可視化"""
+        if self.data_only:
+            self._save_analysis_data(pop_df, age_df, household_df, demo_df)
+            return
+
+        plt = self._setup_matplotlib()
+
         print("=" * 60)
         print("📊 4. データ可視化の作成")
         print("=" * 60)
@@ -348,42 +414,30 @@ class PopulationAnalysisReport:
         ax4.axhline(y=0, color="black", linestyle="-", alpha=0.5)
 
         plt.tight_layout()
-        fig_path = self.output_dir / "population_overview.png"
-        plt.savefig(fig_path, dpi=300, bbox_inches="tight")
-        self.figures.append(fig_path)
-        plt.show()
+        self._save_figure(fig, "population_overview.png")
 
         # 図2: 詳細分析
         self._create_detailed_analysis_charts(age_df, household_df)
 
     def _create_detailed_analysis_charts(self, age_df, household_df):
         """詳細分析チャートの作成"""
+        import matplotlib.pyplot as plt
+        from matplotlib.lines import Line2D
+
         fig, ((ax1, ax2), (ax3, ax4)) = plt.subplots(2, 2, figsize=(16, 12))
 
-        # 年齢別人口の絶対数
-        ax1.fill_between(
-            age_df["year"],
-            0,
-            age_df["young"] / 1_000_000,
-            alpha=0.7,
-            label="年少人口",
-            color="lightblue",
-        )
+        # 年齢別人口の絶対数（積み上げの境界は一度だけ計算してNumPy配列で渡す）
+        years = age_df["year"].to_numpy()
+        young = age_df["young"].to_numpy() / 1_000_000
+        young_working = young + age_df["working"].to_numpy() / 1_000_000
+        total = age_df["total"].to_numpy() / 1_000_000
+
+        ax1.fill_between(years, 0, young, alpha=0.7, label="年少人口", color="lightblue")
         ax1.fill_between(
-            age_df["year"],
-            age_df["young"] / 1_000_000,
-            (age_df["young"] + age_df["working"]) / 1_000_000,
-            alpha=0.7,
-            label="生産年齢人口",
-            color="lightgreen",
+            years, young, young_working, alpha=0.7, label="生産年齢人口", color="lightgreen"
         )
         ax1.fill_between(
-            age_df["year"],
-            (age_df["young"] + age_df["working"]) / 1_000_000,
-            age_df["total"] / 1_000_000,
-            alpha=0.7,
-            label="高齢人口",
-            color="lightcoral",
+            years, young_working, total, alpha=0.7, label="高齢人口", color="lightcoral"
         )
         ax1.set_title("年齢別人口の絶対数推移", fontsize=14, fontweight="bold")
         ax1.set_xlabel("年")
@@ -406,11 +460,20 @@ class PopulationAnalysisReport:
         ax2.set_ylabel("高齢化率（%）")
         ax2.grid(True, alpha=0.3)
 
-        # 重要な閾値ラインを追加
-        ax2.axhline(y=7, color="orange", linestyle="--", alpha=0.7, label="高齢化社会（7%）")
-        ax2.axhline(y=14, color="red", linestyle="--", alpha=0.7, label="高齢社会（14%）")
-        ax2.axhline(y=21, color="darkred", linestyle="--", alpha=0.7, label="超高齢社会（21%）")
-        ax2.legend()
+        # 重要な閾値ラインを追加（3本を1つのLineCollectionとして描画し、凡例は代理の線で示す）
+        thresholds = [
+            (7, "orange", "高齢化社会（7%）"),
+            (14, "red", "高齢社会（14%）"),
+            (21, "darkred", "超高齢社会（21%）"),
+        ]
+        levels, colors, labels = zip(*thresholds)
+        ax2.hlines(levels, years[0], years[-1], colors=colors, linestyles="--", alpha=0.7)
+        ax2.legend(
+            handles=[
+                Line2D([], [], color=color, linestyle="--", alpha=0.7, label=label)
+                for color, label in zip(colors, labels)
+            ]
+        )
 
         # 単独世帯の増加
         ax3.plot(
@@ -464,10 +527,42 @@ class PopulationAnalysisReport:
         ax4.axhline(y=100, color="black", linestyle="-", alpha=0.5)
 
         plt.tight_layout()
-        fig_path = self.output_dir / "detailed_analysis.png"
-        plt.savefig(fig_path, dpi=300, bbox_inches="tight")
+        self._save_figure(fig, "detailed_analysis.png")
+
+    def _save_analysis_data(self, pop_df, age_df, household_df, demo_df):
+        """図の代わりに分析データをParquetで保存（データのみのモード）"""
+        print("=" * 60)
+        print("💾 4. 分析データの保存（描画はスキップ）")
+        print("=" * 60)
+
+        datasets = {
+            "population": pop_df,
+            "age_structure": age_df,
+            "households": household_df,
+            "demographics": demo_df,
+        }
+        for name, df in datasets.items():
+            data_path = self.output_dir / f"{name}.parquet"
+            df.to_parquet(data_path, compression="zstd", index=False)
+            self.data_files.append(data_path)
+            print(f"   {data_path}")
+
+    def _save_figure(self, fig, filename: str):
+        """図をPNGで保存し、ヘッドレスでなければ表示する"""
+        import matplotlib.pyplot as plt
+
+        fig_path = self.output_dir / filename
+        # PNGの書き出しは圧縮が大半を占めるため、圧縮レベルを下げて保存する
+        fig.savefig(
+            fig_path,
+            dpi=self.FIGURE_DPI,
+            bbox_inches="tight",
+            pil_kwargs={"compress_level": self.PNG_COMPRESS_LEVEL},
+        )
         self.figures.append(fig_path)
-        plt.show()
+        if not self.headless:
+            plt.show()
+        plt.close(fig)
 
     def analyze_causes_and_implications(self, age_df, household_df, demo_df):
         """原因分析と含意の考察"""
@@ -475,62 +570,60 @@ class PopulationAnalysisReport:
         print("🔍 5. 原因分析と社会的含意")
         print("=" * 60)
 
+        # 値の参照は列ごとのNumPy配列に対して行う
+        age = age_df.to_records(index=False)
+        household = household_df.to_records(index=False)
+        demo = demo_df.to_records(index=False)
+
         # 主要な変化点を特定
         population_peak_year = 2008
-        natural_decrease_start = demo_df[demo_df["natural_change"] < 0]["year"].min()
+        natural_decrease_start = demo["year"][demo["natural_change"] < 0].min()
 
         print(f"📅 人口のピーク: {population_peak_year}年")
         print(f"📅 自然減少開始: {natural_decrease_start}年")
 
         # 最新データでの分析
-        latest_data = age_df.iloc[-1]
-        print(f"\n📊 最新年（{latest_data['year']}年）の人口構成:")
-        print(f"   年少人口: {latest_data['young_ratio'] * 100:.1f}%")
-        print(f"   生産年齢人口: {latest_data['working_ratio'] * 100:.1f}%")
-        print(f"   高齢人口: {latest_data['elderly_ratio'] * 100:.1f}%")
+        print(f"\n📊 最新年（{age['year'][-1]}年）の人口構成:")
+        print(f"   年少人口: {age['young_ratio'][-1] * 100:.1f}%")
+        print(f"   生産年齢人口: {age['working_ratio'][-1] * 100:.1f}%")
+        print(f"   高齢人口: {age['elderly_ratio'][-1] * 100:.1f}%")
 
         # 世帯変化の分析
-        latest_household = household_df.iloc[-1]
-        first_household = household_df.iloc[0]
+        total_households = household["total_households"]
+        average_size = household["average_size"]
 
-        household_change = (
-            (latest_household["total_households"] - first_household["total_households"])
-            / first_household["total_households"]
-            * 100
-        )
-        size_change = latest_household["average_size"] - first_household["average_size"]
+        household_change = (total_households[-1] - total_households[0]) / total_households[0] * 100
+        size_change = average_size[-1] - average_size[0]
 
-        print(f"\n🏠 世帯数変化（{first_household['year']}→{latest_household['year']}年）:")
+        print(f"\n🏠 世帯数変化（{household['year'][0]}→{household['year'][-1]}年）:")
         print(f"   総世帯数変化: +{household_change:.1f}%")
         print(f"   平均世帯人員変化: {size_change:.2f}人")
-        print(f"   単独世帯割合: {latest_household['single_household_ratio'] * 100:.1f}%")
+        print(f"   単独世帯割合: {household['single_household_ratio'][-1] * 100:.1f}%")
 
         # 原因分析
-        self._analyze_demographic_causes(demo_df)
+        self._analyze_demographic_causes(demo)
 
         # 社会経済への影響分析
-        self._analyze_socioeconomic_impacts(age_df, household_df)
+        self._analyze_socioeconomic_impacts(age, household)
 
-    def _analyze_demographic_causes(self, demo_df):
-        """人口変動の要因分析"""
+    def _analyze_demographic_causes(self, demo):
+        """人口変動の要因分析（demoは人口動態データのレコード配列）"""
         print("\n🔬 人口変動の主要要因:")
 
         # 出生率低下の影響
-        birth_2000 = demo_df.iloc[0]["births"]
-        birth_latest = demo_df.iloc[-1]["births"]
-        birth_decline = (birth_latest - birth_2000) / birth_2000 * 100
+        births = demo["births"]
+        birth_decline = (births[-1] - births[0]) / births[0] * 100
 
         print(f"  📉 出生数変化: {birth_decline:.1f}% （少子化の進行）")
 
         # 死亡数増加の影響
-        death_2000 = demo_df.iloc[0]["deaths"]
-        death_latest = demo_df.iloc[-1]["deaths"]
-        death_increase = (death_latest - death_2000) / death_2000 * 100
+        deaths = demo["deaths"]
+        death_increase = (deaths[-1] - deaths[0]) / deaths[0] * 100
 
         print(f"  📈 死亡数変化: +{death_increase:.1f}% （高齢化による自然増）")
 
         # 自然増減の転換
-        natural_negative_years = len(demo_df[demo_df["natural_change"] < 0])
+        natural_negative_years = np.count_nonzero(demo["natural_change"] < 0)
         print(f"  ⚠️  自然減少期間: {natural_negative_years}年間継続")
 
         print("\n💡 主要な要因:")
@@ -538,26 +631,24 @@ class PopulationAnalysisReport:
         print("  2️⃣ 高齢化: 平均寿命延伸による高齢人口増加")
         print("  3️⃣ 社会構造変化: 核家族化・個人化の進展")
 
-    def _analyze_socioeconomic_impacts(self, age_df, household_df):
-        """社会経済への影響分析"""
+    def _analyze_socioeconomic_impacts(self, age, household):
+        """社会経済への影響分析（age・householdはレコード配列）"""
         print("\n🌍 社会経済への影響:")
 
         # 労働力への影響
-        working_2000 = age_df.iloc[0]["working_ratio"]
-        working_latest = age_df.iloc[-1]["working_ratio"]
-        working_change = (working_latest - working_2000) * 100
+        working_ratio = age["working_ratio"]
+        working_change = (working_ratio[-1] - working_ratio[0]) * 100
 
         print(f"  👷 生産年齢人口割合変化: {working_change:+.1f}ポイント")
 
         # 社会保障への影響
-        elderly_2000 = age_df.iloc[0]["elderly_ratio"]
-        elderly_latest = age_df.iloc[-1]["elderly_ratio"]
-        elderly_change = (elderly_latest - elderly_2000) * 100
+        elderly_ratio = age["elderly_ratio"]
+        elderly_change = (elderly_ratio[-1] - elderly_ratio[0]) * 100
 
         print(f"  👴 高齢化率変化: +{elderly_change:.1f}ポイント")
 
         # 世帯構造への影響
-        single_latest = household_df.iloc[-1]["single_household_ratio"]
+        single_latest = household["single_household_ratio"][-1]
         print(f"  🏠 単独世帯割合: {single_latest * 100:.1f}%")
 
         print("\n📋 主要な社会的課題:")
@@ -658,12 +749,15 @@ class PopulationAnalysisReport:
             print(f"   📁 出力ディレクトリ: {self.output_dir}")
             for fig_path in self.figures:
                 print(f"   🖼️  {fig_path}")
+            for data_path in self.data_files:
+                print(f"   📦 {data_path}")
             print("   📄 analysis_summary.md")
 
             return {
                 "success": True,
                 "output_dir": self.output_dir,
                 "figures": self.figures,
+                "data_files": self.data_files,
                 "analysis_results": self.analysis_results,
                 "summary": summary,
             }
@@ -1,12 +1,18 @@
 """既存のカタログダウンローダーとの統合機能"""
 
 import json
+import os
+import re
 import sqlite3
 import sys
+import time
 from pathlib import Path
-from typing import Dict, List
+from typing import ClassVar, Dict, List, Optional
 
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pacsv
 
 sys.path.append(str(Path(__file__).parent.parent.parent.parent))
 from catalog_downloader import EStatCatalogDownloader
@@ -15,6 +21,52 @@ from catalog_downloader import EStatCatalogDownloader
 class CatalogIntegrator:
     """カタログダウンローダーとMCPの統合クラス"""
 
+    # stats_tablesへの同期に使うカタログの列（挿入する列の順）
+    SYNC_COLUMNS: ClassVar[List[str]] = [
+        "TABLE_INF",
+        "STAT_NAME",
+        "TITLE",
+        "GOV_ORG",
+        "FIELD_CODE",
+        "FIELD_NAME",
+    ]
+
+    # SYNC_COLUMNSの各列に対応するstats_tablesの列
+    DB_COLUMNS: ClassVar[List[str]] = [
+        "stats_data_id",
+        "table_name",
+        "description",
+        "organization",
+        "field_code",
+        "field_name",
+    ]
+
+    # 1つのINSERT文でまとめて挿入する行数（SQLiteのパラメータ数上限に収まる範囲）
+    INSERT_CHUNK_SIZE: ClassVar[int] = 500
+
+    # この秒数より新しいカタログCSVがあれば再ダウンロードしない
+    CATALOG_MAX_AGE_SECONDS: ClassVar[int] = 24 * 60 * 60
+
+    # 主要キーワードの辞書
+    KEYWORD_PATTERNS: ClassVar[Dict[str, List[str]]] = {
+        "人口": ["人口", "国勢", "住民"],
+        "労働": ["労働", "雇用", "失業", "就業"],
+        "賃金": ["賃金", "給与", "所得"],
+        "物価": ["物価", "価格", "指数"],
+        "家計": ["家計", "消費", "支出"],
+        "企業": ["企業", "法人", "会社"],
+        "建設": ["建設", "建築", "住宅"],
+        "農業": ["農業", "農林", "作物"],
+        "工業": ["工業", "製造", "生産"],
+        "商業": ["商業", "小売", "卸売"],
+    }
+
+    # キーワードごとの検索パターン(クラス定義時に一度だけコンパイル)
+    KEYWORD_REGEXES: ClassVar[Dict[str, re.Pattern[str]]] = {
+        keyword: re.compile("|".join(map(re.escape, patterns)))
+        for keyword, patterns in KEYWORD_PATTERNS.items()
+    }
+
     def __init__(self, catalog_dir: str = "estat_catalog", mcp_data_dir: str = "data/mcp"):
         self.catalog_dir = Path(catalog_dir)
         self.mcp_data_dir = Path(mcp_data_dir)
@@ -26,11 +78,18 @@ class CatalogIntegrator:
         conn = sqlite3.connect(db_path)
         cursor = conn.cursor()
 
+        # WALモード（データベースファイルに保存される）にして、同期中もクエリ変換側の読み取りを妨げないようにする
+        cursor.execute("PRAGMA journal_mode=WAL")
+
+        # 一括取り込み用の設定（索引はカタログCSVから再構築できるため、同期ごとのfsyncは省く）
+        cursor.execute("PRAGMA synchronous=OFF")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+
         # テーブルが存在しない場合は作成
         cursor.execute(
             """
             CREATE TABLE IF NOT EXISTS stats_tables (
-                stats_data_id TEXT PRIMARY KEY,
+                stats_data_id TEXT NOT NULL PRIMARY KEY,
                 table_name TEXT NOT NULL,
                 description TEXT,
                 organization TEXT,
@@ -44,70 +103,161 @@ class CatalogIntegrator:
         """
         )
 
-        # 既存のカタログファイルを検索
-        csv_files = list(self.catalog_dir.glob("*_combined_*.csv"))
+        # 分野での絞り込み用のインデックス
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_stats_tables_field_code ON stats_tables(field_code)"
+        )
+
+        # 以前の同期で作成していた全文検索用テーブルは検索に使わなくなったため削除する
+        cursor.execute("DROP TABLE IF EXISTS stats_tables_fts")
+
+        # 統計表とキーワードの対応表（クエリ変換でのキーワード検索に使う）
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS stats_keywords (
+                stats_data_id TEXT NOT NULL,
+                keyword TEXT NOT NULL,
+                PRIMARY KEY (stats_data_id, keyword)
+            ) WITHOUT ROWID
+        """
+        )
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_stats_keywords_keyword ON stats_keywords(keyword)"
+        )
+
+        # 既存のカタログファイルのうち最新のものを使用
+        latest_catalog = self._find_latest_catalog()
 
-        if csv_files:
-            # 最新のカタログファイルを使用
-            latest_catalog = max(csv_files, key=lambda x: x.stat().st_mtime)
+        if latest_catalog is not None:
             print(f"カタログファイルを読み込み中: {latest_catalog}")
 
-            catalog_df = pd.read_csv(latest_catalog)
+            # 同期に使う列だけを文字列として読み込む（IDの先頭の0を保持するため）
+            catalog_table = pacsv.read_csv(
+                latest_catalog,
+                convert_options=pacsv.ConvertOptions(
+                    include_columns=self.SYNC_COLUMNS,
+                    include_missing_columns=True,
+                    column_types=dict.fromkeys(self.SYNC_COLUMNS, pa.string()),
+                ),
+            )
+            catalog_df = catalog_table.to_pandas(types_mapper=pd.ArrowDtype)
+
+            # 統計表IDのない行は主キーで置き換えられず重複して溜まるため取り込まない
+            table_ids = catalog_df["TABLE_INF"]
+            has_id = (table_ids.notna() & (table_ids != "")).to_numpy(dtype=bool)
+            if not has_id.all():
+                print(f"⚠️ 統計表ID（TABLE_INF列）のない {int((~has_id).sum())} 件をスキップします")
+                catalog_df = catalog_df[has_id]
 
-            # データをMCPデータベース形式に変換
-            for _, row in catalog_df.iterrows():
-                # キーワードの生成（統計名とタイトルから）
-                keywords = self._extract_keywords(row.get("STAT_NAME", ""), row.get("TITLE", ""))
+            # キーワードの生成（統計名とタイトルから）は列全体でまとめて行う
+            keywords = self._extract_keywords_series(catalog_df["STAT_NAME"], catalog_df["TITLE"])
 
+            # データをMCPデータベース形式に変換して一括挿入（全件を1つのトランザクションで行う）
+            out_df = pd.DataFrame(
+                {column: catalog_df[col] for column, col in zip(self.DB_COLUMNS, self.SYNC_COLUMNS)}
+            ).assign(keywords=keywords)
+            out_df.to_sql(
+                "stats_tables",
+                conn,
+                if_exists="append",
+                index=False,
+                method=self._insert_or_replace,
+                chunksize=self.INSERT_CHUNK_SIZE,
+            )
+
+            # キーワードの対応表は同期後のキーワード列から作り直す
+            with conn:
+                # 統計表IDの制約がなかった頃に取り込まれた、IDのない行を取り除く
+                cursor.execute("DELETE FROM stats_tables WHERE stats_data_id IS NULL")
+                cursor.execute("DELETE FROM stats_keywords")
                 cursor.execute(
                     """
-                    INSERT OR REPLACE INTO stats_tables 
-                    (stats_data_id, table_name, description, organization, field_code, field_name, keywords)
-                    VALUES (?, ?, ?, ?, ?, ?, ?)
-                """,
-                    (
-                        row.get("TABLE_INF", ""),
-                        row.get("STAT_NAME", ""),
-                        row.get("TITLE", ""),
-                        row.get("GOV_ORG", ""),
-                        row.get("FIELD_CODE", ""),
-                        row.get("FIELD_NAME", ""),
-                        json.dumps(keywords),
-                    ),
+                    INSERT OR IGNORE INTO stats_keywords (stats_data_id, keyword)
+                    SELECT s.stats_data_id, k.value
+                    FROM stats_tables s, json_each(s.keywords) k
+                    WHERE s.keywords IS NOT NULL
+                """
                 )
 
-            conn.commit()
             print(f"データベースに {len(catalog_df)} 件のデータを同期しました")
 
         conn.close()
 
+    def _find_latest_catalog(self) -> Optional[Path]:
+        """カタログディレクトリから最新の統合カタログCSV（*_combined_*.csv）を探す"""
+        # ディレクトリを一度だけ走査し、各エントリのstat結果を使って更新日時を比べる
+        try:
+            with os.scandir(self.catalog_dir) as entries:
+                candidates = [
+                    (entry.stat().st_mtime, entry.path)
+                    for entry in entries
+                    if "_combined_" in entry.name
+                    and entry.name.endswith(".csv")
+                    and entry.is_file()
+                ]
+        except FileNotFoundError:
+            return None
+
+        if not candidates:
+            return None
+        return Path(max(candidates)[1])
+
+    @staticmethod
+    def _insert_or_replace(table, conn, keys: List[str], data_iter) -> None:
+        """DataFrame.to_sqlの挿入方法: 複数行をまとめてINSERT OR REPLACEする"""
+        rows = list(data_iter)
+        placeholders = "(" + ", ".join("?" * len(keys)) + ")"
+        conn.execute(
+            f"INSERT OR REPLACE INTO {table.name} ({', '.join(keys)}) VALUES "
+            + ", ".join([placeholders] * len(rows)),
+            [value for row in rows for value in row],
+        )
+
     def _extract_keywords(self, stat_name: str, title: str) -> List[str]:
         """統計名とタイトルからキーワードを抽出"""
-        keywords = []
         text = f"{stat_name} {title}".lower()
+        return [keyword for keyword, regex in self.KEYWORD_REGEXES.items() if regex.search(text)]
+
+    def _extract_keywords_series(self, stat_names: pd.Series, titles: pd.Series) -> List[str]:
+        """統計名とタイトルの列からキーワードを抽出し、行ごとのJSON文字列を返す"""
+        text = (stat_names.fillna("").astype(str) + " " + titles.fillna("").astype(str)).str.lower()
+
+        # キーワードごとの一致をビットとして1つの整数にまとめる
+        bits = np.zeros(len(text), dtype=np.int64)
+        keyword_names = list(self.KEYWORD_REGEXES)
+        for bit, regex in enumerate(self.KEYWORD_REGEXES.values()):
+            matched = text.str.contains(regex).to_numpy(dtype=bool)
+            bits |= matched.astype(np.int64) << bit
+
+        # 一致の組み合わせは限られるため、組み合わせごとに一度だけJSON化する
+        codes, uniques = pd.factorize(bits)
+        keyword_jsons = [
+            json.dumps(
+                [name for bit, name in enumerate(keyword_names) if combination >> bit & 1],
+                ensure_ascii=False,
+            )
+            for combination in uniques
+        ]
+        return [keyword_jsons[code] for code in codes]
+
+    def update_catalog_and_sync(self, force: bool = False):
+        """カタログを更新してMCPデータベースに同期
+
+        最新のカタログCSVがCATALOG_MAX_AGE_SECONDSより新しければダウンロードを省略する
+        （forceがTrueの場合は常にダウンロードする）。
+        """
+        latest_catalog = self._find_latest_catalog()
+        if (
+            not force
+            and latest_catalog is not None
+            and time.time() - latest_catalog.stat().st_mtime < self.CATALOG_MAX_AGE_SECONDS
+        ):
+            print(f"カタログは最新のためダウンロードを省略します: {latest_catalog}")
+            print("=== MCPデータベースへの同期開始 ===")
+            self.sync_catalog_to_mcp_db()
+            print("=== 統合完了 ===")
+            return
 
-        # 主要キーワードの辞書
-        keyword_patterns = {
-            "人口": ["人口", "国勢", "住民"],
-            "労働": ["労働", "雇用", "失業", "就業"],
-            "賃金": ["賃金", "給与", "所得"],
-            "物価": ["物価", "価格", "指数"],
-            "家計": ["家計", "消費", "支出"],
-            "企業": ["企業", "法人", "会社"],
-            "建設": ["建設", "建築", "住宅"],
-            "農業": ["農業", "農林", "作物"],
-            "工業": ["工業", "製造", "生産"],
-            "商業": ["商業", "小売", "卸売"],
-        }
-
-        for keyword, patterns in keyword_patterns.items():
-            if any(pattern in text for pattern in patterns):
-                keywords.append(keyword)
-
-        return keywords
-
-    def update_catalog_and_sync(self):
-        """カタログを更新してMCPデータベースに同期"""
         print("=== カタログの更新開始 ===")
 
         # カタログダウンローダーを実行
@@ -115,8 +265,8 @@ class CatalogIntegrator:
         all_catalog = downloader.download_all_stats_catalog(limit=1000)
 
         if not all_catalog.empty:
-            catalogs = downloader.classify_by_field(all_catalog)
-            downloader.save_catalogs(catalogs)
+            # 分野別のカタログは分類しながら順次保存する
+            downloader.save_catalogs(downloader.iter_classified(all_catalog))
 
             # MCPデータベースに同期
             print("=== MCPデータベースへの同期開始 ===")
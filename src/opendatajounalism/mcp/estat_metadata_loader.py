@@ -3,21 +3,91 @@ e-stat メタデータローダー
 実際のe-stat統計表情報とメタデータを取得・管理するモジュール
 """
 
+import hashlib
 import json
 import os
+import re
 import sqlite3
+import threading
+import time
 import xml.etree.ElementTree as ET
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
 from datetime import datetime
+from itertools import chain, groupby
+from operator import itemgetter
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple
+from typing import Any, ClassVar, Dict, Iterable, Iterator, List, Optional, Tuple
 
 import requests
 from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    from lxml import etree as lxml_etree
+except ImportError:  # lxml未導入の環境では標準ライブラリのプルパーサを使用
+    lxml_etree = None
 
 
 class EstatMetadataLoader:
     """e-stat統計表のメタデータを取得・管理するクラス"""
 
+    # XMLレスポンスをパーサに渡す際のチャンクサイズ（バイト）
+    STREAM_CHUNK_SIZE: ClassVar[int] = 64 * 1024
+
+    # APIレスポンスのキャッシュ有効期限（秒）
+    HTTP_CACHE_TTL_SECONDS: ClassVar[int] = 24 * 60 * 60
+
+    # e-statはエラー（appId不正・アクセス過多など）もHTTP 200で返し、RESULT/STATUSで区別する。
+    # 正常終了（0: 正常、1: 該当データなし、2: 一部の引数が無効）の場合だけレスポンスをキャッシュする
+    API_OK_STATUSES: ClassVar[frozenset] = frozenset({0, 1, 2})
+    API_STATUS_REGEX: ClassVar[re.Pattern[bytes]] = re.compile(rb"<STATUS>\s*(\d+)\s*</STATUS>")
+    API_ERROR_MSG_REGEX: ClassVar[re.Pattern[bytes]] = re.compile(
+        rb"<ERROR_MSG>([^<]*)</ERROR_MSG>"
+    )
+    # RESULT要素はレスポンスの先頭にあるため、STATUSを探すのはこのバイト数までとする
+    API_STATUS_SEARCH_BYTES: ClassVar[int] = 4096
+
+    # メタデータを並行取得する際の最大スレッド数と、HTTP接続プールの大きさ
+    MAX_FETCH_WORKERS: ClassVar[int] = 8
+    HTTP_POOL_SIZE: ClassVar[int] = 16
+
+    # メタデータを取得する優先統計表の最大件数
+    MAX_PRIORITY_TABLES: ClassVar[int] = 20
+
+    # TABLE_INFの子要素のうち保存に使うもの（タグ名 → 保存先のキー）
+    # テキストを使う要素と、code属性を使う要素をそれぞれ定義する
+    TABLE_TEXT_FIELDS: ClassVar[Dict[str, str]] = {
+        "GOV_ORG": "gov_org",
+        "STAT_NAME": "stat_name",
+        "TITLE": "title",
+        "CYCLE": "cycle",
+        "SURVEY_DATE": "survey_date",
+        "OPEN_DATE": "open_date",
+        "SMALL_AREA": "small_area",
+        "MAIN_CATEGORY": "main_category",
+        "SUB_CATEGORY": "sub_category",
+        "OVERALL_TOTAL_NUMBER": "overall_total_number",
+    }
+    TABLE_CODE_FIELDS: ClassVar[Dict[str, str]] = {
+        "STAT_NAME": "stat_id",
+        "MAIN_CATEGORY": "main_category_code",
+        "SUB_CATEGORY": "sub_category_code",
+    }
+
+    # SQLiteの接続設定（プリペアドステートメントのキャッシュ数、ページキャッシュ、mmapの大きさ）
+    SQLITE_CACHED_STATEMENTS: ClassVar[int] = 512
+    SQLITE_CACHE_SIZE_KIB: ClassVar[int] = 64 * 1024
+    SQLITE_MMAP_SIZE: ClassVar[int] = 256 * 1024 * 1024
+
+    # メタデータを優先取得する統計表のキーワード（人口・労働関連）
+    PRIORITY_KEYWORDS: ClassVar[List[str]] = ["人口", "労働", "世帯", "家計", "国勢"]
+    PRIORITY_KEYWORD_REGEX: ClassVar[re.Pattern[str]] = re.compile(
+        "|".join(map(re.escape, PRIORITY_KEYWORDS))
+    )
+
     def __init__(self, data_dir: str = "data/mcp"):
         load_dotenv()
         self.appid = os.getenv("ESTAT_APPID")
@@ -29,14 +99,76 @@ class EstatMetadataLoader:
 
         # メタデータキャッシュ用のデータベース
         self.metadata_db = self.data_dir / "estat_metadata.db"
+
+        # 接続はローダーの生存期間中1つを使い回す（並行取得のスレッドからも使えるようにする）
+        self._conn = sqlite3.connect(
+            self.metadata_db,
+            check_same_thread=False,
+            cached_statements=self.SQLITE_CACHED_STATEMENTS,
+        )
+        # 読み出し中心のOllama用エクスポートに備え、ページキャッシュを広げてmmapで読み込む
+        self._conn.execute(f"PRAGMA cache_size=-{self.SQLITE_CACHE_SIZE_KIB}")
+        self._conn.execute(f"PRAGMA mmap_size={self.SQLITE_MMAP_SIZE}")
+        # WALモードにして、全面更新の途中で失敗してもロールバックできるようにする
+        # （他の接続があって切り替えられない場合は現在のモードのまま続ける）
+        try:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+        except sqlite3.OperationalError:
+            pass
+        self._set_pragmas(bulk_loading=False)
         self._init_metadata_db()
 
+        # APIレスポンスのキャッシュ用ディレクトリ
+        self.http_cache_dir = self.data_dir / "http_cache"
+        self.http_cache_dir.mkdir(exist_ok=True)
+
         # e-stat API のベースURL
         self.api_base = "https://api.e-stat.go.jp/rest/3.0/app"
 
+        # 接続を使い回し、429/5xxは指数バックオフで再試行するセッション
+        self.session = requests.Session()
+        retry = Retry(
+            total=3,
+            backoff_factor=0.3,
+            status_forcelist=(429, 500, 502, 503, 504),
+            respect_retry_after_header=True,
+        )
+        adapter = HTTPAdapter(
+            pool_connections=self.HTTP_POOL_SIZE,
+            pool_maxsize=self.HTTP_POOL_SIZE,
+            max_retries=retry,
+        )
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def _set_pragmas(self, bulk_loading: bool):
+        """接続のPRAGMAを通常時または一括取り込み用に設定"""
+        if bulk_loading:
+            # リモートから再取得できるデータの全面更新中はfsyncを省く
+            # （ジャーナルは残し、更新に失敗した場合は元のキャッシュにロールバックする）
+            synchronous, temp_store = "OFF", "MEMORY"
+        else:
+            synchronous, temp_store = "NORMAL", "DEFAULT"
+
+        self._conn.execute(f"PRAGMA synchronous={synchronous}")
+        self._conn.execute(f"PRAGMA temp_store={temp_store}")
+
+    @contextmanager
+    def _bulk_load_mode(self):
+        """メタデータキャッシュの一括更新中だけ取り込み用のPRAGMAを有効にする"""
+        self._set_pragmas(bulk_loading=True)
+        try:
+            yield
+        finally:
+            self._set_pragmas(bulk_loading=False)
+
+    def close(self):
+        """メタデータ用データベースとの接続を閉じる"""
+        self._conn.close()
+
     def _init_metadata_db(self):
         """メタデータ用データベースの初期化"""
-        conn = sqlite3.connect(self.metadata_db)
+        conn = self._conn
         cursor = conn.cursor()
 
         # 統計表リストテーブル
@@ -62,6 +194,14 @@ class EstatMetadataLoader:
         """
         )
 
+        # カテゴリ順の一覧取得用のインデックス
+        cursor.execute(
+            """
+            CREATE INDEX IF NOT EXISTS idx_stats_tables_category
+            ON stats_tables(main_category_code, sub_category_code)
+        """
+        )
+
         # メタデータテーブル（各統計表の詳細軸情報）
         cursor.execute(
             """
@@ -93,124 +233,115 @@ class EstatMetadataLoader:
         )
 
         conn.commit()
-        conn.close()
 
-    def fetch_all_stats_tables(self, limit: int = 10000) -> List[Dict]:
-        """全統計表の基本情報を取得"""
+    def fetch_all_stats_tables(self, limit: int = 10000, use_cache: bool = True) -> Iterator[Dict]:
+        """全統計表の基本情報を取得
+
+        受信・解析した統計表から順に返すジェネレータで、全件をリストに保持しない。
+        受信や解析の途中で失敗した場合は例外をそのまま送出する
+        （呼び出し側が途中までの統計表で既存のデータを置き換えないようにするため）
+
+        Args:
+            limit: 取得する最大件数
+            use_cache: Falseならキャッシュ済みのレスポンスを使わずe-statから取得し直す
+        """
         print(f"📊 e-statから統計表リストを取得中（最大{limit}件）...")
 
-        try:
-            url = f"{self.api_base}/getStatsList"
-            params = {
-                "appId": self.appid,
-                "limit": limit,
-                "searchWord": "",  # 検索語なしで全統計表を取得
-                "collect": "Y",  # 収集済みデータのみ
-            }
+        url = f"{self.api_base}/getStatsList"
+        params = {
+            "appId": self.appid,
+            "limit": limit,
+            "searchWord": "",  # 検索語なしで全統計表を取得
+            "collect": "Y",  # 収集済みデータのみ
+        }
 
-            response = requests.get(url, params=params, timeout=60)
-            response.raise_for_status()
+        chunks = self._iter_response_chunks(url, params, timeout=60, use_cache=use_cache)
+
+        # XMLレスポンスを受信しながらTABLE_INF要素を1件ずつ解析
+        count = 0
+        updated_date = datetime.now().isoformat()
+
+        text_fields = self.TABLE_TEXT_FIELDS
+        code_fields = self.TABLE_CODE_FIELDS
+        empty_table = dict.fromkeys([*text_fields.values(), *code_fields.values()], "")
+
+        for table_inf in self._iter_elements(chunks, "TABLE_INF"):
+            # 統計表IDはTABLE_INFのid属性、その他は必要な子要素のテキストとcode属性だけを読む
+            processed_table = {"table_id": table_inf.get("id", ""), **empty_table}
+            for child in table_inf:
+                tag = child.tag
+                if tag in text_fields:
+                    processed_table[text_fields[tag]] = child.text or ""
+                if tag in code_fields:
+                    processed_table[code_fields[tag]] = child.get("code", "")
+
+            # データベース保存用に型を整える
+            processed_table["small_area"] = 1 if processed_table["small_area"] == "1" else 0
+            overall_total_number = processed_table["overall_total_number"]
+            processed_table["overall_total_number"] = (
+                int(overall_total_number) if overall_total_number else 0
+            )
+            processed_table["updated_date"] = updated_date
 
-            # XMLレスポンスを解析
-            root = ET.fromstring(response.text)
-
-            # DATALIST_INF要素を探す
-            datalist_inf = root.find(".//DATALIST_INF")
-            if datalist_inf is None:
-                print("統計データが見つかりませんでした")
-                return []
-
-            # TABLE_INF要素からデータを抽出
-            table_infos = datalist_inf.findall("TABLE_INF")
-            stats_tables = []
-
-            for table_inf in table_infos:
-                table_data = {}
-                for child in table_inf:
-                    table_data[child.tag] = child.text if child.text else ""
-
-                # データベース保存用に整理
-                processed_table = {
-                    "table_id": table_data.get("TABLE_INF", ""),
-                    "stat_id": table_data.get("STAT_NAME_CODE", ""),
-                    "gov_org": table_data.get("GOV_ORG", ""),
-                    "stat_name": table_data.get("STAT_NAME", ""),
-                    "title": table_data.get("TITLE", ""),
-                    "cycle": table_data.get("CYCLE", ""),
-                    "survey_date": table_data.get("SURVEY_DATE", ""),
-                    "open_date": table_data.get("OPEN_DATE", ""),
-                    "small_area": 1 if table_data.get("SMALL_AREA") == "1" else 0,
-                    "main_category_code": table_data.get("MAIN_CATEGORY_CODE", ""),
-                    "main_category": table_data.get("MAIN_CATEGORY", ""),
-                    "sub_category_code": table_data.get("SUB_CATEGORY_CODE", ""),
-                    "sub_category": table_data.get("SUB_CATEGORY", ""),
-                    "overall_total_number": (
-                        int(table_data.get("OVERALL_TOTAL_NUMBER", 0))
-                        if table_data.get("OVERALL_TOTAL_NUMBER")
-                        else 0
-                    ),
-                    "updated_date": datetime.now().isoformat(),
-                }
+            count += 1
+            yield processed_table
 
-                stats_tables.append(processed_table)
+        if not count:
+            print("統計データが見つかりませんでした")
+            return
 
-            print(f"✅ {len(stats_tables)}件の統計表情報を取得しました")
-            return stats_tables
+        print(f"✅ {count}件の統計表情報を取得しました")
 
-        except Exception as e:
-            print(f"統計表リスト取得エラー: {e}")
-            return []
+    def fetch_table_metadata(
+        self, table_id: str, verbose: bool = True, use_cache: bool = True
+    ) -> Dict:
+        """特定統計表のメタデータ（軸情報）を取得
 
-    def fetch_table_metadata(self, table_id: str) -> Dict:
-        """特定統計表のメタデータ（軸情報）を取得"""
-        print(f"🔍 統計表 {table_id} のメタデータを取得中...")
+        Args:
+            table_id: 統計表ID
+            verbose: Falseなら取得開始の表示を省く（エラーは常に表示）
+            use_cache: Falseならキャッシュ済みのレスポンスを使わずe-statから取得し直す
+        """
+        if verbose:
+            print(f"🔍 統計表 {table_id} のメタデータを取得中...")
 
         try:
             url = f"{self.api_base}/getMetaInfo"
             params = {"appId": self.appid, "statsDataId": table_id}
 
-            response = requests.get(url, params=params, timeout=30)
-            response.raise_for_status()
-
-            # XMLレスポンスを解析
-            root = ET.fromstring(response.text)
+            chunks = self._iter_response_chunks(url, params, timeout=30, use_cache=use_cache)
 
             metadata = {"table_id": table_id, "class_objects": [], "class_values": {}}
 
-            # CLASS_INF要素を探す
-            class_infs = root.findall(".//CLASS_INF")
-
-            for class_inf in class_infs:
-                class_obj = {}
-
-                # CLASS_OBJ要素の情報
-                class_obj_elem = class_inf.find("CLASS_OBJ")
-                if class_obj_elem is not None:
-                    class_obj["id"] = class_obj_elem.get("id", "")
-                    class_obj["name"] = class_obj_elem.get("name", "")
+            # XMLレスポンスを受信しながらCLASS_OBJ要素（分類事項）を1件ずつ解析し、
+            # 子要素のCLASS（分類の値）は1回の走査で値一覧と代表値の両方に使う
+            for class_obj_elem in self._iter_elements(chunks, "CLASS_OBJ"):
+                class_obj = {
+                    "id": class_obj_elem.get("id", ""),
+                    "name": class_obj_elem.get("name", ""),
+                }
 
-                    # CLASS要素の情報
-                    class_elem = class_obj_elem.find("CLASS")
-                    if class_elem is not None:
+                class_values = []
+                for class_elem in class_obj_elem:
+                    if class_elem.tag != "CLASS":
+                        continue
+                    class_values.append(
+                        {
+                            "code": class_elem.get("code", ""),
+                            "name": class_elem.get("name", ""),
+                            "level": class_elem.get("level", ""),
+                            "parent_code": class_elem.get("parentCode", ""),
+                        }
+                    )
+
+                    # 先頭のCLASS要素を分類事項の代表値とする
+                    if len(class_values) == 1:
                         class_obj["class_name"] = class_elem.get("name", "")
                         class_obj["level"] = class_elem.get("level", "")
                         class_obj["unit"] = class_elem.get("unit", "")
 
-                # CLASS_VALUE要素の値一覧
-                class_values = []
-                class_value_elems = class_inf.findall(".//CLASS_VALUE")
-
-                for class_value in class_value_elems:
-                    value_info = {
-                        "code": class_value.get("code", ""),
-                        "name": class_value.get("name", ""),
-                        "level": class_value.get("level", ""),
-                        "parent_code": class_value.get("parentCode", ""),
-                    }
-                    class_values.append(value_info)
-
                 metadata["class_objects"].append(class_obj)
-                metadata["class_values"][class_obj.get("id", "")] = class_values
+                metadata["class_values"][class_obj["id"]] = class_values
 
             return metadata
 
@@ -218,57 +349,200 @@ class EstatMetadataLoader:
             print(f"メタデータ取得エラー（{table_id}）: {e}")
             return {}
 
-    def save_stats_tables_to_db(self, stats_tables: List[Dict]):
-        """統計表リストをデータベースに保存"""
-        conn = sqlite3.connect(self.metadata_db)
-        cursor = conn.cursor()
+    def _iter_response_chunks(
+        self, url: str, params: Dict, timeout: int, use_cache: bool = True
+    ) -> Iterator[bytes]:
+        """
+        APIのXMLレスポンスをチャンク単位で返す
+
+        同じURL・パラメータのレスポンスはhttp_cacheディレクトリに保存し、
+        HTTP_CACHE_TTL_SECONDS以内であればe-statに問い合わせずに再利用する。
+        期限切れの場合もETag/Last-Modifiedが保存されていれば条件付きリクエストを送り、
+        304 Not Modifiedが返ればキャッシュを再利用する。
+        RESULT/STATUSがエラーを示すレスポンスはキャッシュせず、読み終えた時点で例外を送出する。
+        use_cacheがFalseの場合はキャッシュを使わずに取得し、結果でキャッシュを置き換える。
+        """
+        cache_key = hashlib.sha1(f"{url}?{sorted(params.items())}".encode("utf-8")).hexdigest()
+        cache_path = self.http_cache_dir / f"{cache_key}.xml"
+        validators_path = cache_path.with_suffix(".json")
+
+        headers = {}
+        if use_cache:
+            try:
+                if time.time() - cache_path.stat().st_mtime < self.HTTP_CACHE_TTL_SECONDS:
+                    yield from self._iter_file_chunks(cache_path)
+                    return
+                validators = json.loads(validators_path.read_text(encoding="utf-8"))
+                if validators.get("etag"):
+                    headers["If-None-Match"] = validators["etag"]
+                if validators.get("last_modified"):
+                    headers["If-Modified-Since"] = validators["last_modified"]
+            except (FileNotFoundError, ValueError):
+                pass
+
+        # 本文は受信しながらパーサに渡す（response.textで全体をバッファしない）。
+        # 解析が途中で失敗しても接続をプールに返せるよう、レスポンスは必ず閉じる
+        with self.session.get(
+            url, params=params, headers=headers, timeout=timeout, stream=True
+        ) as response:
+            if response.status_code == 304 and headers:
+                # 変更がなければキャッシュの有効期限を延ばしてそのまま再利用する
+                os.utime(cache_path)
+                yield from self._iter_file_chunks(cache_path)
+                return
+            response.raise_for_status()
 
-        for table in stats_tables:
-            cursor.execute(
-                """
-                INSERT OR REPLACE INTO stats_tables 
-                (table_id, stat_id, gov_org, stat_name, title, cycle, survey_date, 
-                 open_date, small_area, main_category_code, main_category, 
-                 sub_category_code, sub_category, overall_total_number, updated_date)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """,
-                (
-                    table["table_id"],
-                    table["stat_id"],
-                    table["gov_org"],
-                    table["stat_name"],
-                    table["title"],
-                    table["cycle"],
-                    table["survey_date"],
-                    table["open_date"],
-                    table["small_area"],
-                    table["main_category_code"],
-                    table["main_category"],
-                    table["sub_category_code"],
-                    table["sub_category"],
-                    table["overall_total_number"],
-                    table["updated_date"],
-                ),
+            # 受信しながら一時ファイルに書き出し、最後まで受信できて、かつe-statが
+            # 正常終了を返した場合のみキャッシュとして確定する
+            tmp_path = cache_path.with_name(f"{cache_key}.{threading.get_ident()}.tmp")
+            head = b""
+            try:
+                with open(tmp_path, "wb") as f:
+                    for chunk in response.iter_content(chunk_size=self.STREAM_CHUNK_SIZE):
+                        f.write(chunk)
+                        if len(head) < self.API_STATUS_SEARCH_BYTES:
+                            head += chunk
+                        yield chunk
+                status = self._api_status(head)
+                if status not in self.API_OK_STATUSES:
+                    error_msg = self.API_ERROR_MSG_REGEX.search(head)
+                    message = error_msg.group(1).decode("utf-8", "replace") if error_msg else ""
+                    raise RuntimeError(f"e-stat APIエラー（STATUS {status}）: {message}")
+                os.replace(tmp_path, cache_path)
+            finally:
+                tmp_path.unlink(missing_ok=True)
+
+            # 次回の条件付きリクエスト用に検証子を保存する
+            validators = {
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+            }
+            if any(validators.values()):
+                validators_path.write_text(json.dumps(validators), encoding="utf-8")
+            else:
+                validators_path.unlink(missing_ok=True)
+
+    @classmethod
+    def _api_status(cls, head: bytes) -> Optional[int]:
+        """レスポンス先頭のRESULT/STATUSの値（見つからなければNone）"""
+        match = cls.API_STATUS_REGEX.search(head)
+        return int(match.group(1)) if match else None
+
+    def _iter_file_chunks(self, path: Path) -> Iterator[bytes]:
+        """キャッシュ済みレスポンスをチャンク単位で読み出す"""
+        with open(path, "rb") as f:
+            yield from iter(lambda: f.read(self.STREAM_CHUNK_SIZE), b"")
+
+    @staticmethod
+    def _iter_elements(chunks: Iterable[bytes], tag: str) -> Iterator[Any]:
+        """
+        XMLのチャンク列から指定タグの要素を1件ずつ取り出す
+
+        受信したチャンクを順次プルパーサに渡すため、レスポンス全体の受信を
+        待たずに解析を始められる。呼び出し側が読み終えた要素は解放し、
+        ツリー全体がメモリ上に残らないようにする。
+        """
+        if lxml_etree is not None:
+            parser = lxml_etree.XMLPullParser(events=("end",), tag=tag)
+        else:
+            parser = ET.XMLPullParser(events=("end",))
+
+        for chunk in chunks:
+            parser.feed(chunk)
+            for _, elem in parser.read_events():
+                if elem.tag != tag:
+                    continue
+                yield elem
+                elem.clear()
+                if lxml_etree is not None:
+                    while elem.getprevious() is not None:
+                        del elem.getparent()[0]
+
+        parser.close()
+
+    def save_stats_tables_to_db(self, stats_tables: Iterable[Dict], upsert: bool = True) -> int:
+        """統計表リストをデータベースに保存
+
+        Args:
+            stats_tables: 保存する統計表情報（リストのほか、fetch_all_stats_tablesのジェネレータも可）
+            upsert: Trueなら既存の行を置き換える。全面更新で既存行を削除済みの場合はFalse
+
+        Returns:
+            保存した件数
+        """
+        # 全件を1つのトランザクションでまとめて挿入
+        with self._conn:
+            saved = self._insert_stats_tables(stats_tables, upsert)
+        print(f"💾 {saved}件をデータベースに保存しました")
+        return saved
+
+    def _insert_stats_tables(self, stats_tables: Iterable[Dict], upsert: bool) -> int:
+        """統計表リストを挿入し、挿入した件数を返す（コミットは呼び出し側で行う）"""
+        insert = "INSERT OR REPLACE" if upsert else "INSERT"
+        # 行タプルはexecutemanyが読み進めるのに合わせて1件ずつ生成する
+        rows = (
+            (
+                table["table_id"],
+                table["stat_id"],
+                table["gov_org"],
+                table["stat_name"],
+                table["title"],
+                table["cycle"],
+                table["survey_date"],
+                table["open_date"],
+                table["small_area"],
+                table["main_category_code"],
+                table["main_category"],
+                table["sub_category_code"],
+                table["sub_category"],
+                table["overall_total_number"],
+                table["updated_date"],
             )
+            for table in stats_tables
+        )
 
-        conn.commit()
-        conn.close()
-        print(f"💾 {len(stats_tables)}件をデータベースに保存しました")
+        cursor = self._conn.cursor()
+        cursor.executemany(
+            f"""
+            {insert} INTO stats_tables 
+            (table_id, stat_id, gov_org, stat_name, title, cycle, survey_date, 
+             open_date, small_area, main_category_code, main_category, 
+             sub_category_code, sub_category, overall_total_number, updated_date)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+            rows,
+        )
+        return cursor.rowcount
 
-    def save_table_metadata_to_db(self, metadata: Dict):
-        """統計表メタデータをデータベースに保存"""
-        table_id = metadata["table_id"]
-        conn = sqlite3.connect(self.metadata_db)
-        cursor = conn.cursor()
+    def save_table_metadata_to_db(self, metadata: Dict, upsert: bool = True):
+        """統計表メタデータをデータベースに保存
 
-        # メタデータテーブルに保存
-        for class_obj in metadata.get("class_objects", []):
-            cursor.execute(
-                """
-                INSERT OR REPLACE INTO table_metadata 
-                (table_id, class_obj_id, class_obj_name, class_name, level, unit)
-                VALUES (?, ?, ?, ?, ?, ?)
-            """,
+        Args:
+            metadata: fetch_table_metadataが返すメタデータ
+            upsert: Trueなら既存の行を置き換える。全面更新で既存行を削除済みの場合はFalse
+        """
+        self.save_table_metadata_list_to_db([metadata], upsert=upsert)
+        print(f"💾 統計表 {metadata['table_id']} のメタデータを保存しました")
+
+    def save_table_metadata_list_to_db(self, metadata_list: Iterable[Dict], upsert: bool = True):
+        """複数の統計表メタデータを1つのトランザクションでまとめて保存
+
+        Args:
+            metadata_list: fetch_table_metadataが返すメタデータの並び
+            upsert: Trueなら既存の行を置き換える。全面更新で既存行を削除済みの場合はFalse
+        """
+        # メタデータテーブルとクラス値テーブルを1つのトランザクションで保存
+        with self._conn:
+            self._insert_table_metadata(metadata_list, upsert)
+
+    def _insert_table_metadata(self, metadata_list: Iterable[Dict], upsert: bool):
+        """統計表メタデータを挿入（コミットは呼び出し側で行う）"""
+        insert = "INSERT OR REPLACE" if upsert else "INSERT"
+        class_obj_rows = []
+        class_value_rows = []
+        for metadata in metadata_list:
+            table_id = metadata["table_id"]
+            class_obj_rows.extend(
                 (
                     table_id,
                     class_obj.get("id", ""),
@@ -276,113 +550,106 @@ class EstatMetadataLoader:
                     class_obj.get("class_name", ""),
                     class_obj.get("level", ""),
                     class_obj.get("unit", ""),
-                ),
+                )
+                for class_obj in metadata.get("class_objects", [])
             )
-
-        # クラス値テーブルに保存
-        for class_obj_id, class_values in metadata.get("class_values", {}).items():
-            for value in class_values:
-                cursor.execute(
-                    """
-                    INSERT OR REPLACE INTO class_values 
-                    (table_id, class_obj_id, class_code, class_name, level, parent_code)
-                    VALUES (?, ?, ?, ?, ?, ?)
-                """,
-                    (
-                        table_id,
-                        class_obj_id,
-                        value.get("code", ""),
-                        value.get("name", ""),
-                        value.get("level", ""),
-                        value.get("parent_code", ""),
-                    ),
+            class_value_rows.extend(
+                (
+                    table_id,
+                    class_obj_id,
+                    value.get("code", ""),
+                    value.get("name", ""),
+                    value.get("level", ""),
+                    value.get("parent_code", ""),
                 )
+                for class_obj_id, class_values in metadata.get("class_values", {}).items()
+                for value in class_values
+            )
 
-        conn.commit()
-        conn.close()
-        print(f"💾 統計表 {table_id} のメタデータを保存しました")
+        cursor = self._conn.cursor()
+        cursor.executemany(
+            f"""
+            {insert} INTO table_metadata 
+            (table_id, class_obj_id, class_obj_name, class_name, level, unit)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """,
+            class_obj_rows,
+        )
+        cursor.executemany(
+            f"""
+            {insert} INTO class_values 
+            (table_id, class_obj_id, class_code, class_name, level, parent_code)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """,
+            class_value_rows,
+        )
 
     def load_all_stats_for_ollama(self) -> Dict:
         """Ollama用に全統計表情報を整理して返す"""
-        conn = sqlite3.connect(self.metadata_db)
+        # カテゴリ別に整理
+        categorized = defaultdict(lambda: defaultdict(list))
+        table_count = 0
+        for main_category, sub_category, table_info in self._iter_ollama_tables():
+            categorized[main_category][sub_category].append(table_info)
+            table_count += 1
+
+        return {
+            "统计表总数": table_count,
+            "最新更新": datetime.now().strftime("%Y-%m-%d"),
+            "分类统计表": {main: dict(subs) for main, subs in categorized.items()},
+        }
+
+    def _iter_ollama_tables(self) -> Iterator[Tuple[str, str, Dict]]:
+        """統計表ごとに（大分類, 小分類, Ollama用の統計表情報）をカテゴリ順に返す"""
+        conn = self._conn
         cursor = conn.cursor()
+        cursor.row_factory = sqlite3.Row
 
-        # 統計表基本情報を取得
+        # 統計表基本情報と軸情報をJOINで1回のクエリにまとめ、統計表ID順に並べて取得する
         cursor.execute(
             """
-            SELECT table_id, stat_name, title, main_category, sub_category, 
-                   gov_org, survey_date, overall_total_number
-            FROM stats_tables
-            ORDER BY main_category_code, sub_category_code
+            SELECT s.table_id, s.stat_name, s.title, s.main_category, s.sub_category,
+                   s.gov_org, s.survey_date, s.overall_total_number,
+                   m.class_obj_id AS axis_id, m.class_obj_name AS axis_name,
+                   m.class_name AS axis_class, m.unit AS axis_unit
+            FROM stats_tables s
+            LEFT JOIN table_metadata m ON s.table_id = m.table_id
+            ORDER BY s.main_category_code, s.sub_category_code, s.table_id
         """
         )
 
-        stats_tables = cursor.fetchall()
-
-        # カテゴリ別に整理
-        ollama_data = {
-            "统计表总数": len(stats_tables),
-            "最新更新": datetime.now().strftime("%Y-%m-%d"),
-            "分类统计表": {},
-        }
-
-        for table in stats_tables:
-            (
-                table_id,
-                stat_name,
-                title,
-                main_category,
-                sub_category,
-                gov_org,
-                survey_date,
-                total_num,
-            ) = table
-
-            if main_category not in ollama_data["分类统计表"]:
-                ollama_data["分类统计表"][main_category] = {}
-
-            if sub_category not in ollama_data["分类统计表"][main_category]:
-                ollama_data["分类统计表"][main_category][sub_category] = []
-
-            # 軸情報も取得
-            cursor.execute(
-                """
-                SELECT class_obj_id, class_obj_name, class_name, unit
-                FROM table_metadata
-                WHERE table_id = ?
-            """,
-                (table_id,),
-            )
-
-            axes_info = cursor.fetchall()
-            axes = {}
-            for axis in axes_info:
-                axis_id, axis_name, class_name, unit = axis
-                axes[axis_id] = {
-                    "name": axis_name,
-                    "class": class_name,
-                    "unit": unit if unit else "",
+        # 統計表ごとの行はgroupbyで1つにまとめる
+        for table_id, rows in groupby(cursor, key=itemgetter("table_id")):
+            first = next(rows)
+            axes = {
+                row["axis_id"]: {
+                    "name": row["axis_name"],
+                    "class": row["axis_class"],
+                    "unit": row["axis_unit"] or "",
                 }
-
-            table_info = {
-                "统计表ID": table_id,
-                "统计名称": stat_name,
-                "表标题": title,
-                "实施机关": gov_org,
-                "调查日期": survey_date,
-                "数据总数": total_num,
-                "可用轴": axes,
+                for row in chain((first,), rows)
+                if row["axis_id"] is not None
             }
 
-            ollama_data["分类统计表"][main_category][sub_category].append(table_info)
-
-        conn.close()
-        return ollama_data
+            yield (
+                first["main_category"],
+                first["sub_category"],
+                {
+                    "统计表ID": table_id,
+                    "统计名称": first["stat_name"],
+                    "表标题": first["title"],
+                    "实施机关": first["gov_org"],
+                    "调查日期": first["survey_date"],
+                    "数据总数": first["overall_total_number"],
+                    "可用轴": axes,
+                },
+            )
 
     def get_table_axis_details(self, table_id: str) -> Dict:
         """特定統計表の軸詳細情報を取得"""
-        conn = sqlite3.connect(self.metadata_db)
+        conn = self._conn
         cursor = conn.cursor()
+        cursor.row_factory = sqlite3.Row
 
         # 軸情報を取得
         cursor.execute(
@@ -398,7 +665,7 @@ class EstatMetadataLoader:
         axis_details = {}
 
         for axis in axes:
-            axis_id, axis_name, class_name, unit = axis
+            axis_id = axis["class_obj_id"]
 
             # 該当軸の値一覧を取得
             cursor.execute(
@@ -411,51 +678,103 @@ class EstatMetadataLoader:
                 (table_id, axis_id),
             )
 
-            values = cursor.fetchall()
-            value_list = []
-            for value in values:
-                code, name, level, parent = value
-                value_list.append({"code": code, "name": name, "level": level, "parent": parent})
+            value_list = [
+                {
+                    "code": value["class_code"],
+                    "name": value["class_name"],
+                    "level": value["level"],
+                    "parent": value["parent_code"],
+                }
+                for value in cursor
+            ]
 
             axis_details[axis_id] = {
-                "axis_name": axis_name,
-                "class_name": class_name,
-                "unit": unit,
+                "axis_name": axis["class_obj_name"],
+                "class_name": axis["class_name"],
+                "unit": axis["unit"],
                 "values": value_list,
             }
 
-        conn.close()
         return axis_details
 
-    def update_metadata_cache(self, max_tables: int = 100):
-        """メタデータキャッシュの更新"""
+    def update_metadata_cache(self, max_tables: int = 100, use_cache: bool = True):
+        """メタデータキャッシュの更新
+
+        統計表リストの取得に失敗した場合は既存のキャッシュを残したまま例外を送出する
+
+        Args:
+            max_tables: 取得する統計表の最大件数
+            use_cache: FalseならAPIレスポンスのキャッシュを使わずe-statから取得し直す
+        """
         print("🔄 e-stat メタデータキャッシュを更新中...")
 
-        # 1. 統計表リストを取得・保存
-        stats_tables = self.fetch_all_stats_tables(limit=max_tables)
-        if stats_tables:
-            self.save_stats_tables_to_db(stats_tables)
+        with self._bulk_load_mode():
+            self._refresh_metadata_cache(max_tables, use_cache)
 
-        # 2. 主要統計表のメタデータを取得（人口・労働関連優先）
-        priority_keywords = ["人口", "労働", "世帯", "家計", "国勢"]
-        priority_tables = []
+        # 更新後の統計情報をクエリプランナーに反映
+        self._conn.execute("ANALYZE")
+
+        print("✅ メタデータキャッシュの更新が完了しました")
 
-        for table in stats_tables:
-            if any(
-                keyword in table.get("stat_name", "") or keyword in table.get("title", "")
-                for keyword in priority_keywords
-            ):
-                priority_tables.append(table["table_id"])
+    def _refresh_metadata_cache(self, max_tables: int, use_cache: bool):
+        """統計表リストと優先統計表のメタデータを取得して保存
 
-        print(f"🎯 優先統計表 {len(priority_tables[:20])}件のメタデータを取得中...")
+        既存行の削除から保存までを1つのトランザクションで行い、統計表リストの受信が
+        途中で失敗した場合は既存のキャッシュにロールバックする。
+        """
+        # 1. 統計表リストを取得・保存（受信しながらそのままデータベースへ流し込む）
+        stats_tables = self.fetch_all_stats_tables(limit=max_tables, use_cache=use_cache)
+        first_table = next(stats_tables, None)
+        if first_table is None:
+            # 統計表が1件もない場合は既存のキャッシュを残す
+            return
+
+        # 2. 保存と同じ走査で主要統計表を拾っておく（人口・労働関連優先）
+        priority_regex = self.PRIORITY_KEYWORD_REGEX
+        priority_tables = []
 
-        for i, table_id in enumerate(priority_tables[:20]):  # 上位20件のみ
-            print(f"  {i + 1}/20: {table_id}")
-            metadata = self.fetch_table_metadata(table_id)
-            if metadata:
-                self.save_table_metadata_to_db(metadata)
+        def collect_priority(tables: Iterable[Dict]) -> Iterator[Dict]:
+            for table in tables:
+                if priority_regex.search(table.get("stat_name", "")) or priority_regex.search(
+                    table.get("title", "")
+                ):
+                    priority_tables.append(table["table_id"])
+                yield table
+
+        with self._conn:
+            # 全面更新のため既存の行を削除し、重複のない状態から通常のINSERTで保存する
+            for table in ("stats_tables", "table_metadata", "class_values"):
+                self._conn.execute(f"DELETE FROM {table}")
+
+            saved = self._insert_stats_tables(
+                collect_priority(chain((first_table,), stats_tables)), upsert=False
+            )
+            print(f"💾 {saved}件をデータベースに保存しました")
+
+            # 同じ統計表のメタデータを二重に保存しないよう重複を除く
+            priority_tables = list(dict.fromkeys(priority_tables))[: self.MAX_PRIORITY_TABLES]
+            print(f"🎯 優先統計表 {len(priority_tables)}件のメタデータを取得中...")
+
+            # 各統計表の取得は待ち時間が大半のためスレッドで並行に行う
+            # 進捗はスレッドごとに表示せず、メインスレッドから1件につき1行だけ出力する
+            fetched_metadata = []
+            with ThreadPoolExecutor(max_workers=self.MAX_FETCH_WORKERS) as executor:
+                futures = {
+                    executor.submit(
+                        self.fetch_table_metadata, table_id, verbose=False, use_cache=use_cache
+                    ): table_id
+                    for table_id in priority_tables
+                }
+                for i, future in enumerate(as_completed(futures)):
+                    metadata = future.result()
+                    if metadata:
+                        fetched_metadata.append(metadata)
+                    status = "✅ 取得" if metadata else "⚠️ 取得失敗"
+                    print(f"  {i + 1}/{len(priority_tables)}: {futures[future]} {status}")
 
-        print("✅ メタデータキャッシュの更新が完了しました")
+            # 取得できたメタデータは全件まとめて同じトランザクションで保存する
+            self._insert_table_metadata(fetched_metadata, upsert=False)
+            print(f"💾 {len(fetched_metadata)}件の統計表メタデータを保存しました")
 
 
 def main():
@@ -477,6 +796,8 @@ def main():
     for category, subcategories in list(ollama_data["分类统计表"].items())[:3]:
         print(f"  📊 {category}: {sum(len(tables) for tables in subcategories.values())}件")
 
+    loader.close()
+
 
 if __name__ == "__main__":
     main()
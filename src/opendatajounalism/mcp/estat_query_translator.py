@@ -3,17 +3,29 @@ e-stat AI Query Translator MCP
 自然言語の要望をe-stat APIパラメータに変換するメイン機能
 """
 
+import copy
 import json
+import os
 import re
 import sqlite3
-from dataclasses import dataclass
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field, replace
+from functools import lru_cache
+from itertools import chain, islice
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple
+from typing import ClassVar, Collection, Dict, Iterator, List, Optional, Tuple
 
+import numpy as np
 import pandas as pd
 
+try:
+    import ahocorasick
+except ImportError:  # pyahocorasick未導入の環境では正規表現で照合
+    ahocorasick = None
 
-@dataclass
+
+@dataclass(slots=True, frozen=True)
 class QueryResult:
     """クエリ変換結果"""
 
@@ -22,14 +34,10 @@ class QueryResult:
     description: str
     confidence_score: float
     table_name: str
-    alternative_suggestions: List["QueryResult"] = None
-
-    def __post_init__(self):
-        if self.alternative_suggestions is None:
-            self.alternative_suggestions = []
+    alternative_suggestions: List["QueryResult"] = field(default_factory=list)
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class EntitySet:
     """抽出されたエンティティ情報"""
 
@@ -37,15 +45,219 @@ class EntitySet:
     time_periods: List[str]
     categories: List[str]
     statistical_items: List[str]
+    # regionsと同じ並びの地域コード
+    region_codes: List[str] = field(default_factory=list)
 
 
 class EstatQueryTranslator:
     """e-stat自然言語クエリ変換器"""
 
-    def __init__(self, data_dir: Optional[Path] = None, use_ollama: bool = True):
+    # クエリ中の年（例: 2020年）
+    YEAR_PATTERN: ClassVar[re.Pattern[str]] = re.compile(r"(\d{4})年?")
+
+    # 分類・時期の手がかりとなる語（語 → 分類）。分類は定義順に返す
+    CATEGORY_TRIGGERS: ClassVar[Dict[str, str]] = {
+        "年齢": "age",
+        "年代": "age",
+        "男女": "gender",
+        "性別": "gender",
+        "産業": "industry",
+        "業種": "industry",
+    }
+    LATEST_TRIGGERS: ClassVar[Tuple[str, ...]] = ("最新", "最近")
+
+    # 信頼度の重み（統計項目の一致率、地域の対応、地域指定なしの場合の点、分類の有無）
+    CONFIDENCE_WEIGHTS: ClassVar[Dict[str, float]] = {
+        "items": 0.6,
+        "area": 0.3,
+        "no_area": 0.2,
+        "categories": 0.1,
+    }
+
+    # 統計表情報として読み込むstats_tablesの列
+    TABLE_INFO_COLUMNS: ClassVar[str] = (
+        "stats_data_id, table_name, description, organization, field_code, field_name, "
+        "keywords, available_areas, categories"
+    )
+
+    # 検索用データベースの接続ごとに設定するPRAGMA
+    SQLITE_PRAGMAS: ClassVar[Dict[str, str]] = {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "temp_store": "MEMORY",
+        "cache_size": "-20000",
+        "mmap_size": str(256 * 1024 * 1024),
+    }
+
+    # ルールベース変換結果を保持する件数（古いものから破棄）
+    TRANSLATION_CACHE_SIZE: ClassVar[int] = 256
+
+    # 地域コードマッピング
+    AREA_MAPPINGS: ClassVar[Dict[str, str]] = {
+        "全国": "00000",
+        "北海道": "01000",
+        "青森": "02000",
+        "青森県": "02000",
+        "岩手": "03000",
+        "岩手県": "03000",
+        "宮城": "04000",
+        "宮城県": "04000",
+        "秋田": "05000",
+        "秋田県": "05000",
+        "山形": "06000",
+        "山形県": "06000",
+        "福島": "07000",
+        "福島県": "07000",
+        "茨城": "08000",
+        "茨城県": "08000",
+        "栃木": "09000",
+        "栃木県": "09000",
+        "群馬": "10000",
+        "群馬県": "10000",
+        "埼玉": "11000",
+        "埼玉県": "11000",
+        "千葉": "12000",
+        "千葉県": "12000",
+        "東京": "13000",
+        "東京都": "13000",
+        "神奈川": "14000",
+        "神奈川県": "14000",
+        "新潟": "15000",
+        "新潟県": "15000",
+        "富山": "16000",
+        "富山県": "16000",
+        "石川": "17000",
+        "石川県": "17000",
+        "福井": "18000",
+        "福井県": "18000",
+        "山梨": "19000",
+        "山梨県": "19000",
+        "長野": "20000",
+        "長野県": "20000",
+        "岐阜": "21000",
+        "岐阜県": "21000",
+        "静岡": "22000",
+        "静岡県": "22000",
+        "愛知": "23000",
+        "愛知県": "23000",
+        "三重": "24000",
+        "三重県": "24000",
+        "滋賀": "25000",
+        "滋賀県": "25000",
+        "京都": "26000",
+        "京都府": "26000",
+        "大阪": "27000",
+        "大阪府": "27000",
+        "兵庫": "28000",
+        "兵庫県": "28000",
+        "奈良": "29000",
+        "奈良県": "29000",
+        "和歌山": "30000",
+        "和歌山県": "30000",
+        "鳥取": "31000",
+        "鳥取県": "31000",
+        "島根": "32000",
+        "島根県": "32000",
+        "岡山": "33000",
+        "岡山県": "33000",
+        "広島": "34000",
+        "広島県": "34000",
+        "山口": "35000",
+        "山口県": "35000",
+        "徳島": "36000",
+        "徳島県": "36000",
+        "香川": "37000",
+        "香川県": "37000",
+        "愛媛": "38000",
+        "愛媛県": "38000",
+        "高知": "39000",
+        "高知県": "39000",
+        "福岡": "40000",
+        "福岡県": "40000",
+        "佐賀": "41000",
+        "佐賀県": "41000",
+        "長崎": "42000",
+        "長崎県": "42000",
+        "熊本": "43000",
+        "熊本県": "43000",
+        "大分": "44000",
+        "大分県": "44000",
+        "宮崎": "45000",
+        "宮崎県": "45000",
+        "鹿児島": "46000",
+        "鹿児島県": "46000",
+        "沖縄": "47000",
+        "沖縄県": "47000",
+    }
+
+    # 統計項目キーワードマッピング
+    STATS_KEYWORDS: ClassVar[Dict[str, List[str]]] = {
+        "人口": ["国勢調査", "人口推計", "住民基本台帳"],
+        "世帯": ["世帯", "家計調査", "国勢調査"],
+        "高齢": ["高齢", "65歳以上", "高齢者"],
+        "失業率": ["労働力調査", "完全失業率"],
+        "雇用": ["労働力調査", "就業構造基本調査"],
+        "賃金": ["毎月勤労統計", "賃金構造基本統計"],
+        "物価": ["消費者物価指数", "企業物価指数"],
+        "GDP": ["国民経済計算", "GDP"],
+        "家計": ["家計調査", "家計収支"],
+        "企業": ["法人企業統計", "企業活動基本調査"],
+        "建設": ["建設工事統計", "建築着工統計"],
+        "農業": ["農林業センサス", "作物統計"],
+        "工業": ["工業統計", "鉱工業指数"],
+        "商業": ["商業統計", "商業販売統計"],
+    }
+
+    # よく使われる統計表のサンプル（実際の運用では動的に構築）
+    SAMPLE_STATS_TABLES: ClassVar[List[Dict]] = [
+        {
+            "stats_data_id": "0000020101",
+            "table_name": "人口推計",
+            "description": "人口推計（月報）",
+            "keywords": ["人口", "推計"],
+            "available_areas": ["全国", "都道府県"],
+            "categories": {
+                "cdCat01": {"001": "総人口", "002": "男", "003": "女"},
+                "cdCat02": {
+                    "01": "総数",
+                    "02": "0～14歳",
+                    "03": "15～64歳",
+                    "04": "65歳以上",
+                },
+            },
+        },
+        {
+            "stats_data_id": "0003084821",
+            "table_name": "国勢調査",
+            "description": "人口等基本集計（年齢・男女別人口）",
+            "keywords": ["人口", "年齢", "男女"],
+            "available_areas": ["全国", "都道府県", "市区町村"],
+            "categories": {
+                "cdCat01": {"01000": "総数", "01001": "0歳", "01002": "1歳"},
+                "cdCat02": {"001": "総数", "002": "男", "003": "女"},
+            },
+        },
+        {
+            "stats_data_id": "0003191203",
+            "table_name": "労働力調査",
+            "description": "労働力調査（基本集計）",
+            "keywords": ["労働", "雇用", "失業率"],
+            "available_areas": ["全国"],
+            "categories": {
+                "cdCat01": {"11020": "完全失業率", "10101": "就業者数"},
+                "cdCat02": {"001": "総数", "002": "男", "003": "女"},
+            },
+        },
+    ]
+
+    def __init__(
+        self, data_dir: Optional[Path] = None, use_ollama: bool = True, verbose: bool = True
+    ):
         self.data_dir = data_dir or Path("data/mcp")
         self.data_dir.mkdir(parents=True, exist_ok=True)
         self.use_ollama = use_ollama
+        # Falseなら変換ごとの経過表示を省く（警告は常に表示）
+        self.verbose = verbose
 
         # 知識ベースの初期化
         self._init_knowledge_base()
@@ -55,193 +267,195 @@ class EstatQueryTranslator:
             try:
                 from .ollama_integration import OllamaStatsMCP
 
-                self.ollama_mcp = OllamaStatsMCP()
-                print(f"✅ Ollama統合を有効化: {self.ollama_mcp.available}")
+                self.ollama_mcp = OllamaStatsMCP(verbose=verbose)
+                if verbose:
+                    print(f"✅ Ollama統合を有効化: {self.ollama_mcp.available}")
             except ImportError:
                 print("⚠️ Ollama統合モジュールが見つかりません。フォールバック模式で動作します。")
                 self.ollama_mcp = None
         else:
             self.ollama_mcp = None
 
-        # データベース接続
+        # データベース接続（スレッドごとに1つを開いたまま使い回す）
         self.db_path = self.data_dir / "catalog_index.db"
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
         self._init_database()
 
+        # ルールベース変換結果のキャッシュ（(クエリ, 件数) → (DBの版, 結果)）
+        self._translation_cache: OrderedDict = OrderedDict()
+        self._translation_cache_lock = threading.Lock()
+
     def _init_knowledge_base(self):
-        """知識ベースの初期化"""
-        # 地域コードマッピング
-        self.area_mappings = {
-            "全国": "00000",
-            "北海道": "01000",
-            "青森": "02000",
-            "青森県": "02000",
-            "岩手": "03000",
-            "岩手県": "03000",
-            "宮城": "04000",
-            "宮城県": "04000",
-            "秋田": "05000",
-            "秋田県": "05000",
-            "山形": "06000",
-            "山形県": "06000",
-            "福島": "07000",
-            "福島県": "07000",
-            "茨城": "08000",
-            "茨城県": "08000",
-            "栃木": "09000",
-            "栃木県": "09000",
-            "群馬": "10000",
-            "群馬県": "10000",
-            "埼玉": "11000",
-            "埼玉県": "11000",
-            "千葉": "12000",
-            "千葉県": "12000",
-            "東京": "13000",
-            "東京都": "13000",
-            "神奈川": "14000",
-            "神奈川県": "14000",
-            "新潟": "15000",
-            "新潟県": "15000",
-            "富山": "16000",
-            "富山県": "16000",
-            "石川": "17000",
-            "石川県": "17000",
-            "福井": "18000",
-            "福井県": "18000",
-            "山梨": "19000",
-            "山梨県": "19000",
-            "長野": "20000",
-            "長野県": "20000",
-            "岐阜": "21000",
-            "岐阜県": "21000",
-            "静岡": "22000",
-            "静岡県": "22000",
-            "愛知": "23000",
-            "愛知県": "23000",
-            "三重": "24000",
-            "三重県": "24000",
-            "滋賀": "25000",
-            "滋賀県": "25000",
-            "京都": "26000",
-            "京都府": "26000",
-            "大阪": "27000",
-            "大阪府": "27000",
-            "兵庫": "28000",
-            "兵庫県": "28000",
-            "奈良": "29000",
-            "奈良県": "29000",
-            "和歌山": "30000",
-            "和歌山県": "30000",
-            "鳥取": "31000",
-            "鳥取県": "31000",
-            "島根": "32000",
-            "島根県": "32000",
-            "岡山": "33000",
-            "岡山県": "33000",
-            "広島": "34000",
-            "広島県": "34000",
-            "山口": "35000",
-            "山口県": "35000",
-            "徳島": "36000",
-            "徳島県": "36000",
-            "香川": "37000",
-            "香川県": "37000",
-            "愛媛": "38000",
-            "愛媛県": "38000",
-            "高知": "39000",
-            "高知県": "39000",
-            "福岡": "40000",
-            "福岡県": "40000",
-            "佐賀": "41000",
-            "佐賀県": "41000",
-            "長崎": "42000",
-            "長崎県": "42000",
-            "熊本": "43000",
-            "熊本県": "43000",
-            "大分": "44000",
-            "大分県": "44000",
-            "宮崎": "45000",
-            "宮崎県": "45000",
-            "鹿児島": "46000",
-            "鹿児島県": "46000",
-            "沖縄": "47000",
-            "沖縄県": "47000",
+        """知識ベースの初期化（定数はクラスで共有する）"""
+        self.area_mappings = self.AREA_MAPPINGS
+        self.stats_keywords = self.STATS_KEYWORDS
+        self.sample_stats_tables = self.SAMPLE_STATS_TABLES
+
+        # 語の照合の仕組みも定数だけから決まるため、クラスごとに1度だけ構築する
+        if "_term_tags" not in type(self).__dict__:
+            type(self)._init_term_matcher()
+        if "_item_completions" not in type(self).__dict__:
+            type(self)._init_suggestion_index()
+
+    @classmethod
+    def _init_term_matcher(cls):
+        """地域名・統計項目・分類の語をまとめて1回の走査で照合する仕組みを構築
+
+        語はそれぞれ（種類, 値）のタグを持つ。照合は長い語を優先して重ならないように行い
+        （「東京都」を「東京」「京都」より優先）、一致した語に含まれる短い語の
+        統計項目・分類のタグも合わせて返す。地域は一致した語そのものだけを採用する。
+        """
+        own_tags: Dict[str, List[Tuple[str, str]]] = {}
+        for region_name in cls.AREA_MAPPINGS:
+            own_tags.setdefault(region_name, []).append(("area", region_name))
+        for item, keywords in cls.STATS_KEYWORDS.items():
+            for term in (item, *keywords):
+                own_tags.setdefault(term, []).append(("stats", item))
+        for term, category in cls.CATEGORY_TRIGGERS.items():
+            own_tags.setdefault(term, []).append(("category", category))
+        for term in cls.LATEST_TRIGGERS:
+            own_tags.setdefault(term, []).append(("time", "latest"))
+
+        term_tags = {
+            term: tags
+            + [
+                tag
+                for other, other_tags in own_tags.items()
+                if other != term and other in term
+                for tag in other_tags
+                if tag[0] != "area"
+            ]
+            for term, tags in own_tags.items()
         }
 
-        # 統計項目キーワードマッピング
-        self.stats_keywords = {
-            "人口": ["国勢調査", "人口推計", "住民基本台帳"],
-            "世帯": ["世帯", "家計調査", "国勢調査"],
-            "高齢": ["高齢", "65歳以上", "高齢者"],
-            "失業率": ["労働力調査", "完全失業率"],
-            "雇用": ["労働力調査", "就業構造基本調査"],
-            "賃金": ["毎月勤労統計", "賃金構造基本統計"],
-            "物価": ["消費者物価指数", "企業物価指数"],
-            "GDP": ["国民経済計算", "GDP"],
-            "家計": ["家計調査", "家計収支"],
-            "企業": ["法人企業統計", "企業活動基本調査"],
-            "建設": ["建設工事統計", "建築着工統計"],
-            "農業": ["農林業センサス", "作物統計"],
-            "工業": ["工業統計", "鉱工業指数"],
-            "商業": ["商業統計", "商業販売統計"],
-        }
+        if ahocorasick is not None:
+            cls._term_automaton = ahocorasick.Automaton()
+            for term, tags in term_tags.items():
+                cls._term_automaton.add_word(term, tags)
+            cls._term_automaton.make_automaton()
+        else:
+            cls._term_automaton = None
+            cls._term_pattern = re.compile(
+                "|".join(map(re.escape, sorted(term_tags, key=len, reverse=True)))
+            )
 
-        # よく使われる統計表のサンプル（実際の運用では動的に構築）
-        self.sample_stats_tables = [
-            {
-                "stats_data_id": "0000020101",
-                "table_name": "人口推計",
-                "description": "人口推計（月報）",
-                "keywords": ["人口", "推計"],
-                "available_areas": ["全国", "都道府県"],
-                "categories": {
-                    "cdCat01": {"001": "総人口", "002": "男", "003": "女"},
-                    "cdCat02": {
-                        "01": "総数",
-                        "02": "0～14歳",
-                        "03": "15～64歳",
-                        "04": "65歳以上",
-                    },
-                },
-            },
-            {
-                "stats_data_id": "0003084821",
-                "table_name": "国勢調査",
-                "description": "人口等基本集計（年齢・男女別人口）",
-                "keywords": ["人口", "年齢", "男女"],
-                "available_areas": ["全国", "都道府県", "市区町村"],
-                "categories": {
-                    "cdCat01": {"01000": "総数", "01001": "0歳", "01002": "1歳"},
-                    "cdCat02": {"001": "総数", "002": "男", "003": "女"},
-                },
-            },
-            {
-                "stats_data_id": "0003191203",
-                "table_name": "労働力調査",
-                "description": "労働力調査（基本集計）",
-                "keywords": ["労働", "雇用", "失業率"],
-                "available_areas": ["全国"],
-                "categories": {
-                    "cdCat01": {"11020": "完全失業率", "10101": "就業者数"},
-                    "cdCat02": {"001": "総数", "002": "男", "003": "女"},
-                },
-            },
-        ]
+        # 構築済みの判定に使うため、照合の準備が整ってから最後に設定する
+        cls._term_tags = term_tags
+
+    @classmethod
+    def _init_suggestion_index(cls):
+        """補完候補の索引を構築（入力 → 補完できる地域名・統計項目を定義順で）
+
+        地域名は前方一致、統計項目は部分一致で補完するため、地域名はすべての接頭辞、
+        統計項目はすべての部分文字列を索引に登録する。どちらも数文字の語なので索引は小さい。
+        """
+        region_completions: Dict[str, List[str]] = {}
+        for region_name in cls.AREA_MAPPINGS:
+            for end in range(len(region_name) + 1):
+                region_completions.setdefault(region_name[:end], []).append(region_name)
+
+        item_completions: Dict[str, List[str]] = {}
+        for item in cls.STATS_KEYWORDS:
+            substrings = {
+                item[start:end]
+                for start in range(len(item) + 1)
+                for end in range(start, len(item) + 1)
+            }
+            for substring in substrings:
+                item_completions.setdefault(substring, []).append(item)
+
+        cls._region_completions = region_completions
+        # 構築済みの判定に使うため最後に設定する
+        cls._item_completions = item_completions
+
+    @classmethod
+    def _iter_term_tags(cls, query: str) -> Iterator[Tuple[str, str]]:
+        """クエリ中で一致した語のタグを出現順に返す"""
+        if cls._term_automaton is not None:
+            for _, tags in cls._term_automaton.iter_long(query):
+                yield from tags
+        else:
+            for term in cls._term_pattern.findall(query):
+                yield from cls._term_tags[term]
+
+    def _connection(self) -> sqlite3.Connection:
+        """呼び出し元スレッド用のデータベース接続を返す（初回のみ接続してPRAGMAを設定）"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            for name, value in self.SQLITE_PRAGMAS.items():
+                conn.execute(f"PRAGMA {name}={value}")
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    def close(self):
+        """開いているデータベース接続をすべて閉じる"""
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            conn.close()
+        self._local = threading.local()
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
 
     def _init_database(self):
         """データベースの初期化"""
         if not self.db_path.exists():
             self._create_database()
+        else:
+            self._ensure_keyword_index()
+
+    def _ensure_keyword_index(self):
+        """統計表とキーワードの対応表がなければ作成し、stats_tablesのキーワード列から構築する
+
+        テーブルの定義はカタログ同期（catalog_integration）と共通。
+        キーワードでの検索はこの表の索引を使った等価検索で行う。
+        """
+        conn = self._connection()
+        exists = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'stats_keywords'"
+        ).fetchone()
+        if exists:
+            return
+
+        with conn:
+            conn.execute(
+                """
+                CREATE TABLE stats_keywords (
+                    stats_data_id TEXT NOT NULL,
+                    keyword TEXT NOT NULL,
+                    PRIMARY KEY (stats_data_id, keyword)
+                ) WITHOUT ROWID
+            """
+            )
+            conn.execute("CREATE INDEX idx_stats_keywords_keyword ON stats_keywords(keyword)")
+            conn.execute(
+                """
+                INSERT OR IGNORE INTO stats_keywords (stats_data_id, keyword)
+                SELECT s.stats_data_id, k.value
+                FROM stats_tables s, json_each(s.keywords) k
+                WHERE s.keywords IS NOT NULL
+            """
+            )
 
     def _create_database(self):
         """データベースを作成"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connection()
         cursor = conn.cursor()
 
         # 統計表情報テーブル
         cursor.execute(
             """
             CREATE TABLE stats_tables (
-                stats_data_id TEXT PRIMARY KEY,
+                stats_data_id TEXT NOT NULL PRIMARY KEY,
                 table_name TEXT NOT NULL,
                 description TEXT,
                 organization TEXT,
@@ -255,175 +469,342 @@ class EstatQueryTranslator:
         """
         )
 
-        # サンプルデータを挿入
-        for table in self.sample_stats_tables:
-            cursor.execute(
+        # サンプルデータを1つのトランザクションでまとめて挿入
+        rows = [
+            (
+                table["stats_data_id"],
+                table["table_name"],
+                table["description"],
+                json.dumps(table["keywords"], ensure_ascii=False),
+                json.dumps(table["available_areas"], ensure_ascii=False),
+                json.dumps(table["categories"], ensure_ascii=False),
+            )
+            for table in self.sample_stats_tables
+        ]
+        with conn:
+            cursor.executemany(
                 """
-                INSERT INTO stats_tables 
+                INSERT INTO stats_tables
                 (stats_data_id, table_name, description, keywords, available_areas, categories)
                 VALUES (?, ?, ?, ?, ?, ?)
             """,
-                (
-                    table["stats_data_id"],
-                    table["table_name"],
-                    table["description"],
-                    json.dumps(table["keywords"]),
-                    json.dumps(table["available_areas"]),
-                    json.dumps(table["categories"]),
-                ),
+                rows,
             )
 
-        conn.commit()
-        conn.close()
+        # 投入したデータからキーワードの対応表を構築
+        self._ensure_keyword_index()
+
+        # 投入後の統計情報をクエリプランナーに反映
+        conn.execute("ANALYZE")
 
     def parse_query(self, query: str) -> EntitySet:
         """自然言語クエリを解析してエンティティを抽出"""
-        query = query.strip()
-
-        # 地域名の抽出
-        regions = []
-        for region_name, region_code in sorted(
-            self.area_mappings.items(), key=lambda item: len(item[0]), reverse=True
-        ):
-            if region_name in query:
-                if region_name not in regions:
-                    regions.append(region_name)
-
-        # 統計項目の抽出
-        statistical_items = []
-        for item, keywords in self.stats_keywords.items():
-            if item in query or any(keyword in query for keyword in keywords):
-                statistical_items.append(item)
+        regions, time_periods, categories, statistical_items = self._extract_entities(query.strip())
+
+        # 抽出結果はキャッシュと共有しているため、呼び出し元には新しいリストで渡す
+        return EntitySet(
+            regions=list(regions),
+            time_periods=list(time_periods),
+            categories=list(categories),
+            statistical_items=list(statistical_items),
+            region_codes=[self.area_mappings[region] for region in regions],
+        )
+
+    @classmethod
+    @lru_cache(maxsize=1024)
+    def _extract_entities(cls, query: str) -> Tuple[Tuple[str, ...], ...]:
+        """クエリから地域名・時間期間・分類・統計項目を抽出（知識ベースは固定のため結果をキャッシュ）"""
+        # 地域名・統計項目・分類の語を1回の走査でまとめて抽出
+        matched = {"area": {}, "stats": set(), "category": set(), "time": set()}
+        for kind, value in cls._iter_term_tags(query):
+            if kind == "area":
+                matched["area"][value] = None  # 出現順を保ったまま重複を除く
+            else:
+                matched[kind].add(value)
+
+        # 地域名（クエリ中の出現順）
+        regions = tuple(matched["area"])
+
+        # 統計項目（項目の定義順）
+        statistical_items = tuple(item for item in cls.STATS_KEYWORDS if item in matched["stats"])
 
         # 時間期間の抽出（簡易実装）
-        time_periods = []
-        year_pattern = r"(\d{4})年?"
-        years = re.findall(year_pattern, query)
-        time_periods.extend(years)
+        time_periods = cls.YEAR_PATTERN.findall(query)
 
-        if "最新" in query or "最近" in query:
+        if "latest" in matched["time"]:
             time_periods.append("latest")
 
-        # 分類の抽出
-        categories = []
-        if "年齢" in query or "年代" in query:
-            categories.append("age")
-        if "男女" in query or "性別" in query:
-            categories.append("gender")
-        if "産業" in query or "業種" in query:
-            categories.append("industry")
-
-        return EntitySet(
-            regions=regions,
-            time_periods=time_periods,
-            categories=categories,
-            statistical_items=statistical_items,
+        # 分類（定義順）
+        categories = tuple(
+            dict.fromkeys(
+                category
+                for category in cls.CATEGORY_TRIGGERS.values()
+                if category in matched["category"]
+            )
         )
 
+        return regions, tuple(time_periods), categories, statistical_items
+
     def search_stats_tables(self, entities: EntitySet) -> List[Dict]:
-        """エンティティに基づいて統計表を検索"""
-        conn = sqlite3.connect(self.db_path)
+        """エンティティに基づいて統計表を検索
+
+        Args:
+            entities: parse_queryで抽出したエンティティ
+        """
+        conn = self._connection()
         cursor = conn.cursor()
+        cursor.row_factory = sqlite3.Row
+
+        columns = self.TABLE_INFO_COLUMNS
 
         # キーワードベースの検索
         search_terms = entities.statistical_items
 
         if not search_terms:
             # 統計項目が特定できない場合は全体を検索
-            cursor.execute("SELECT * FROM stats_tables")
+            cursor.execute(f"SELECT {columns} FROM stats_tables")
         else:
-            # OR検索でマッチする統計表を探す
-            placeholders = " OR ".join(["keywords LIKE ?"] * len(search_terms))
-            search_values = [f"%{term}%" for term in search_terms]
+            # OR検索でマッチする統計表をキーワードの対応表から索引で探す
+            placeholders = ", ".join(["?"] * len(search_terms))
 
             cursor.execute(
                 f"""
-                SELECT * FROM stats_tables 
-                WHERE {placeholders}
+                SELECT {columns} FROM stats_tables
+                WHERE stats_data_id IN (
+                    SELECT stats_data_id FROM stats_keywords WHERE keyword IN ({placeholders})
+                )
                 ORDER BY stats_data_id
             """,
-                search_values,
+                search_terms,
             )
 
-        results = []
-        for row in cursor.fetchall():
-            results.append(
-                {
-                    "stats_data_id": row[0],
-                    "table_name": row[1],
-                    "description": row[2],
-                    "organization": row[3],
-                    "field_code": row[4],
-                    "field_name": row[5],
-                    "keywords": json.loads(row[6]) if row[6] else [],
-                    "available_areas": json.loads(row[7]) if row[7] else [],
-                    "categories": json.loads(row[8]) if row[8] else {},
-                }
+        return [self._row_to_table_info(row) for row in cursor]
+
+    @staticmethod
+    def _row_to_table_info(row: sqlite3.Row) -> Dict:
+        """stats_tablesの行を統計表情報の辞書に変換（JSON列を復元する）"""
+        return {
+            "stats_data_id": row["stats_data_id"],
+            "table_name": row["table_name"],
+            "description": row["description"],
+            "organization": row["organization"],
+            "field_code": row["field_code"],
+            "field_name": row["field_name"],
+            "keywords": json.loads(row["keywords"]) if row["keywords"] else [],
+            "available_areas": (
+                json.loads(row["available_areas"]) if row["available_areas"] else []
+            ),
+            "categories": json.loads(row["categories"]) if row["categories"] else {},
+        }
+
+    def _score_candidates(self, entities: EntitySet) -> pd.DataFrame:
+        """候補となる統計表すべての信頼度をまとめて計算
+
+        calculate_confidenceと同じ採点を、JSON列を復元せずに全候補へ一括で行う。
+        キーワードの一致数・地域の有無・分類の有無はSQLiteで集計し、採点はNumPyの配列演算で行う。
+
+        Returns:
+            stats_data_id順に並んだ stats_data_id, score の2列のDataFrame
+        """
+        items = entities.statistical_items
+        regions = entities.regions
+
+        # 地域がテーブルの対象地域に含まれるか（JSON配列の要素をSQLite内で照合）
+        if regions:
+            area_hit = (
+                "EXISTS (SELECT 1 FROM json_each(s.available_areas) a "
+                f"WHERE a.value IN ({', '.join(['?'] * len(regions))}))"
             )
+        else:
+            area_hit = "0"
+        has_categories = "(s.categories IS NOT NULL AND s.categories NOT IN ('', '{}', 'null'))"
+
+        if items:
+            # キーワードの対応表から一致したキーワードの数を統計表ごとに数える
+            sql = f"""
+                SELECT s.stats_data_id, COUNT(*) AS matched,
+                       {area_hit} AS area_hit, {has_categories} AS has_categories
+                FROM stats_keywords k
+                JOIN stats_tables s ON s.stats_data_id = k.stats_data_id
+                WHERE k.keyword IN ({", ".join(["?"] * len(items))})
+                GROUP BY s.stats_data_id
+                ORDER BY s.stats_data_id
+            """
+            params = [*regions, *items]
+        else:
+            # 統計項目が特定できない場合は全体が候補
+            sql = f"""
+                SELECT s.stats_data_id, 0 AS matched,
+                       {area_hit} AS area_hit, {has_categories} AS has_categories
+                FROM stats_tables s
+                ORDER BY s.stats_data_id
+            """
+            params = list(regions)
 
-        conn.close()
-        return results
+        candidates = pd.read_sql_query(sql, self._connection(), params=params)
+
+        matched = candidates["matched"].to_numpy(dtype=np.float64)
+        area_hit = candidates["area_hit"].to_numpy(dtype=np.float64)
+        has_categories = candidates["has_categories"].to_numpy(dtype=np.float64)
+
+        # calculate_confidenceと同じ式を全候補の配列にまとめて適用する
+        per_item, area, categories, base = self._confidence_weights(entities)
+        score = matched * per_item + area_hit * area + has_categories * categories + base
+
+        return pd.DataFrame(
+            {"stats_data_id": candidates["stats_data_id"], "score": np.minimum(score, 1.0)}
+        )
+
+    @staticmethod
+    def _top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
+        """信頼度の高い上位k件の位置を信頼度順に返す（同じ信頼度なら位置の若い順）
+
+        全体を並べ替えず、k番目の信頼度をnp.partitionで線形時間に求めてから、
+        それ以上の候補だけを並べ替える。
+        """
+        n = len(scores)
+        k = min(max(k, 0), n)
+        if k == 0:
+            return np.empty(0, dtype=np.intp)
+
+        candidates = np.arange(n)
+        if k < n:
+            threshold = np.partition(scores, n - k)[n - k]
+            candidates = np.flatnonzero(scores >= threshold)
+        order = np.argsort(-scores[candidates], kind="stable")[:k]
+        return candidates[order]
+
+    def _load_ranked_tables(self, stats_data_ids: List[str]) -> List[Dict]:
+        """指定した統計表の表名・説明・分類軸コードを、指定した順に読み込む
+
+        パラメータ生成に要るのは分類の軸コード（cdCat01など）だけなので、
+        categoriesのJSONはPythonで復元せずSQLite内でキーだけを取り出す。
+        """
+        if not stats_data_ids:
+            return []
+
+        cursor = self._connection().cursor()
+        cursor.row_factory = sqlite3.Row
+        cursor.execute(
+            f"""
+            SELECT stats_data_id, table_name, description,
+                   (SELECT group_concat(c.key, ',') FROM json_each(
+                        CASE WHEN json_valid(categories) THEN categories END) c
+                   ) AS category_axes
+            FROM stats_tables
+            WHERE stats_data_id IN ({", ".join(["?"] * len(stats_data_ids))})
+        """,
+            stats_data_ids,
+        )
+        tables = {
+            row["stats_data_id"]: {
+                "stats_data_id": row["stats_data_id"],
+                "table_name": row["table_name"],
+                "description": row["description"],
+                "category_axes": (
+                    frozenset(row["category_axes"].split(","))
+                    if row["category_axes"]
+                    else frozenset()
+                ),
+            }
+            for row in cursor
+        }
+        return [tables[stats_data_id] for stats_data_id in stats_data_ids]
 
     def generate_parameters(self, entities: EntitySet, table_info: Dict) -> Dict[str, str]:
         """エンティティ情報から APIパラメータを生成"""
+        return self._parameters_for_table(
+            self._base_parameters(entities), table_info.get("categories") or {}
+        )
+
+    def _base_parameters(self, entities: EntitySet) -> Dict[str, str]:
+        """統計表によらずクエリだけで決まるパラメータを生成
+
+        分類パラメータ（cdCatNN）も候補として含め、統計表ごとの絞り込みは
+        _parameters_for_table で行う。候補が複数あってもクエリごとに1度だけ呼べばよい。
+        """
         parameters = {}
 
         # 地域パラメータ
-        if entities.regions:
-            region_name = entities.regions[0]  # 最初の地域を使用
-            if region_name in self.area_mappings:
-                area_code = self.area_mappings[region_name]
-                parameters["cdArea"] = area_code
-
-        # 分類パラメータ
-        categories = table_info.get("categories", {})
+        if entities.region_codes:
+            parameters["cdArea"] = entities.region_codes[0]  # 最初の地域を使用
 
         # 性別の指定
-        if "gender" in entities.categories and "cdCat02" in categories:
+        if "gender" in entities.categories:
             parameters["cdCat02"] = "002,003"  # 男、女
 
         # 年齢の指定
-        if "age" in entities.categories and "cdCat01" in categories:
+        if "age" in entities.categories:
             # 年齢階級を指定（サンプルとして）
             parameters["cdCat01"] = "01000-01021"  # 0歳〜100歳以上
 
         # 時間パラメータ（簡易実装）
-        if entities.time_periods:
-            if "latest" in entities.time_periods:
-                # 最新データを取得（実際の実装では動的に決定）
-                parameters["cdTime"] = "2024000000"
-            else:
-                # 指定年のデータ
-                year = entities.time_periods[0]
-                parameters["cdTime"] = f"{year}000000"
+        time_code = self._time_code(entities)
+        if time_code:
+            parameters["cdTime"] = time_code
 
         return parameters
 
+    @staticmethod
+    def _parameters_for_table(
+        base_parameters: Dict[str, str], category_axes: Collection[str]
+    ) -> Dict[str, str]:
+        """クエリ共通のパラメータから、統計表が持たない分類パラメータを除く
+
+        Args:
+            base_parameters: _base_parametersで生成したパラメータ
+            category_axes: 統計表が持つ分類の軸コード（categoriesの辞書でもよい）
+        """
+        return {
+            key: value
+            for key, value in base_parameters.items()
+            if not key.startswith("cdCat") or key in category_axes
+        }
+
+    @staticmethod
+    def _time_code(entities: EntitySet) -> Optional[str]:
+        """時間期間から cdTime の値を決める（指定がなければ None）"""
+        if not entities.time_periods:
+            return None
+        if "latest" in entities.time_periods:
+            # 最新データを取得（実際の実装では動的に決定）
+            return "2024000000"
+        # 指定年のデータ
+        year = entities.time_periods[0]
+        return f"{year}000000" if year.isdigit() else None
+
     def calculate_confidence(self, entities: EntitySet, table_info: Dict) -> float:
         """マッチングの信頼度を計算"""
-        score = 0.0
+        # 統計表側の特徴（一致した統計項目の数、地域の対応、分類の有無）
+        matched_items = len(set(entities.statistical_items) & set(table_info.get("keywords", [])))
+        area_hit = any(
+            region in table_info.get("available_areas", []) for region in entities.regions
+        )
+        has_categories = bool(table_info.get("categories"))
 
-        # 統計項目のマッチ度
-        table_keywords = table_info.get("keywords", [])
-        matched_items = len(set(entities.statistical_items) & set(table_keywords))
-        if entities.statistical_items:
-            score += (matched_items / len(entities.statistical_items)) * 0.6
+        per_item, area, categories, base = self._confidence_weights(entities)
+        score = matched_items * per_item + area_hit * area + has_categories * categories + base
+        return min(score, 1.0)
 
-        # 地域の対応度
-        if entities.regions:
-            available_areas = table_info.get("available_areas", [])
-            if any(region in available_areas for region in entities.regions):
-                score += 0.3
-        else:
-            score += 0.2  # 地域指定なしの場合は中程度のスコア
+    def _confidence_weights(self, entities: EntitySet) -> Tuple[float, float, float, float]:
+        """クエリから信頼度の重みを決める
 
-        # 分類の対応度
-        if entities.categories:
-            categories = table_info.get("categories", {})
-            if categories:
-                score += 0.1
+        信頼度は統計表ごとに分岐せず、
+        一致した統計項目の数 × 項目あたりの重み + 地域の対応(0/1) × 重み + 分類の有無(0/1) × 重み + 基本点
+        で計算する。クエリに統計項目・地域・分類がない場合は対応する重みを0にする。
 
-        return min(score, 1.0)
+        Returns:
+            (統計項目1つあたりの重み, 地域の重み, 分類の重み, 基本点)
+        """
+        weights = self.CONFIDENCE_WEIGHTS
+        items = entities.statistical_items
+        per_item = weights["items"] / len(items) if items else 0.0
+        if entities.regions:
+            area, base = weights["area"], 0.0
+        else:
+            area, base = 0.0, weights["no_area"]  # 地域指定なしの場合は中程度のスコア
+        categories = weights["categories"] if entities.categories else 0.0
+        return per_item, area, categories, base
 
     def translate_query(self, query: str, limit: int = 5) -> List[QueryResult]:
         """自然言語クエリを e-stat APIパラメータに変換"""
@@ -436,7 +817,8 @@ class EstatQueryTranslator:
 
     def _translate_with_ollama(self, query: str, limit: int = 5) -> List[QueryResult]:
         """Ollama統合を使用したクエリ変換"""
-        print("🤖 Ollama AIによる統計表・軸情報の提案...")
+        if self.verbose:
+            print("🤖 Ollama AIによる統計表・軸情報の提案...")
 
         # 1. クエリを解析してエンティティを抽出（基本情報として）
         entities = self.parse_query(query)
@@ -452,60 +834,91 @@ class EstatQueryTranslator:
         # 3. Ollama提案に基づくパラメータ生成
         ai_parameters = self._generate_ai_parameters(query, entities, ollama_response)
 
-        # 4. メイン結果を作成
+        if self.verbose:
+            print(
+                f"🎯 AI提案結果: {ollama_response.table_name} "
+                f"(信頼度: {ollama_response.confidence:.2f})"
+            )
+            print(f"🔍 AI選択理由: {ollama_response.reasoning}")
+            print(f"🔧 提案パラメータ: {ai_parameters}")
+
+        # 4. フォールバック候補も生成（従来手法）
+        #    代替案の枠がない（limit <= 1）場合は結果が空になるため、ルールベース変換自体を省く
+        fallback_results = self._translate_with_rules(query, limit - 1) if limit > 1 else []
+
+        # 5. フォールバック候補を代替案としてメイン結果を作成
         main_result = QueryResult(
             stats_data_id=ollama_response.stats_table_id,
             parameters=ai_parameters,
             description=f"AI提案: {ollama_response.table_name}",
             confidence_score=min(ollama_response.confidence, 1.0),
             table_name=ollama_response.table_name,
+            alternative_suggestions=fallback_results,
         )
 
-        print(
-            f"🎯 AI提案結果: {ollama_response.table_name} (信頼度: {ollama_response.confidence:.2f})"
-        )
-        print(f"🔍 AI選択理由: {ollama_response.reasoning}")
-        print(f"🔧 提案パラメータ: {ai_parameters}")
-
-        # 5. フォールバック候補も生成（従来手法）
-        fallback_results = self._translate_with_rules(query, limit - 1)
-
-        # 6. 代替案として設定
-        main_result.alternative_suggestions = fallback_results
-
         return [main_result]
 
     def _translate_with_rules(self, query: str, limit: int = 5) -> List[QueryResult]:
-        """従来のルールベースクエリ変換"""
+        """従来のルールベースクエリ変換（同じクエリはDBが変わらない限りキャッシュから返す）"""
+        key = (query, limit)
+        version = self._database_version()
+        with self._translation_cache_lock:
+            cached = self._translation_cache.get(key)
+            if cached is not None and cached[0] == version:
+                self._translation_cache.move_to_end(key)
+                return copy.deepcopy(cached[1])
+
+        results = self._translate_with_rules_uncached(query, limit)
+
+        with self._translation_cache_lock:
+            self._translation_cache[key] = (version, results)
+            self._translation_cache.move_to_end(key)
+            if len(self._translation_cache) > self.TRANSLATION_CACHE_SIZE:
+                self._translation_cache.popitem(last=False)
+
+        # キャッシュ内の結果を呼び出し元が書き換えないよう複製を返す
+        return copy.deepcopy(results)
+
+    def _database_version(self) -> Tuple[Optional[Tuple[int, int]], ...]:
+        """カタログDB（WALファイルを含む）の更新時刻とサイズ。カタログ同期で変わるとキャッシュを無効にする"""
+        version = []
+        for path in (self.db_path, self.db_path.with_name(self.db_path.name + "-wal")):
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                version.append(None)
+            else:
+                version.append((stat.st_mtime_ns, stat.st_size))
+        return tuple(version)
+
+    def _translate_with_rules_uncached(self, query: str, limit: int) -> List[QueryResult]:
+        """ルールベースクエリ変換の本体"""
         # 1. クエリを解析してエンティティを抽出
         entities = self.parse_query(query)
 
-        # 2. エンティティに基づいて統計表を検索
-        candidate_tables = self.search_stats_tables(entities)
-
-        # 3. 各候補に対してパラメータを生成
-        results = []
-        for table_info in candidate_tables[:limit]:
-            parameters = self.generate_parameters(entities, table_info)
-            confidence = self.calculate_confidence(entities, table_info)
-
-            result = QueryResult(
+        # 2. エンティティに基づいて全候補の信頼度をまとめて計算し、信頼度順に上位を選ぶ
+        #    （同じ信頼度ならstats_data_id順）
+        scored = self._score_candidates(entities)
+        top = scored.iloc[self._top_k_indices(scored["score"].to_numpy(), limit)]
+
+        # 3. 選ばれた統計表だけを読み込んでパラメータを生成
+        #    （クエリだけで決まる部分は1度だけ作り、統計表ごとには分類パラメータを絞り込むだけ）
+        candidate_tables = self._load_ranked_tables(top["stats_data_id"].tolist())
+        base_parameters = self._base_parameters(entities)
+        results = [
+            QueryResult(
                 stats_data_id=table_info["stats_data_id"],
-                parameters=parameters,
+                parameters=self._parameters_for_table(base_parameters, table_info["category_axes"]),
                 description=table_info["description"],
-                confidence_score=confidence,
+                confidence_score=float(confidence),
                 table_name=table_info["table_name"],
             )
-            results.append(result)
-
-        # 4. 信頼度順にソート
-        results.sort(key=lambda x: x.confidence_score, reverse=True)
+            for table_info, confidence in zip(candidate_tables, top["score"])
+        ]
 
-        # 5. 代替案の設定
+        # 4. 代替案の設定
         if results:
-            main_result = results[0]
-            main_result.alternative_suggestions = results[1:]
-            return [main_result]
+            return [replace(results[0], alternative_suggestions=results[1:])]
 
         return results
 
@@ -516,19 +929,13 @@ class EstatQueryTranslator:
         parameters = {}
 
         # 地域パラメータ
-        if entities.regions and "cdArea" in ollama_response.axis_mappings:
-            region_name = entities.regions[0]
-            if region_name in self.area_mappings:
-                parameters["cdArea"] = self.area_mappings[region_name]
+        if entities.region_codes and "cdArea" in ollama_response.axis_mappings:
+            parameters["cdArea"] = entities.region_codes[0]
 
         # 時間パラメータ
-        if entities.time_periods:
-            if "latest" in entities.time_periods:
-                parameters["cdTime"] = "2024000000"
-            else:
-                year = entities.time_periods[0]
-                if year.isdigit():
-                    parameters["cdTime"] = f"{year}000000"
+        time_code = self._time_code(entities)
+        if time_code:
+            parameters["cdTime"] = time_code
 
         # 分類パラメータ（AIの軸マッピング提案に基づく）
         for axis_code, axis_description in ollama_response.axis_mappings.items():
@@ -551,21 +958,21 @@ class EstatQueryTranslator:
 
     def get_query_suggestions(self, partial_query: str) -> List[str]:
         """部分的なクエリに対する補完候補を提供"""
-        suggestions = []
-
-        # 地域名の候補
-        for region in self.area_mappings.keys():
-            if region.startswith(partial_query):
-                suggestions.append(f"{region}の人口データ")
-                suggestions.append(f"{region}の雇用統計")
+        # 地域名の候補（前方一致）
+        region_suggestions = (
+            suggestion
+            for region in self._region_completions.get(partial_query, ())
+            for suggestion in (f"{region}の人口データ", f"{region}の雇用統計")
+        )
 
-        # 統計項目の候補
-        for item in self.stats_keywords.keys():
-            if item.startswith(partial_query) or partial_query in item:
-                suggestions.append(f"{item}の推移")
-                suggestions.append(f"都道府県別{item}")
+        # 統計項目の候補（部分一致）
+        item_suggestions = (
+            suggestion
+            for item in self._item_completions.get(partial_query, ())
+            for suggestion in (f"{item}の推移", f"都道府県別{item}")
+        )
 
-        return suggestions[:10]  # 最大10件
+        return list(islice(chain(region_suggestions, item_suggestions), 10))  # 最大10件
 
 
 # 使用例とテスト用のヘルパー関数
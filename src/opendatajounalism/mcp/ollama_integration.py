@@ -3,15 +3,31 @@ Ollama統合モジュール
 AIが統計表IDと軸情報を動的に提案する機能
 """
 
+import copy
+import hashlib
+import heapq
 import json
-import re
-from dataclasses import dataclass
-from typing import Dict, List, Optional, Tuple
-
+import threading
+import time
+import unicodedata
+import zlib
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, replace
+from typing import ClassVar, Dict, Hashable, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    import orjson
+except ImportError:  # orjson未導入の環境では標準ライブラリのjsonを使用
+    orjson = None
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class OllamaResponse:
     """Ollamaからのレスポンス"""
 
@@ -22,104 +38,438 @@ class OllamaResponse:
     reasoning: str
 
 
+class SemanticResponseCache:
+    """言い回しの違う似たクエリにもOllamaの提案を使い回すキャッシュ
+
+    クエリを文字の1〜2-gramの出現回数ベクトル（ハッシュで固定次元に畳み込み、長さ1に正規化）で表し、
+    コサイン類似度が閾値以上で文脈（モデル・地域・時期）が同じ過去の提案を返す。
+    件数の上限に達したら古いものから上書きする。
+    """
+
+    def __init__(self, threshold: float = 0.92, dim: int = 1024, max_entries: int = 512):
+        self.threshold = threshold
+        self.dim = dim
+        self.max_entries = max_entries
+        self._vectors = np.zeros((max_entries, dim), dtype=np.float32)
+        self._entries: List[Tuple[Hashable, OllamaResponse]] = []
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def _embed(self, query: str) -> np.ndarray:
+        """クエリを正規化した文字n-gramのベクトルに変換"""
+        text = unicodedata.normalize("NFKC", query).strip()
+        grams = [*text, *(text[i : i + 2] for i in range(len(text) - 1))]
+        vector = np.zeros(self.dim, dtype=np.float32)
+        if grams:
+            buckets = [zlib.crc32(gram.encode()) % self.dim for gram in grams]
+            np.add.at(vector, buckets, 1.0)
+            vector /= np.linalg.norm(vector)
+        return vector
+
+    def lookup(self, query: str, context: Hashable) -> Optional[OllamaResponse]:
+        """似たクエリへの提案があれば複製を返す（なければ None）"""
+        vector = self._embed(query)
+        with self._lock:
+            if not self._entries:
+                return None
+            similarities = self._vectors[: len(self._entries)] @ vector
+            same_context = np.fromiter(
+                (entry_context == context for entry_context, _ in self._entries),
+                dtype=bool,
+                count=len(self._entries),
+            )
+            similarities[~same_context] = -1.0
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.threshold:
+                return None
+            response = self._entries[best][1]
+        return replace(response, axis_mappings=dict(response.axis_mappings))
+
+    def add(self, query: str, context: Hashable, response: OllamaResponse):
+        """クエリへの提案を登録"""
+        vector = self._embed(query)
+        response = replace(response, axis_mappings=dict(response.axis_mappings))
+        with self._lock:
+            if len(self._entries) < self.max_entries:
+                self._entries.append((context, response))
+                index = len(self._entries) - 1
+            else:
+                index = self._next
+                self._entries[index] = (context, response)
+                self._next = (index + 1) % self.max_entries
+            self._vectors[index] = vector
+
+    def clear(self):
+        """登録した提案をすべて破棄"""
+        with self._lock:
+            self._entries.clear()
+            self._next = 0
+
+
+def _char_bigrams(text: str) -> Set[str]:
+    """正規化した文字列の文字bigramの集合（分かち書きなしで日本語の語の重なりを測る）"""
+    text = unicodedata.normalize("NFKC", text)
+    return {text[i : i + 2] for i in range(len(text) - 1)}
+
+
+class _JsonObjectTracker:
+    """ストリーミング中の回答で、最初のJSONオブジェクトが閉じたかを追跡する
+
+    文字列内の括弧やエスケープされた引用符は数えない。
+    """
+
+    def __init__(self):
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+
+    def feed(self, chunk: str) -> bool:
+        """回答の断片を読み進め、最初のオブジェクトが閉じたら True を返す"""
+        for char in chunk:
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == "\\":
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == "{":
+                self.depth += 1
+            elif self.depth:
+                if char == '"':
+                    self.in_string = True
+                elif char == "}":
+                    self.depth -= 1
+                    if self.depth == 0:
+                        return True
+        return False
+
+
 class OllamaStatsMCP:
     """Ollama統合によるe-stat統計表とパラメータ提案システム"""
 
-    def __init__(self, base_url: str = "http://localhost:11434", model: str = "llama3.2"):
+    # Ollamaへの接続を保持する数と、生成APIのタイムアウト（接続, 読み込み）秒
+    HTTP_POOL_SIZE: ClassVar[int] = 4
+    HTTP_POOL_MAXSIZE: ClassVar[int] = 16
+    GENERATE_TIMEOUT: ClassVar[Tuple[float, float]] = (3, 30)
+
+    # Ollamaの利用可能性の確認結果を使う秒数と、確認のタイムアウト（初回, 再確認）秒
+    AVAILABILITY_TTL: ClassVar[float] = 30.0
+    AVAILABILITY_TIMEOUT: ClassVar[float] = 5
+    AVAILABILITY_RECHECK_TIMEOUT: ClassVar[float] = 0.5
+
+    # 生成APIがこの回数続けてタイムアウトしたら、TIMEOUT_COOLDOWN 秒は問い合わせずにフォールバックする
+    TIMEOUT_STREAK_LIMIT: ClassVar[int] = 3
+    TIMEOUT_COOLDOWN: ClassVar[float] = 60.0
+
+    # suggest_manyで同時に問い合わせる数（Ollama側の OLLAMA_NUM_PARALLEL に合わせる）
+    MAX_CONCURRENT_REQUESTS: ClassVar[int] = 4
+
+    # 軸コード情報
+    AXIS_KNOWLEDGE_BASE: ClassVar[Dict[str, Dict[str, str]]] = {
+        "地域軸": {
+            "cdArea": "地域コード",
+            "全国": "00000",
+            "都道府県": "01000-47000",
+            "市区町村": "詳細コード",
+        },
+        "時間軸": {
+            "cdTime": "時間コード",
+            "年次": "YYYY000000",
+            "月次": "YYYYMM0000",
+            "四半期": "YYYYQQ0000",
+        },
+        "分類軸": {
+            "cdCat01": "第1分類（年齢、性別等）",
+            "cdCat02": "第2分類（職業、産業等）",
+            "cdCat03": "第3分類（詳細分類）",
+        },
+    }
+
+    # プロンプトに載せる軸コード情報（軸コード情報から1度だけ組み立てる）
+    AXIS_CONTEXT: ClassVar[str] = "\n軸コード情報:\n" + "".join(
+        f"\n【{axis_type}】\n"
+        + "".join(f"  {code}: {description}\n" for code, description in info.items())
+        for axis_type, info in AXIS_KNOWLEDGE_BASE.items()
+    )
+
+    # プロンプトに載せる、クエリに関連する統計表の最大件数
+    STATS_CONTEXT_TOP_K: ClassVar[int] = 30
+
+    # 同じプロンプトへのOllamaの回答を保持する件数（古いものから破棄）
+    RESPONSE_CACHE_SIZE: ClassVar[int] = 512
+
+    # 回答中のJSONを途中から読み込むためのデコーダ
+    _JSON_DECODER: ClassVar[json.JSONDecoder] = json.JSONDecoder()
+
+    # Ollamaが利用できない場合の回答（Ollamaの回答と同じJSON文字列として1度だけ作る）
+    FALLBACK_RESPONSES: ClassVar[Dict[str, str]] = {
+        "population": json.dumps(
+            {
+                "stats_table_id": "00200521001",
+                "table_name": "国勢調査（人口等基本集計）",
+                "axis_mappings": {
+                    "cdCat01": "年齢階級",
+                    "cdCat02": "男女別",
+                    "cdArea": "地域コード",
+                },
+                "confidence": 0.7,
+                "reasoning": "人口関連クエリのため国勢調査を選択",
+            }
+        ),
+        "labor": json.dumps(
+            {
+                "stats_table_id": "00450011001",
+                "table_name": "労働力調査（基本集計）",
+                "axis_mappings": {"cdCat01": "労働力状態", "cdCat02": "男女別"},
+                "confidence": 0.6,
+                "reasoning": "労働関連クエリのため労働力調査を選択",
+            }
+        ),
+        "default": json.dumps(
+            {
+                "stats_table_id": "00200521001",
+                "table_name": "国勢調査（人口等基本集計）",
+                "axis_mappings": {"cdArea": "地域コード"},
+                "confidence": 0.4,
+                "reasoning": "一般的なクエリのためデフォルト統計表を選択",
+            }
+        ),
+    }
+
+    # フォールバックの回答を選ぶ規則（プロンプトに含まれるキーワード → FALLBACK_RESPONSESのキー）
+    FALLBACK_RULES: ClassVar[Tuple[Tuple[Tuple[str, ...], str], ...]] = (
+        (("人口",), "population"),
+        (("労働", "失業"), "labor"),
+    )
+
+    def __init__(
+        self,
+        base_url: str = "http://localhost:11434",
+        model: str = "llama3.2",
+        enable_semantic_cache: bool = False,
+        semantic_cache_threshold: float = 0.92,
+        verbose: bool = True,
+    ):
         self.base_url = base_url
         self.model = model
-        self.available = self._check_ollama_availability()
+        # Falseなら読み込み・更新の経過表示を省く（警告とエラーは常に表示）
+        self.verbose = verbose
+
+        # 問い合わせごとに接続し直さないよう、keep-aliveの接続を使い回すセッション
+        # （過負荷の502/503/504はRetry-Afterに従って生成APIのPOSTも再試行する。
+        # 接続拒否はOllama未起動、読み込みのタイムアウトは長く待つだけなので再試行しない）
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=self.HTTP_POOL_SIZE,
+            pool_maxsize=self.HTTP_POOL_MAXSIZE,
+            max_retries=Retry(
+                total=2,
+                connect=0,
+                read=False,
+                backoff_factor=0.3,
+                status_forcelist=(502, 503, 504),
+                allowed_methods=frozenset({"GET", "POST"}),
+                respect_retry_after_header=True,
+                raise_on_status=False,
+            ),
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        # 利用可能性の初回確認はメタデータの読み込みと並行して裏で行う
+        self._available = False
+        self._availability_checked_at = 0.0
+        self._availability_lock = threading.Lock()
+        self._availability_ready = threading.Event()
+        self._availability_probing = False
+        # 生成APIの連続タイムアウト回数と、問い合わせを止めておく期限（time.monotonic）
+        self._timeout_streak = 0
+        self._cooldown_until = 0.0
+        self._start_availability_check(self.AVAILABILITY_TIMEOUT)
+
+        # 統計表IDごとの軸コードの説明のキャッシュ
+        self._axis_cache: Dict[str, Dict] = {}
+        self._axis_cache_lock = threading.Lock()
+
+        # Ollamaの回答のキャッシュ（(モデル, プロンプト)のSHA-256 → 回答）
+        self._response_cache: OrderedDict = OrderedDict()
+        self._response_cache_lock = threading.Lock()
+
+        # 似たクエリへの統計表の提案を使い回すキャッシュ（有効にした場合のみ）
+        self.semantic_cache = (
+            SemanticResponseCache(threshold=semantic_cache_threshold)
+            if enable_semantic_cache
+            else None
+        )
+
+        # クエリに依らないプロンプトの前置き（初回の問い合わせ時に構築）
+        self._static_prompt_prefix: Optional[str] = None
+        # クエリに関連する統計表を選ぶための索引（初回の問い合わせ時に構築）
+        self._table_index: Optional[Tuple[List[Tuple[str, str, Dict]], Dict[str, List[int]]]] = None
 
         # 実際のe-statメタデータを読み込み
         self._load_real_estat_data()
 
-        # 軸コード情報
-        self.axis_knowledge_base = {
-            "地域軸": {
-                "cdArea": "地域コード",
-                "全国": "00000",
-                "都道府県": "01000-47000",
-                "市区町村": "詳細コード",
-            },
-            "時間軸": {
-                "cdTime": "時間コード",
-                "年次": "YYYY000000",
-                "月次": "YYYYMM0000",
-                "四半期": "YYYYQQ0000",
-            },
-            "分類軸": {
-                "cdCat01": "第1分類（年齢、性別等）",
-                "cdCat02": "第2分類（職業、産業等）",
-                "cdCat03": "第3分類（詳細分類）",
-            },
-        }
+        # 軸コード情報（定数はクラスで共有する）
+        self.axis_knowledge_base = self.AXIS_KNOWLEDGE_BASE
+
+    @property
+    def available(self) -> bool:
+        """Ollamaが利用できるか
 
-    def _check_ollama_availability(self) -> bool:
+        初回の確認が終わっていなければ待つ。確認から AVAILABILITY_TTL 秒を過ぎていれば
+        裏で確認し直し、終わるまでは前回の結果を返す。
+        タイムアウトが続いた後の TIMEOUT_COOLDOWN 秒間は確認せずに False を返す。
+        """
+        self._availability_ready.wait()
+        with self._availability_lock:
+            if time.monotonic() < self._cooldown_until:
+                return False
+            stale = time.monotonic() - self._availability_checked_at > self.AVAILABILITY_TTL
+        if stale:
+            self._start_availability_check(self.AVAILABILITY_RECHECK_TIMEOUT)
+        return self._available
+
+    @available.setter
+    def available(self, value: bool):
+        with self._availability_lock:
+            self._available = value
+            self._availability_checked_at = time.monotonic()
+        self._availability_ready.set()
+
+    def _start_availability_check(self, timeout: float):
+        """Ollamaの利用可能性の確認を裏のスレッドで始める（確認中なら何もしない）"""
+        with self._availability_lock:
+            if self._availability_probing:
+                return
+            self._availability_probing = True
+
+        def check():
+            available = self._check_ollama_availability(timeout)
+            with self._availability_lock:
+                self._availability_probing = False
+                if available:
+                    self._timeout_streak = 0
+            self.available = available
+
+        threading.Thread(target=check, daemon=True).start()
+
+    def _check_ollama_availability(self, timeout: float = 5) -> bool:
         """Ollamaの利用可能性をチェック"""
         try:
-            response = requests.get(f"{self.base_url}/api/tags", timeout=5)
+            response = self.session.get(f"{self.base_url}/api/tags", timeout=timeout)
             return response.status_code == 200
         except:
             return False
 
     def _call_ollama(self, prompt: str) -> str:
-        """Ollamaに問い合わせを実行"""
+        """Ollamaに問い合わせを実行（利用できない場合はフォールバック）"""
+        answer = self._generate(prompt)
+        return self._fallback_response(prompt) if answer is None else answer
+
+    def _generate(self, prompt: str) -> Optional[str]:
+        """Ollamaの生成APIに問い合わせ（同じモデル・プロンプトへの回答はキャッシュから返す）
+
+        Returns:
+            Ollamaの回答。Ollamaが利用できない・問い合わせに失敗した場合は None
+        """
         if not self.available:
-            return self._fallback_response(prompt)
+            return None
 
-        try:
-            response = requests.post(
-                f"{self.base_url}/api/generate",
-                json={"model": self.model, "prompt": prompt, "stream": False},
-                timeout=30,
-            )
+        key = hashlib.sha256(f"{self.model}\x00{prompt}".encode()).hexdigest()
+        with self._response_cache_lock:
+            cached = self._response_cache.get(key)
+            if cached is not None:
+                self._response_cache.move_to_end(key)
+                return cached
 
-            if response.status_code == 200:
-                return response.json().get("response", "")
-            else:
-                return self._fallback_response(prompt)
+        try:
+            answer = self._stream_until_json_closes(prompt)
+            with self._availability_lock:
+                self._timeout_streak = 0
+            if answer is None:
+                return None
 
         except Exception as e:
             print(f"Ollama接続エラー: {e}")
-            return self._fallback_response(prompt)
+            if isinstance(e, requests.Timeout):
+                self._record_timeout()
+            if isinstance(e, requests.ConnectionError):
+                # 次の確認までは問い合わせずにフォールバックする
+                self.available = False
+            return None
+
+        # 空の回答はキャッシュしない（次回は問い合わせ直す）
+        if not answer:
+            return answer
+        with self._response_cache_lock:
+            self._response_cache[key] = answer
+            self._response_cache.move_to_end(key)
+            if len(self._response_cache) > self.RESPONSE_CACHE_SIZE:
+                self._response_cache.popitem(last=False)
+        return answer
+
+    def _record_timeout(self):
+        """生成APIのタイムアウトを数え、続いた場合は TIMEOUT_COOLDOWN 秒間問い合わせを止める"""
+        with self._availability_lock:
+            self._timeout_streak += 1
+            if self._timeout_streak < self.TIMEOUT_STREAK_LIMIT:
+                return
+            self._timeout_streak = 0
+            self._cooldown_until = time.monotonic() + self.TIMEOUT_COOLDOWN
+        print(
+            f"⚠️ Ollamaの応答がないため、{self.TIMEOUT_COOLDOWN:.0f}秒間フォールバックを使用します"
+        )
+        self.available = False
+
+    def _stream_until_json_closes(self, prompt: str) -> Optional[str]:
+        """回答をストリーミングで受け取り、最初のJSONオブジェクトが閉じた時点で打ち切る
+
+        後に続く解説の生成を待たないよう、そこで接続を閉じてOllamaの生成を止める。
+
+        Returns:
+            それまでに受け取った回答。HTTPエラーの場合は None
+        """
+        with self.session.post(
+            f"{self.base_url}/api/generate",
+            json={"model": self.model, "prompt": prompt, "stream": True},
+            timeout=self.GENERATE_TIMEOUT,
+            stream=True,
+        ) as response:
+            if response.status_code != 200:
+                return None
+
+            chunks = []
+            tracker = _JsonObjectTracker()
+            for line in response.iter_lines(chunk_size=None):
+                if not line:
+                    continue
+                data = json.loads(line)
+                if "error" in data:
+                    raise RuntimeError(data["error"])
+                chunk = data.get("response", "")
+                chunks.append(chunk)
+                if tracker.feed(chunk) or data.get("done"):
+                    break
+            return "".join(chunks)
+
+    def clear_cache(self):
+        """Ollamaの回答・提案・軸コードの説明のキャッシュを破棄（モデルの更新時など）"""
+        with self._response_cache_lock:
+            self._response_cache.clear()
+        with self._axis_cache_lock:
+            self._axis_cache.clear()
+        if self.semantic_cache is not None:
+            self.semantic_cache.clear()
 
     def _fallback_response(self, prompt: str) -> str:
         """Ollamaが利用できない場合のフォールバック"""
-        # 簡単なルールベースの推定
-        if "人口" in prompt:
-            return json.dumps(
-                {
-                    "stats_table_id": "00200521001",
-                    "table_name": "国勢調査（人口等基本集計）",
-                    "axis_mappings": {
-                        "cdCat01": "年齢階級",
-                        "cdCat02": "男女別",
-                        "cdArea": "地域コード",
-                    },
-                    "confidence": 0.7,
-                    "reasoning": "人口関連クエリのため国勢調査を選択",
-                }
-            )
-        elif "労働" in prompt or "失業" in prompt:
-            return json.dumps(
-                {
-                    "stats_table_id": "00450011001",
-                    "table_name": "労働力調査（基本集計）",
-                    "axis_mappings": {"cdCat01": "労働力状態", "cdCat02": "男女別"},
-                    "confidence": 0.6,
-                    "reasoning": "労働関連クエリのため労働力調査を選択",
-                }
-            )
-        else:
-            return json.dumps(
-                {
-                    "stats_table_id": "00200521001",
-                    "table_name": "国勢調査（人口等基本集計）",
-                    "axis_mappings": {"cdArea": "地域コード"},
-                    "confidence": 0.4,
-                    "reasoning": "一般的なクエリのためデフォルト統計表を選択",
-                }
-            )
+        # 簡単なルールベースの推定（先に並んだ規則を優先）
+        for keywords, response_key in self.FALLBACK_RULES:
+            if any(keyword in prompt for keyword in keywords):
+                return self.FALLBACK_RESPONSES[response_key]
+        return self.FALLBACK_RESPONSES["default"]
 
     def suggest_stats_table_and_axes(
         self,
@@ -129,34 +479,63 @@ class OllamaStatsMCP:
     ) -> OllamaResponse:
         """クエリに基づいて統計表IDと軸情報を提案"""
 
+        # 似たクエリへの提案があれば、Ollamaに問い合わせずに使い回す
+        context = (self.model, region, time_period)
+        if self.semantic_cache is not None:
+            cached = self.semantic_cache.lookup(query, context)
+            if cached is not None:
+                return cached
+
         # Ollamaに送るプロンプトを構築
         prompt = self._build_suggestion_prompt(query, region, time_period)
 
         # Ollamaに問い合わせ
-        ai_response = self._call_ollama(prompt)
+        ai_response = self._generate(prompt)
+        if ai_response is None:
+            # フォールバックの提案はキャッシュしない
+            return self._parse_ollama_response(self._fallback_response(prompt))
 
         # レスポンスを解析
-        return self._parse_ollama_response(ai_response)
+        response = self._parse_ollama_response(ai_response)
+        if self.semantic_cache is not None:
+            self.semantic_cache.add(query, context, response)
+        return response
+
+    def suggest_many(self, queries: Iterable[Dict[str, Optional[str]]]) -> List[OllamaResponse]:
+        """複数のクエリへの提案を並行して問い合わせ、クエリの順に返す
+
+        Args:
+            queries: suggest_stats_table_and_axesの引数（query, region, time_period）の辞書
+        """
+        queries = list(queries)
+        if len(queries) <= 1:
+            return [self.suggest_stats_table_and_axes(**kwargs) for kwargs in queries]
+
+        # 問い合わせはネットワーク待ちが大半なので、セッションの接続プールをスレッドで共有する
+        workers = min(self.MAX_CONCURRENT_REQUESTS, len(queries))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(
+                executor.map(lambda kwargs: self.suggest_stats_table_and_axes(**kwargs), queries)
+            )
 
     def _build_suggestion_prompt(
         self, query: str, region: Optional[str], time_period: Optional[str]
     ) -> str:
-        """Ollama用のプロンプトを構築"""
+        """Ollama用のプロンプトを構築
 
-        # 実際のe-stat統計表情報をコンテキストとして提供
-        stats_context = self._get_comprehensive_stats_context()
+        クエリに依らない軸情報・回答形式は共通の前置きとして1度だけ組み立て、
+        クエリごとに変わる部分（関連する統計表とクエリ）を末尾に付ける
+        （前置きが同じならOllama側でも評価結果を使い回せる）。
+        """
+        prefix = self._static_prompt_prefix
+        if prefix is None:
+            prefix = self._static_prompt_prefix = self._build_static_prompt_prefix()
 
-        # 軸情報のコンテキスト
-        axis_context = "\n軸コード情報:\n"
-        for axis_type, info in self.axis_knowledge_base.items():
-            axis_context += f"\n【{axis_type}】\n"
-            for code, description in info.items():
-                if isinstance(description, str):
-                    axis_context += f"  {code}: {description}\n"
+        # クエリに関連する統計表だけをコンテキストとして提供
+        stats_context = self._get_stats_context_for_query(query)
 
-        prompt = f"""
-あなたは日本の政府統計データ（e-stat）の専門家です。
-以下のクエリに最適な統計表IDと軸パラメータを提案してください。
+        return f"""{prefix}
+{stats_context}
 
 【クエリ】
 {query}
@@ -165,7 +544,18 @@ class OllamaStatsMCP:
 地域: {region if region else "指定なし"}
 時期: {time_period if time_period else "指定なし"}
 
-{stats_context}
+クエリに最も適した統計表とパラメータを提案してください。
+        """
+
+    def _build_static_prompt_prefix(self) -> str:
+        """プロンプトのうちクエリに依らない前置き（軸情報・回答形式）を構築"""
+
+        # 軸情報のコンテキスト
+        axis_context = self.AXIS_CONTEXT
+
+        return f"""
+あなたは日本の政府統計データ（e-stat）の専門家です。
+末尾のクエリに最適な統計表IDと軸パラメータを提案してください。
 
 {axis_context}
 
@@ -185,24 +575,83 @@ class OllamaStatsMCP:
 }}
 
 注意事項:
-- 統計表IDは必ず上記リストから選択
+- 統計表IDは必ず下記の統計表一覧から選択
 - 軸マッピングは実際に必要なもののみ含める
 - 信頼度は選択の確実性を0-1で評価
 - 理由は簡潔に日本語で説明
+"""
 
-クエリに最も適した統計表とパラメータを提案してください。
+    def _get_stats_context_for_query(self, query: str) -> str:
+        """クエリと語の重なる統計表を上位 STATS_CONTEXT_TOP_K 件だけ並べたコンテキストを生成
+
+        統計名・表題とクエリの文字bigramの一致数で統計表を選ぶ。
+        実データがない、または一致する統計表がない場合は包括的なコンテキストを返す。
         """
+        if not self.real_stats_data:
+            return self._get_comprehensive_stats_context()
+
+        index = self._table_index
+        if index is None:
+            index = self._table_index = self._build_table_index()
+        tables, postings = index
+
+        # 統計表ごとに、クエリのbigramのうち統計名・表題に含まれるものを数える
+        overlaps: Counter = Counter()
+        for gram in _char_bigrams(query):
+            overlaps.update(postings.get(gram, ()))
+        if not overlaps:
+            return self._get_comprehensive_stats_context()
+
+        # 一致数の多い順（同数なら一覧の順）
+        ranked = heapq.nlargest(
+            self.STATS_CONTEXT_TOP_K, overlaps.items(), key=lambda item: (item[1], -item[0])
+        )
 
-        return prompt
+        parts = [
+            f"""
+e-stat政府統計データベース（統計表総数: {self.real_stats_data.get("统计表总数", 0)}件）
+最終更新: {self.real_stats_data.get("最新更新", "unknown")}
+
+=== クエリに関連する統計表一覧（{len(ranked)}件） ===
+"""
+        ]
+        for position, _ in ranked:
+            main_category, sub_category, table = tables[position]
+            table_id, stat_name, title, org = (
+                table.get(key, "") for key in ("统计表ID", "统计名称", "表标题", "实施机关")
+            )
+            parts.append(
+                f"  {table_id}: {stat_name} - {title} ({org}) 〔{main_category} ▶ {sub_category}〕\n"
+            )
+
+            # 利用可能な軸情報
+            axes = table.get("可用轴", {})
+            if axes:
+                parts.append(f"    軸: {', '.join(axes)}\n")
+
+        return "".join(parts)
+
+    def _build_table_index(self) -> Tuple[List[Tuple[str, str, Dict]], Dict[str, List[int]]]:
+        """統計表の一覧と、統計名・表題の文字bigramから統計表の位置を引く転置索引を構築"""
+        tables = [
+            (main_category, sub_category, table)
+            for main_category, subcategories in self.real_stats_data.get("分类统计表", {}).items()
+            for sub_category, sub_tables in subcategories.items()
+            for table in sub_tables
+        ]
+        postings: Dict[str, List[int]] = {}
+        for position, (_, _, table) in enumerate(tables):
+            text = f"{table.get('统计名称', '')} {table.get('表标题', '')}"
+            for gram in _char_bigrams(text):
+                postings.setdefault(gram, []).append(position)
+        return tables, postings
 
     def _parse_ollama_response(self, ai_response: str) -> OllamaResponse:
         """Ollamaのレスポンスを解析"""
         try:
             # JSON部分を抽出
-            json_match = re.search(r"\{.*\}", ai_response, re.DOTALL)
-            if json_match:
-                response_data = json.loads(json_match.group())
-
+            response_data = self._extract_first_json_object(ai_response)
+            if response_data is not None:
                 return OllamaResponse(
                     stats_table_id=response_data.get("stats_table_id", ""),
                     table_name=response_data.get("table_name", ""),
@@ -218,6 +667,29 @@ class OllamaStatsMCP:
             print(f"Ollamaレスポンス解析エラー: {e}")
             return self._create_fallback_response()
 
+    @classmethod
+    def _extract_first_json_object(cls, ai_response: str) -> Optional[Dict]:
+        """回答中の最初のJSONオブジェクトを読み込む
+
+        最初の「{」から1回の走査でオブジェクトの終わりまでを解析し、後ろに続く文章は無視する。
+
+        Returns:
+            読み込んだオブジェクト。「{」がなければ None（壊れたJSONは json.JSONDecodeError）
+        """
+        start = ai_response.find("{")
+        if start < 0:
+            return None
+
+        # 回答がJSONだけ（前後は空白やコードブロックの記号のみ）の場合はorjsonでまとめて読む
+        if orjson is not None:
+            try:
+                return orjson.loads(ai_response[start : ai_response.rfind("}") + 1])
+            except orjson.JSONDecodeError:
+                pass  # 後ろの文章に「}」がある場合などは、先頭のオブジェクトだけを読み直す
+
+        response_data, _ = cls._JSON_DECODER.raw_decode(ai_response, start)
+        return response_data
+
     def _create_fallback_response(self) -> OllamaResponse:
         """フォールバック用のレスポンス"""
         return OllamaResponse(
@@ -229,8 +701,25 @@ class OllamaStatsMCP:
         )
 
     def explain_axis_codes(self, stats_table_id: str) -> Dict[str, str]:
-        """統計表IDに対応する軸コードの詳細説明を取得"""
-
+        """統計表IDに対応する軸コードの詳細説明を取得（統計表IDごとに結果をキャッシュする）"""
+        with self._axis_cache_lock:
+            cached = self._axis_cache.get(stats_table_id)
+        if cached is None:
+            axis_details, cacheable = self._explain_axis_codes_uncached(stats_table_id)
+            if not cacheable:
+                return axis_details
+            with self._axis_cache_lock:
+                cached = self._axis_cache.setdefault(stats_table_id, axis_details)
+
+        # キャッシュ内の説明を呼び出し元が書き換えないよう複製を返す
+        return copy.deepcopy(cached)
+
+    def _explain_axis_codes_uncached(self, stats_table_id: str) -> Tuple[Dict, bool]:
+        """軸コードの詳細説明を取得
+
+        Returns:
+            (説明, キャッシュしてよいか)。メタデータかOllamaの回答から得た説明だけをキャッシュする
+        """
         # 実際のメタデータから軸情報を取得
         if self.metadata_loader:
             try:
@@ -250,7 +739,7 @@ class OllamaStatsMCP:
                         }
 
                     if formatted_axes:
-                        return formatted_axes
+                        return formatted_axes, True
             except Exception as e:
                 print(f"実際の軸データ取得エラー: {e}")
 
@@ -280,17 +769,20 @@ JSON形式で回答:
 }}
         """
 
-        ai_response = self._call_ollama(prompt)
+        ai_response = self._generate(prompt)
+        cacheable = ai_response is not None
+        if ai_response is None:
+            ai_response = self._fallback_response(prompt)
 
         try:
-            json_match = re.search(r"\{.*\}", ai_response, re.DOTALL)
-            if json_match:
-                return json.loads(json_match.group())
+            axis_details = self._extract_first_json_object(ai_response)
+            if axis_details is not None:
+                return axis_details, cacheable
         except:
             pass
 
         # フォールバック
-        return {
+        fallback_axes = {
             "cdArea": {
                 "description": "地域コード（都道府県・市区町村）",
                 "examples": {"00000": "全国", "13000": "東京都", "27000": "大阪府"},
@@ -304,6 +796,7 @@ JSON形式で回答:
                 "examples": {"001": "総数", "002": "男性", "003": "女性"},
             },
         }
+        return fallback_axes, False
 
     def _load_real_estat_data(self):
         """実際のe-statメタデータを読み込み"""
@@ -315,9 +808,11 @@ JSON形式で回答:
             # Ollama用の統計表データを読み込み
             self.real_stats_data = self.metadata_loader.load_all_stats_for_ollama()
 
-            print(
-                f"✅ 実際のe-statデータを読み込み: {self.real_stats_data.get('统计表总数', 0)}件の統計表"
-            )
+            if self.verbose:
+                print(
+                    "✅ 実際のe-statデータを読み込み: "
+                    f"{self.real_stats_data.get('统计表总数', 0)}件の統計表"
+                )
 
             # 統計表データが空の場合はキャッシュ更新を提案
             if self.real_stats_data.get("统计表总数", 0) == 0:
@@ -336,11 +831,16 @@ JSON形式で回答:
     def _update_metadata_if_needed(self):
         """必要に応じてメタデータキャッシュを更新"""
         if self.metadata_loader:
-            print("🔄 e-statメタデータキャッシュを更新中...")
+            if self.verbose:
+                print("🔄 e-statメタデータキャッシュを更新中...")
             try:
                 self.metadata_loader.update_metadata_cache(max_tables=500)
                 self.real_stats_data = self.metadata_loader.load_all_stats_for_ollama()
-                print(f"✅ 更新完了: {self.real_stats_data.get('统计表总数', 0)}件の統計表")
+                self._table_index = None  # 統計表一覧が変わったため索引を作り直す
+                with self._axis_cache_lock:
+                    self._axis_cache.clear()
+                if self.verbose:
+                    print(f"✅ 更新完了: {self.real_stats_data.get('统计表总数', 0)}件の統計表")
             except Exception as e:
                 print(f"❌ メタデータ更新エラー: {e}")
 
@@ -359,41 +859,41 @@ JSON形式で回答:
   00200553001: 家計調査（家計収支編）
             """
 
-        # 実際のデータから詳細なコンテキストを生成
-        context = f"""
+        # 実際のデータから詳細なコンテキストを生成（断片を集めて最後に1度だけ連結する）
+        parts = [
+            f"""
 e-stat政府統計データベース（統計表総数: {self.real_stats_data.get("统计表总数", 0)}件）
 最終更新: {self.real_stats_data.get("最新更新", "unknown")}
 
 === 利用可能な統計表一覧 ===
 """
+        ]
 
         # カテゴリ別統計表を整理
         categories = self.real_stats_data.get("分类统计表", {})
 
         for main_category, subcategories in categories.items():
-            context += f"\n【{main_category}】\n"
+            parts.append(f"\n【{main_category}】\n")
 
             for sub_category, tables in subcategories.items():
-                context += f"  ▶ {sub_category}\n"
+                parts.append(f"  ▶ {sub_category}\n")
 
                 # 各サブカテゴリから代表的な統計表を選択（最大3件）
                 for table in tables[:3]:
-                    table_id = table.get("统计表ID", "")
-                    stat_name = table.get("统计名称", "")
-                    title = table.get("表标题", "")
-                    org = table.get("实施机关", "")
-
-                    context += f"    {table_id}: {stat_name} - {title} ({org})\n"
+                    table_id, stat_name, title, org = (
+                        table.get(key, "") for key in ("统计表ID", "统计名称", "表标题", "实施机关")
+                    )
+                    parts.append(f"    {table_id}: {stat_name} - {title} ({org})\n")
 
                     # 利用可能な軸情報
                     axes = table.get("可用轴", {})
                     if axes:
-                        context += f"      軸: {', '.join(axes.keys())}\n"
+                        parts.append(f"      軸: {', '.join(axes)}\n")
 
                 if len(tables) > 3:
-                    context += f"    ... 他{len(tables) - 3}件\n"
+                    parts.append(f"    ... 他{len(tables) - 3}件\n")
 
-        return context
+        return "".join(parts)
 
     def get_ollama_status(self) -> Dict[str, any]:
         """Ollama接続状況を取得"""
@@ -426,12 +926,13 @@ def main():
         "都道府県別の人口推移を比較したい",
     ]
 
-    for query in test_queries:
-        print(f"\n--- クエリ: {query} ---")
+    # 提案はまとめて並行に問い合わせる
+    responses = ollama_mcp.suggest_many(
+        {"query": query, "region": "東京都" if "東京" in query else None} for query in test_queries
+    )
 
-        response = ollama_mcp.suggest_stats_table_and_axes(
-            query=query, region="東京都" if "東京" in query else None
-        )
+    for query, response in zip(test_queries, responses):
+        print(f"\n--- クエリ: {query} ---")
 
         print(f"統計表ID: {response.stats_table_id}")
         print(f"統計表名: {response.table_name}")
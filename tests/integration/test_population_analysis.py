@@ -6,9 +6,6 @@
 import sys
 from pathlib import Path
 
-import japanize_matplotlib
-import matplotlib.pyplot as plt
-import pandas as pd
 import pytest
 
 # プロジェクトパスを追加
@@ -0,0 +1,110 @@
+"""カタログダウンローダー（EStatCatalogDownloader）のテスト"""
+
+import sys
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+sys.path.append(str(Path(__file__).parent.parent.parent / "scripts"))
+from catalog_downloader import EStatCatalogDownloader
+
+STATS_LIST_XML = """<?xml version="1.0" encoding="UTF-8"?>
+<GET_STATS_LIST>
+  <RESULT><STATUS>0</STATUS></RESULT>
+  <DATALIST_INF>
+    <NUMBER>3</NUMBER>
+    <TABLE_INF id="0003448237">
+      <STAT_NAME code="00200521">国勢調査</STAT_NAME>
+      <GOV_ORG code="00200">総務省</GOV_ORG>
+      <TITLE>人口総数</TITLE>
+    </TABLE_INF>
+    <TABLE_INF id="0003000001">
+      <STAT_NAME code="00200531">労働力調査</STAT_NAME>
+      <TITLE>完全失業率</TITLE>
+      <MAIN_CATEGORY code="03">労働・賃金</MAIN_CATEGORY>
+    </TABLE_INF>
+    <TABLE_INF id="0003000002">
+      <STAT_NAME code="00200561">家計調査</STAT_NAME>
+      <GOV_ORG code="00200">総務省</GOV_ORG>
+      <TITLE>消費支出</TITLE>
+    </TABLE_INF>
+  </DATALIST_INF>
+</GET_STATS_LIST>
+""".encode()
+
+
+def split_chunks(data: bytes, size: int):
+    """要素やマルチバイト文字の途中でも区切るチャンク列"""
+    return [data[start : start + size] for start in range(0, len(data), size)]
+
+
+@pytest.mark.parametrize("chunk_size", [7, 64, len(STATS_LIST_XML)])
+def test_read_table_info_columns(chunk_size):
+    """TABLE_INFのid属性と子要素をカラムごとに集め、欠けた値はNoneで埋める"""
+    columns = EStatCatalogDownloader._read_table_info_columns(
+        split_chunks(STATS_LIST_XML, chunk_size)
+    )
+
+    assert columns == {
+        "TABLE_INF": ["0003448237", "0003000001", "0003000002"],
+        "STAT_NAME": ["国勢調査", "労働力調査", "家計調査"],
+        "GOV_ORG": ["総務省", None, "総務省"],
+        "TITLE": ["人口総数", "完全失業率", "消費支出"],
+        "MAIN_CATEGORY": [None, "労働・賃金", None],
+    }
+
+
+def test_read_table_info_columns_without_tables():
+    """統計表がなければ空のカラムを返す"""
+    xml = (
+        b'<?xml version="1.0"?><GET_STATS_LIST><RESULT><STATUS>1</STATUS></RESULT></GET_STATS_LIST>'
+    )
+    assert EStatCatalogDownloader._read_table_info_columns([xml]) == {"TABLE_INF": []}
+
+
+def test_iter_classified(tmp_path, monkeypatch):
+    """統計名・機関名・主分類のキーワードで分野に分け、どれにも当たらない表は「その他」にする"""
+    catalog = pd.DataFrame(
+        {
+            "TABLE_INF": ["0003448237", "0003000001", "0003000002", "0003000003"],
+            "STAT_NAME": ["国勢調査", "四半期別gdp速報", "科学技術研究調査", "その他の調査"],
+            "GOV_ORG": ["総務省", "内閣府", None, "某機関"],
+            "MAIN_CATEGORY": [None, "企業・家計・経済", "情報通信・科学技術", None],
+        }
+    )
+    monkeypatch.chdir(tmp_path)
+    downloader = EStatCatalogDownloader(appid="test")
+
+    classified = {
+        field_code: field_catalog["TABLE_INF"].tolist()
+        for field_code, field_catalog in downloader.iter_classified(catalog)
+    }
+
+    # キーワードは大文字小文字を区別せずに照合する(「gdp」は「GDP」に当たる)
+    assert classified == {
+        "01": ["0003448237"],
+        "07": ["0003000001"],
+        "11": ["0003000002"],
+        "99": ["0003000003"],
+    }
+
+
+def test_save_catalogs_writes_one_header(tmp_path, monkeypatch):
+    """空の分野が先頭にあっても統合CSVのヘッダ行は1行だけ"""
+    monkeypatch.chdir(tmp_path)
+    downloader = EStatCatalogDownloader(appid="test")
+    columns = ["TABLE_INF", "STAT_NAME", "GOV_ORG"]
+    catalogs = {
+        "01": pd.DataFrame(columns=columns, dtype=object),
+        "03": pd.DataFrame([["0003000001", "労働力調査", "総務省"]], columns=columns),
+        "07": pd.DataFrame([["0003000002", "家計調査", "総務省"]], columns=columns),
+    }
+
+    downloader.save_catalogs(catalogs, "20250101_000000")
+
+    combined = Path(downloader.output_dir) / "estat_catalog_combined_20250101_000000.csv"
+    lines = combined.read_text(encoding="utf-8-sig").splitlines()
+    assert lines[0].startswith('"TABLE_INF"')
+    assert len(lines) == 3
+    assert pd.read_csv(combined, dtype=str)["TABLE_INF"].tolist() == ["0003000001", "0003000002"]
@@ -0,0 +1,93 @@
+"""カタログ統合（CatalogIntegrator）のテスト"""
+
+import sqlite3
+import sys
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+sys.path.append(str(Path(__file__).parent.parent.parent / "src"))
+sys.path.append(str(Path(__file__).parent.parent.parent / "scripts"))
+from catalog_downloader import EStatCatalogDownloader
+
+from opendatajounalism.mcp.catalog_integration import CatalogIntegrator
+
+STATS_LIST_XML = """<?xml version="1.0" encoding="UTF-8"?>
+<GET_STATS_LIST>
+  <RESULT><STATUS>0</STATUS></RESULT>
+  <DATALIST_INF>
+    <TABLE_INF id="0003448237">
+      <STAT_NAME code="00200521">国勢調査</STAT_NAME>
+      <GOV_ORG code="00200">総務省</GOV_ORG>
+      <TITLE>人口総数</TITLE>
+      <MAIN_CATEGORY code="01">人口・世帯</MAIN_CATEGORY>
+    </TABLE_INF>
+    <TABLE_INF id="0003000001">
+      <STAT_NAME code="00200531">労働力調査</STAT_NAME>
+      <GOV_ORG code="00200">総務省</GOV_ORG>
+      <TITLE>完全失業率</TITLE>
+      <MAIN_CATEGORY code="03">労働・賃金</MAIN_CATEGORY>
+    </TABLE_INF>
+    <TABLE_INF id="0003000002">
+      <STAT_NAME code="00200561">家計調査</STAT_NAME>
+      <GOV_ORG code="00200">総務省</GOV_ORG>
+      <TITLE>消費支出</TITLE>
+      <MAIN_CATEGORY code="07">企業・家計・経済</MAIN_CATEGORY>
+    </TABLE_INF>
+  </DATALIST_INF>
+</GET_STATS_LIST>
+""".encode()
+
+
+@pytest.fixture
+def integrator(tmp_path, monkeypatch):
+    """カタログダウンローダーで保存したカタログを同期対象とするCatalogIntegrator"""
+    monkeypatch.chdir(tmp_path)
+    downloader = EStatCatalogDownloader(appid="test")
+    catalog = pd.DataFrame(downloader._read_table_info_columns([STATS_LIST_XML]))
+    downloader.save_catalogs(downloader.iter_classified(catalog), "20250101_000000")
+    return CatalogIntegrator(catalog_dir=downloader.output_dir, mcp_data_dir="mcp")
+
+
+def _query(integrator, sql):
+    conn = sqlite3.connect(integrator.mcp_data_dir / "catalog_index.db")
+    try:
+        return conn.execute(sql).fetchall()
+    finally:
+        conn.close()
+
+
+def test_resync_does_not_duplicate_rows(integrator):
+    """同じカタログを2回同期しても行が重複しない"""
+    integrator.update_catalog_and_sync()
+    integrator.update_catalog_and_sync()
+
+    rows = _query(integrator, "SELECT stats_data_id FROM stats_tables ORDER BY stats_data_id")
+    assert rows == [("0003000001",), ("0003000002",), ("0003448237",)]
+
+
+def test_sync_populates_keyword_index(integrator):
+    """同期後のキーワード対応表から統計表を引ける"""
+    integrator.sync_catalog_to_mcp_db()
+    integrator.sync_catalog_to_mcp_db()
+
+    rows = _query(integrator, "SELECT stats_data_id, keyword FROM stats_keywords ORDER BY 1, 2")
+    assert ("0003448237", "人口") in rows
+    assert ("0003000001", "労働") in rows
+    assert ("0003000002", "家計") in rows
+    assert len(rows) == len(set(rows))
+
+
+def test_sync_skips_rows_without_table_id(tmp_path):
+    """統計表IDのない行は取り込まない"""
+    catalog_dir = tmp_path / "estat_catalog"
+    catalog_dir.mkdir()
+    (catalog_dir / "estat_catalog_combined_20250101_000000.csv").write_text(
+        "STAT_NAME,TITLE\n国勢調査,人口総数\n", encoding="utf-8"
+    )
+    integrator = CatalogIntegrator(catalog_dir=str(catalog_dir), mcp_data_dir=str(tmp_path / "mcp"))
+
+    integrator.sync_catalog_to_mcp_db()
+
+    assert _query(integrator, "SELECT COUNT(*) FROM stats_tables") == [(0,)]
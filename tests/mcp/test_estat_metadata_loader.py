@@ -0,0 +1,217 @@
+"""e-stat メタデータローダーのテスト"""
+
+import os
+import sys
+import time
+from pathlib import Path
+
+import pytest
+import requests
+
+sys.path.append(str(Path(__file__).parent.parent.parent / "src"))
+from opendatajounalism.mcp.estat_metadata_loader import EstatMetadataLoader
+
+
+def stats_list_xml(count: int, status: int = 0) -> bytes:
+    """getStatsListのレスポンス（人口関連の統計表をcount件含む）"""
+    tables = "".join(
+        f"""
+    <TABLE_INF id="{table_id:010d}">
+      <STAT_NAME code="00200521">国勢調査</STAT_NAME>
+      <GOV_ORG code="00200">総務省</GOV_ORG>
+      <TITLE no="{table_id}">人口等基本集計 {table_id}</TITLE>
+      <SURVEY_DATE>202010</SURVEY_DATE>
+      <SMALL_AREA>1</SMALL_AREA>
+      <MAIN_CATEGORY code="02">人口・世帯</MAIN_CATEGORY>
+      <SUB_CATEGORY code="01">人口</SUB_CATEGORY>
+      <OVERALL_TOTAL_NUMBER>1234</OVERALL_TOTAL_NUMBER>
+    </TABLE_INF>"""
+        for table_id in range(3448237, 3448237 + count)
+    )
+    return f"""<?xml version="1.0" encoding="UTF-8"?>
+<GET_STATS_LIST>
+  <RESULT>
+    <STATUS>{status}</STATUS>
+    <ERROR_MSG>{"正常に終了しました。" if status == 0 else "認証に失敗しました。"}</ERROR_MSG>
+  </RESULT>
+  <DATALIST_INF>{tables}
+  </DATALIST_INF>
+</GET_STATS_LIST>
+""".encode()
+
+
+META_INFO_XML = """<?xml version="1.0" encoding="UTF-8"?>
+<GET_META_INFO>
+  <RESULT><STATUS>0</STATUS></RESULT>
+  <METADATA_INF>
+    <CLASS_INF>
+      <CLASS_OBJ id="area" name="地域">
+        <CLASS code="00000" name="全国" level="1"/>
+        <CLASS code="13000" name="東京都" level="2" parentCode="00000"/>
+      </CLASS_OBJ>
+    </CLASS_INF>
+  </METADATA_INF>
+</GET_META_INFO>
+""".encode()
+
+
+class FakeResponse:
+    """requests.Responseのうちローダーが使う部分だけを持つレスポンス"""
+
+    def __init__(self, body=b"", status_code=200, headers=None, fail_after=None):
+        self.body = body
+        self.status_code = status_code
+        self.headers = headers or {}
+        # 指定したバイト数を送った後に接続が切れたものとして例外を送出する
+        self.fail_after = fail_after
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code} Error")
+
+    def iter_content(self, chunk_size=1):
+        # パーサが要素の途中で区切られたチャンクも扱えるよう、小さく分けて返す
+        for start in range(0, len(self.body), 100):
+            if self.fail_after is not None and start >= self.fail_after:
+                raise requests.ConnectionError("Connection broken")
+            yield self.body[start : start + 100]
+
+
+class FakeSession:
+    """URLごとに用意したレスポンスを返し、受け取ったリクエストを記録するセッション"""
+
+    def __init__(self):
+        self.stats_list_responses = []
+        self.requests = []
+
+    def get(self, url, params=None, headers=None, timeout=None, stream=False):
+        self.requests.append((url, dict(headers or {})))
+        if url.endswith("/getMetaInfo"):
+            return FakeResponse(META_INFO_XML)
+        return self.stats_list_responses.pop(0)
+
+
+@pytest.fixture
+def loader(tmp_path, monkeypatch):
+    """一時ディレクトリとフェイクのセッションを使うローダー"""
+    monkeypatch.setenv("ESTAT_APPID", "test-appid")
+    loader = EstatMetadataLoader(data_dir=str(tmp_path))
+    loader.session = FakeSession()
+    yield loader
+    loader.close()
+
+
+def stats_list_requests(loader):
+    return [request for request in loader.session.requests if request[0].endswith("getStatsList")]
+
+
+def test_fetch_all_stats_tables_reads_id_and_code_attributes(loader):
+    """統計表IDはTABLE_INFのid属性、統計コードや分類コードは子要素のcode属性から読む"""
+    loader.session.stats_list_responses.append(FakeResponse(stats_list_xml(2)))
+
+    tables = list(loader.fetch_all_stats_tables(limit=2))
+
+    assert [table["table_id"] for table in tables] == ["0003448237", "0003448238"]
+    table = tables[0]
+    assert table["stat_id"] == "00200521"
+    assert table["stat_name"] == "国勢調査"
+    assert table["title"] == "人口等基本集計 3448237"
+    assert table["main_category_code"] == "02"
+    assert table["sub_category"] == "人口"
+    assert table["small_area"] == 1
+    assert table["overall_total_number"] == 1234
+
+
+def test_response_cache_is_reused_within_ttl(loader):
+    """有効期限内は同じリクエストをe-statに送らない"""
+    loader.session.stats_list_responses.append(FakeResponse(stats_list_xml(2)))
+
+    first = list(loader.fetch_all_stats_tables(limit=2))
+    second = list(loader.fetch_all_stats_tables(limit=2))
+
+    assert [table["table_id"] for table in second] == [table["table_id"] for table in first]
+    assert len(stats_list_requests(loader)) == 1
+
+
+def test_expired_cache_is_revalidated_with_etag(loader):
+    """期限切れのキャッシュは条件付きリクエストで確認し、304なら再利用する"""
+    loader.session.stats_list_responses.append(
+        FakeResponse(stats_list_xml(2), headers={"ETag": '"v1"'})
+    )
+    list(loader.fetch_all_stats_tables(limit=2))
+
+    # キャッシュを期限切れにする
+    [cache_path] = loader.http_cache_dir.glob("*.xml")
+    expired = time.time() - loader.HTTP_CACHE_TTL_SECONDS - 60
+    os.utime(cache_path, (expired, expired))
+
+    loader.session.stats_list_responses.append(FakeResponse(status_code=304))
+    tables = list(loader.fetch_all_stats_tables(limit=2))
+
+    assert len(tables) == 2
+    _, headers = stats_list_requests(loader)[-1]
+    assert headers["If-None-Match"] == '"v1"'
+    # 304で再利用したキャッシュは有効期限が延びる
+    assert time.time() - cache_path.stat().st_mtime < loader.HTTP_CACHE_TTL_SECONDS
+
+
+def test_error_status_is_not_cached(loader):
+    """HTTP 200でもRESULT/STATUSがエラーのレスポンスはキャッシュせず例外にする"""
+    loader.session.stats_list_responses.append(FakeResponse(stats_list_xml(0, status=100)))
+
+    with pytest.raises(RuntimeError, match="STATUS 100"):
+        list(loader.fetch_all_stats_tables(limit=2))
+    assert not list(loader.http_cache_dir.glob("*.xml"))
+
+    # 次の取得ではe-statに問い合わせ直す
+    loader.session.stats_list_responses.append(FakeResponse(stats_list_xml(2)))
+    assert len(list(loader.fetch_all_stats_tables(limit=2))) == 2
+    assert len(stats_list_requests(loader)) == 2
+
+
+def test_use_cache_false_bypasses_cache(loader):
+    """use_cache=Falseなら有効期限内でもe-statから取得し直す"""
+    loader.session.stats_list_responses.append(FakeResponse(stats_list_xml(1)))
+    list(loader.fetch_all_stats_tables(limit=3))
+
+    loader.session.stats_list_responses.append(FakeResponse(stats_list_xml(3)))
+    tables = list(loader.fetch_all_stats_tables(limit=3, use_cache=False))
+
+    assert len(tables) == 3
+    assert len(stats_list_requests(loader)) == 2
+    # 条件付きリクエストにもしない
+    assert "If-None-Match" not in stats_list_requests(loader)[-1][1]
+
+
+def test_update_metadata_cache_saves_tables_and_metadata(loader):
+    """統計表リストと優先統計表のメタデータを保存する"""
+    loader.session.stats_list_responses.append(FakeResponse(stats_list_xml(3)))
+
+    loader.update_metadata_cache(max_tables=3)
+
+    ollama_data = loader.load_all_stats_for_ollama()
+    assert ollama_data["统计表总数"] == 3
+    tables = ollama_data["分类统计表"]["人口・世帯"]["人口"]
+    assert tables[0]["可用轴"]["area"]["name"] == "地域"
+    axis = loader.get_table_axis_details("0003448237")["area"]
+    assert [value["code"] for value in axis["values"]] == ["00000", "13000"]
+
+
+def test_failed_refresh_keeps_existing_cache(loader):
+    """統計表リストの受信が途中で切れた場合は既存のキャッシュを残す"""
+    loader.session.stats_list_responses.append(FakeResponse(stats_list_xml(20)))
+    loader.update_metadata_cache(max_tables=20)
+
+    body = stats_list_xml(20)
+    loader.session.stats_list_responses.append(FakeResponse(body, fail_after=len(body) // 3))
+    with pytest.raises(requests.ConnectionError):
+        loader.update_metadata_cache(max_tables=20, use_cache=False)
+
+    assert loader.load_all_stats_for_ollama()["统计表总数"] == 20
+    assert loader.get_table_axis_details("0003448237")
@@ -1,10 +1,12 @@
 """e-stat Query Translator のテスト"""
 
 import shutil
+import sqlite3
 import sys
 import tempfile
 from pathlib import Path
 
+import numpy as np
 import pytest
 
 sys.path.append(str(Path(__file__).parent.parent.parent / "src"))
@@ -65,3 +67,78 @@ def test_query_suggestions(translator):
     suggestions = translator.get_query_suggestions("東京")
     assert len(suggestions) > 0
     assert any("東京" in suggestion for suggestion in suggestions)
+
+
+@pytest.fixture
+def rule_translator(temp_data_dir):
+    """Ollamaを使わないルールベースのTranslatorインスタンス"""
+    translator = EstatQueryTranslator(data_dir=temp_data_dir, use_ollama=False, verbose=False)
+    yield translator
+    translator.close()
+
+
+@pytest.mark.parametrize(
+    "query",
+    [
+        "全国の男女別人口",
+        "東京都の人口",
+        "最新の完全失業率",
+        "全国の年齢別人口と失業率",
+        "統計データ",
+    ],
+)
+def test_score_candidates_matches_calculate_confidence(rule_translator, query):
+    """SQLでまとめて計算した信頼度が calculate_confidence と一致する"""
+    entities = rule_translator.parse_query(query)
+
+    scored = rule_translator._score_candidates(entities)
+    expected = {
+        table["stats_data_id"]: rule_translator.calculate_confidence(entities, table)
+        for table in rule_translator.search_stats_tables(entities)
+    }
+
+    assert dict(zip(scored["stats_data_id"], scored["score"])) == pytest.approx(expected)
+
+
+@pytest.mark.parametrize("k", [0, 1, 3, 7, 20, 25])
+def test_top_k_indices_matches_stable_sort(k):
+    """上位k件の位置が、信頼度の降順に安定ソートした先頭k件と一致する（同点は位置の若い順）"""
+    scores = np.random.default_rng(0).choice([0.2, 0.5, 0.75, 1.0], size=20)
+
+    expected = np.argsort(-scores, kind="stable")[:k]
+    assert EstatQueryTranslator._top_k_indices(scores, k).tolist() == expected.tolist()
+
+
+def test_translation_cache_returns_copies(rule_translator):
+    """キャッシュした変換結果を呼び出し側が書き換えても、次の結果に影響しない"""
+    first = rule_translator.translate_query("全国の男女別人口")
+    first[0].parameters["cdArea"] = "99999"
+    first[0].alternative_suggestions.clear()
+
+    second = rule_translator.translate_query("全国の男女別人口")
+    assert second[0].parameters.get("cdArea") != "99999"
+    assert second[0].alternative_suggestions
+
+
+def test_translation_cache_invalidated_when_database_changes(rule_translator):
+    """カタログDBが更新されたら、同じクエリでもキャッシュを使わず変換し直す"""
+    query = "全国の男女別人口"
+    assert rule_translator.translate_query(query)[0].stats_data_id != "0000000001"
+
+    # 同じ信頼度なら統計表ID順で先になる統計表を追加する
+    conn = sqlite3.connect(rule_translator.db_path)
+    with conn:
+        conn.execute(
+            """
+            INSERT INTO stats_tables
+            (stats_data_id, table_name, description, keywords, available_areas, categories)
+            VALUES ('0000000001', '人口動態', '人口動態（男女別）', '["人口", "男女"]',
+                    '["全国"]', '{"cdCat01": {"001": "男"}}')
+        """
+        )
+        conn.execute(
+            "INSERT INTO stats_keywords VALUES ('0000000001', '人口'), ('0000000001', '男女')"
+        )
+    conn.close()
+
+    assert rule_translator.translate_query(query)[0].stats_data_id == "0000000001"
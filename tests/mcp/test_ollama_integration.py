@@ -0,0 +1,202 @@
+"""Ollama統合（OllamaStatsMCP）のテスト
+
+Ollamaには接続せず、生成APIのレスポンスはフェイクのセッションで返す。
+"""
+
+import json
+import sys
+import time
+from pathlib import Path
+
+import pytest
+import requests
+
+sys.path.append(str(Path(__file__).parent.parent.parent / "src"))
+from opendatajounalism.mcp.ollama_integration import (
+    OllamaResponse,
+    OllamaStatsMCP,
+    SemanticResponseCache,
+    _JsonObjectTracker,
+)
+
+SUGGESTION = OllamaResponse(
+    stats_table_id="0003448237",
+    table_name="国勢調査",
+    axis_mappings={"cdArea": "地域"},
+    confidence=0.9,
+    reasoning="人口のため",
+)
+
+
+class FakeStreamResponse:
+    """生成APIのストリーミングレスポンス（1行1JSON）"""
+
+    def __init__(self, chunks, status_code=200):
+        self.chunks = chunks
+        self.status_code = status_code
+        self.lines_read = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def iter_lines(self, chunk_size=None):
+        for i, chunk in enumerate(self.chunks):
+            self.lines_read += 1
+            done = i == len(self.chunks) - 1
+            yield json.dumps({"response": chunk, "done": done}).encode()
+
+
+@pytest.fixture
+def ollama_mcp(monkeypatch):
+    """e-statのメタデータを読み込まず、接続できないURLを向いたインスタンス"""
+
+    def no_real_data(self):
+        self.real_stats_data = None
+        self.metadata_loader = None
+
+    monkeypatch.setattr(OllamaStatsMCP, "_load_real_estat_data", no_real_data)
+    mcp = OllamaStatsMCP(base_url="http://127.0.0.1:9", verbose=False)
+    assert not mcp.available  # 初回の利用可能性の確認が終わるのを待つ
+    return mcp
+
+
+@pytest.mark.parametrize(
+    "chunks, closing_chunk",
+    [
+        (['{"a": 1}'], 0),
+        (['回答: {"a": {"b": 1}', "}", " 以上です"], 1),
+        # 文字列内の括弧は数えない
+        (['{"a": "}{', '}"', ', "b": 2}'], 2),
+        # エスケープされた引用符では文字列は終わらない（断片の境目をまたぐ場合も）
+        (['{"a": "\\"}"', "}"], 1),
+        (['{"a": "\\', '"}', '"}'], 2),
+    ],
+)
+def test_json_object_tracker(chunks, closing_chunk):
+    """最初のJSONオブジェクトが閉じた断片で True を返す"""
+    tracker = _JsonObjectTracker()
+    closed = [tracker.feed(chunk) for chunk in chunks]
+    assert closed.index(True) == closing_chunk
+
+
+def test_json_object_tracker_incomplete():
+    """閉じていないオブジェクトでは False のまま"""
+    tracker = _JsonObjectTracker()
+    assert not tracker.feed('{"a": "}}}"')
+    assert not tracker.feed(', "b": {}')
+
+
+def test_extract_first_json_object():
+    """最初のオブジェクトだけを読み、後ろの文章は無視する"""
+    response = '```json\n{"stats_table_id": "0003448237", "reasoning": "軸は{cdArea}"}\n```\n補足 }'
+    assert OllamaStatsMCP._extract_first_json_object(response) == {
+        "stats_table_id": "0003448237",
+        "reasoning": "軸は{cdArea}",
+    }
+    assert OllamaStatsMCP._extract_first_json_object("JSONなし") is None
+
+
+def test_generate_stops_streaming_when_json_closes(ollama_mcp, monkeypatch):
+    """JSONが閉じた時点で受信をやめ、同じプロンプトへの回答はキャッシュから返す"""
+    responses = []
+
+    def post(*args, **kwargs):
+        responses.append(FakeStreamResponse(['{"a": ', "1}", " 解説が続く", "..."]))
+        return responses[-1]
+
+    monkeypatch.setattr(ollama_mcp.session, "post", post)
+    ollama_mcp.available = True
+
+    assert ollama_mcp._generate("プロンプト") == '{"a": 1}'
+    assert responses[0].lines_read == 2
+    assert ollama_mcp._generate("プロンプト") == '{"a": 1}'
+    assert len(responses) == 1
+
+
+def test_consecutive_timeouts_start_cooldown(ollama_mcp, monkeypatch):
+    """タイムアウトが続いたら問い合わせを止め、確認に成功したら再開する"""
+    calls = []
+
+    def post(*args, **kwargs):
+        calls.append(args)
+        raise requests.ReadTimeout("read timed out")
+
+    monkeypatch.setattr(ollama_mcp.session, "post", post)
+    ollama_mcp.available = True
+
+    for _ in range(ollama_mcp.TIMEOUT_STREAK_LIMIT):
+        assert ollama_mcp._generate("プロンプト") is None
+    assert not ollama_mcp.available
+
+    # 待機中は問い合わせずにフォールバックする
+    assert ollama_mcp._call_ollama("人口") == ollama_mcp.FALLBACK_RESPONSES["population"]
+    assert len(calls) == ollama_mcp.TIMEOUT_STREAK_LIMIT
+
+    # 待機が明けた後の確認に成功したら問い合わせを再開する
+    monkeypatch.setattr(ollama_mcp, "_check_ollama_availability", lambda timeout: True)
+    ollama_mcp._cooldown_until = 0.0
+    ollama_mcp._availability_checked_at = 0.0
+    deadline = time.monotonic() + 5
+    while not ollama_mcp.available and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert ollama_mcp.available
+    assert ollama_mcp._timeout_streak == 0
+
+
+def test_successful_call_resets_timeout_streak(ollama_mcp, monkeypatch):
+    """連続していないタイムアウトでは問い合わせを止めない"""
+    outcomes = iter([True, True, False, True, True])
+
+    def post(*args, **kwargs):
+        if next(outcomes):
+            raise requests.ReadTimeout("read timed out")
+        return FakeStreamResponse(['{"a": 1}'])
+
+    monkeypatch.setattr(ollama_mcp.session, "post", post)
+    ollama_mcp.available = True
+
+    for i in range(5):
+        ollama_mcp._generate(f"プロンプト{i}")
+    assert ollama_mcp.available
+
+
+def test_semantic_cache_hits_similar_query():
+    """言い回しの近いクエリには同じ文脈の提案を返す"""
+    cache = SemanticResponseCache()
+    context = ("model", "東京都", None)
+    cache.add("東京都の人口の推移を知りたい", context, SUGGESTION)
+    cache.add("2020年の大阪府の世帯数", context, SUGGESTION)
+
+    assert cache.lookup("東京都の人口の推移を知りたいです", context) == SUGGESTION
+    # 全角・半角の違いは正規化して比べる
+    assert cache.lookup("２０２０年の大阪府の世帯数", context) == SUGGESTION
+
+
+def test_semantic_cache_misses():
+    """似ていないクエリや文脈の異なるクエリには返さない"""
+    cache = SemanticResponseCache()
+    assert cache.lookup("東京都の人口", None) is None
+
+    cache.add("東京都の人口の推移を知りたい", ("model", "東京都", None), SUGGESTION)
+    assert cache.lookup("大阪府の失業率", ("model", "東京都", None)) is None
+    assert cache.lookup("東京都の人口の推移を知りたい", ("model", "東京都", "2020")) is None
+
+    cache.clear()
+    assert cache.lookup("東京都の人口の推移を知りたい", ("model", "東京都", None)) is None
+
+
+def test_semantic_cache_returns_copies_and_evicts_oldest():
+    """返した提案を書き換えてもキャッシュは変わらず、上限を超えたら古いものから上書きする"""
+    cache = SemanticResponseCache(max_entries=2)
+    cache.add("東京都の人口", None, SUGGESTION)
+    cache.lookup("東京都の人口", None).axis_mappings["cdArea"] = "書き換え"
+    assert cache.lookup("東京都の人口", None) == SUGGESTION
+
+    cache.add("大阪府の失業率", None, SUGGESTION)
+    cache.add("北海道の世帯数", None, SUGGESTION)
+    assert cache.lookup("東京都の人口", None) is None
+    assert cache.lookup("大阪府の失業率", None) == SUGGESTION
+    assert cache.lookup("北海道の世帯数", None) == SUGGESTION
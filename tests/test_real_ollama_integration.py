@@ -87,14 +87,11 @@ def test_ollama_integration():
             {"query": "2020年の年齢別人口構成", "region": None, "time_period": "2020"},
         ]
 
-        for i, test_case in enumerate(test_queries, 1):
-            print(f"\n--- テスト{i}: {test_case['query']} ---")
+        # 提案はまとめて並行に問い合わせる
+        responses = ollama_mcp.suggest_many(test_queries)
 
-            response = ollama_mcp.suggest_stats_table_and_axes(
-                query=test_case["query"],
-                region=test_case["region"],
-                time_period=test_case["time_period"],
-            )
+        for i, (test_case, response) in enumerate(zip(test_queries, responses), 1):
+            print(f"\n--- テスト{i}: {test_case['query']} ---")
 
             print(f"🎯 提案統計表ID: {response.stats_table_id}")
             print(f"📊 統計表名: {response.table_name}")